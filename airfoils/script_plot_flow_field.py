@@ -2,7 +2,11 @@
 
 #### import the simple module from the paraview
 from paraview.simple import *
-import argparse, os
+import argparse, json, os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dafoam_tracing import span
+import foam_reader
 
 #### disable automatic camera reset on 'Show'
 paraview.simple._DisableFirstRenderCameraReset()
@@ -23,14 +27,52 @@ parser.add_argument(
 parser.add_argument("-zoom_in_scale", help="zoom in level", type=float, default=0.5)
 parser.add_argument("-flow_field", help="flow field variable to plot", type=str, default="p")
 parser.add_argument("-time_step", help="which time step to visualize", type=int, default=-1)
+parser.add_argument("-worker_rank", help="index of this render worker when time_step=-1", type=int, default=0)
+parser.add_argument("-n_workers", help="number of render workers splitting the time steps", type=int, default=1)
+parser.add_argument(
+    "-time_values",
+    help="only render these time values when time_step=-1 (the others are cached)",
+    type=float,
+    nargs="*",
+)
+parser.add_argument(
+    "-render_plan",
+    help="a JSON file with a list of views (flow_field, x_location, y_location, zoom_in_scale, time_step) "
+    "to render in one pass",
+    type=str,
+    default="",
+)
 args = parser.parse_args()
 
-# create a new 'OpenFOAMReader'
-paraviewfoam = OpenFOAMReader(registrationName="paraview.foam", FileName="./paraview.foam")
+# The views to render. Without a render plan, render the single view set by the command line arguments.
+# Missing keys in the plan entries take the command line values
+if args.render_plan:
+    with open(args.render_plan) as f:
+        render_plan = json.load(f)
+else:
+    render_plan = [{}]
+default_view = {
+    "flow_field": args.flow_field,
+    "x_location": args.x_location,
+    "y_location": args.y_location,
+    "zoom_in_scale": args.zoom_in_scale,
+    "time_step": args.time_step,
+}
+render_plan = [{**default_view, **view} for view in render_plan]
 
-# if it is a parallel run, choose Decomposed Case
-if os.path.exists("processor0"):
-    paraviewfoam.CaseType = "Decomposed Case"
+# create a new 'OpenFOAMReader'
+with span("OpenFOAMReader"):
+    paraviewfoam = OpenFOAMReader(registrationName="paraview.foam", FileName="./paraview.foam")
+
+# if it is a parallel run, choose Decomposed Case, unless reconstructPar has already written
+# the time steps and fields of all views to the case directory
+processors = foam_reader.processor_dirs(".")
+if processors:
+    latest_time = foam_reader.time_dir_names(processors[0])[-1]
+    time_names = [latest_time if view["time_step"] == -1 else str(view["time_step"] * 0.0001) for view in render_plan]
+    fields = [view["flow_field"] for view in render_plan]
+    if not foam_reader.is_reconstructed(".", time_names, fields):
+        paraviewfoam.CaseType = "Decomposed Case"
 
 # get animation scene
 animationScene1 = GetAnimationScene()
@@ -56,58 +98,84 @@ paraviewfoamDisplay.Representation = "Surface"
 # Properties modified on renderView1
 renderView1.CameraParallelProjection = 1
 
-# current camera placement for renderView1
-renderView1.CameraPosition = [args.x_location, args.y_location, 10.0]
-renderView1.CameraFocalPoint = [args.x_location, args.y_location, 0.0]
-renderView1.CameraParallelScale = args.zoom_in_scale
-
 # white background
 renderView1.Background = [1.0, 1.0, 1.0]
 
-# set scalar coloring
-ColorBy(paraviewfoamDisplay, ("POINTS", args.flow_field))
 
-# show color bar/color legend
-paraviewfoamDisplay.SetScalarBarVisibility(renderView1, True)
+def color_by(flow_field):
+    """Color the surface by flow_field and show its color bar. All views of a field share its color map"""
 
-# get color transfer function/color map for 'p'
-pLUT = GetColorTransferFunction(args.flow_field)
+    # hide the color bar of the previous field
+    paraviewfoamDisplay.SetScalarBarVisibility(renderView1, False)
 
-# get color legend/bar for pLUT in view renderView1
-pLUTColorBar = GetScalarBar(pLUT, renderView1)
+    # set scalar coloring
+    ColorBy(paraviewfoamDisplay, ("POINTS", flow_field))
 
-# change scalar bar placement
-pLUTColorBar.Orientation = "Horizontal"
-pLUTColorBar.Position = [0.0, 0.5]
-pLUTColorBar.ScalarBarLength = 0.8
+    # show color bar/color legend
+    paraviewfoamDisplay.SetScalarBarVisibility(renderView1, True)
 
-pLUTColorBar.TitleFontSize = 8
-pLUTColorBar.LabelFontSize = 8
-pLUTColorBar.LabelFormat = "%g"
-pLUTColorBar.RangeLabelFormat = "%.3e"
-pLUTColorBar.ScalarBarThickness = 8
-pLUTColorBar.TitleColor = [0, 0, 0]
-pLUTColorBar.LabelColor = [0, 0, 0]
+    # get color transfer function/color map for 'p'
+    pLUT = GetColorTransferFunction(flow_field)
 
-text1 = Text(registrationName=f"Flow Field: {args.flow_field}")
+    # get color legend/bar for pLUT in view renderView1
+    pLUTColorBar = GetScalarBar(pLUT, renderView1)
 
-# go to the specific time step
-if args.time_step == -1:
-    # Get all available time steps
-    animationScene1 = GetAnimationScene()
-    time_steps = animationScene1.TimeKeeper.TimestepValues
+    # change scalar bar placement
+    pLUTColorBar.Orientation = "Horizontal"
+    pLUTColorBar.Position = [0.0, 0.5]
+    pLUTColorBar.ScalarBarLength = 0.8
+
+    pLUTColorBar.TitleFontSize = 8
+    pLUTColorBar.LabelFontSize = 8
+    pLUTColorBar.LabelFormat = "%g"
+    pLUTColorBar.RangeLabelFormat = "%.3e"
+    pLUTColorBar.ScalarBarThickness = 8
+    pLUTColorBar.TitleColor = [0, 0, 0]
+    pLUTColorBar.LabelColor = [0, 0, 0]
+
+
+text1 = Text(registrationName="Flow Field")
+
+# Get all available time steps
+animationScene1 = GetAnimationScene()
+time_steps = animationScene1.TimeKeeper.TimestepValues
+if args.time_values is not None:
+    time_steps = [t for t in time_steps if any(abs(t - v) < 1e-12 for v in args.time_values)]
 
-    # Loop through all time steps from last to first
-    for idx, time_value in enumerate(reversed(time_steps)):
-        animationScene1.AnimationTime = time_value
+# Loop through all time steps from last to first. Each render worker takes
+# every n_workers-th time step starting from worker_rank
+time_steps = list(reversed(time_steps))[args.worker_rank :: args.n_workers]
+
+# group the views by time value, so that each time step is loaded only once for all views
+views_at_time = {}
+for index, view in enumerate(render_plan):
+    for time_value in time_steps if view["time_step"] == -1 else [view["time_step"] * 0.0001]:
+        views_at_time.setdefault(time_value, []).append((index, view))
+
+for time_value, views in sorted(views_at_time.items(), reverse=True):
+    animationScene1.AnimationTime = time_value
+    with span("UpdatePipeline", time=time_value):
         UpdatePipeline(time_value)
 
-        if time_value < 1.0:
-            iterI = "%04d" % int(time_value * 10000)
-        else:
-            iterI = "Final"
+    if time_value < 1.0:
+        iterI = "%04d" % round(time_value * 10000)
+    else:
+        iterI = "Final"
+
+    # rescale the color map of each field once per time step, so that all its views share it
+    rescaled_fields = set()
+    for index, view in views:
+        color_by(view["flow_field"])
+        if view["flow_field"] not in rescaled_fields:
+            paraviewfoamDisplay.RescaleTransferFunctionToDataRange(False, True)
+            rescaled_fields.add(view["flow_field"])
 
-        text1.Text = f"Flow Field: {args.flow_field}. Iteration: {iterI}"
+        # current camera placement for renderView1
+        renderView1.CameraPosition = [view["x_location"], view["y_location"], 10.0]
+        renderView1.CameraFocalPoint = [view["x_location"], view["y_location"], 0.0]
+        renderView1.CameraParallelScale = view["zoom_in_scale"]
+
+        text1.Text = f"Flow Field: {view['flow_field']}. Iteration: {iterI}"
         text1Display = Show(text1, renderView1, "TextSourceRepresentation")
         renderView1.Update()
         text1Display.FontSize = 15
@@ -117,33 +185,9 @@ if args.time_step == -1:
         text1Display.Color = [0.0, 0.0, 0.0]
 
         # save screenshot
-        SaveScreenshot(
-            f"./plots/airfoil_flow_field_{iterI}.png",
-            renderView1,
-            ImageResolution=[1200, 1000],
-        )
-
-else:
-    time_value = args.time_step * 0.0001
-    if time_value < 1.0:
-        iterI = "%04d" % int(time_value * 10000)
-    else:
-        iterI = "Final"
-    animationScene1.AnimationTime = time_value
-    UpdatePipeline()
-
-    text1.Text = f"Flow Field: {args.flow_field}. Iteration: {iterI}"
-    text1Display = Show(text1, renderView1, "TextSourceRepresentation")
-    renderView1.Update()
-    text1Display.FontSize = 15
-    text1Display.WindowLocation = "Upper Center"
-    text1Display.Bold = 1
-    text1Display.FontFamily = "Arial"
-    text1Display.Color = [0.0, 0.0, 0.0]
-
-    # save screenshot
-    SaveScreenshot(
-        f"./plots/airfoil_flow_field_{iterI}.png",
-        renderView1,
-        ImageResolution=[1200, 1000],
-    )
+        if args.render_plan:
+            file_name = f"./plots/airfoil_flow_plan_{iterI}_{index:02d}_{view['flow_field']}.png"
+        else:
+            file_name = f"./plots/airfoil_flow_field_{iterI}.png"
+        with span("SaveScreenshot"):
+            SaveScreenshot(file_name, renderView1, ImageResolution=[1200, 1000])
@@ -1,8 +1,8 @@
-# trace generated using paraview version 5.9.1
+import argparse, hashlib, os, sys
 
-#### import the simple module from the paraview
-from paraview.simple import *
-import argparse, os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dafoam_tracing import span
+import foam_reader
 import numpy as np
 import matplotlib
 
@@ -12,165 +12,135 @@ import matplotlib.pyplot as plt
 parser = argparse.ArgumentParser()
 parser.add_argument("-mach_number", help="mach number", type=float, default=0.1)
 parser.add_argument("-time_step", help="which time step to visualize", type=int, default=-1)
+parser.add_argument("-worker_rank", help="index of this render worker when time_step=-1", type=int, default=0)
+parser.add_argument("-n_workers", help="number of render workers splitting the time steps", type=int, default=1)
+parser.add_argument(
+    "-time_values",
+    help="only render these time values when time_step=-1 (the others are cached)",
+    type=float,
+    nargs="*",
+)
 args = parser.parse_args()
 
 C0 = 347.2
 U0 = args.mach_number * C0
 rho0 = 1.1768
+p0 = 101325.0
 coeff = 0.5 * rho0 * U0 * U0
 
-#### disable automatic camera reset on 'Show'
-paraview.simple._DisableFirstRenderCameraReset()
 
-# create a new 'OpenFOAMReader'
-paraviewfoam = OpenFOAMReader(registrationName="paraview.foam", FileName="./paraview.foam")
-
-# if it is a parallel run, choose Decomposed Case
-if os.path.exists("processor0"):
-    paraviewfoam.CaseType = "Decomposed Case"
-
-# get animation scene
-animationScene1 = GetAnimationScene()
-
-# update animation scene based on data timesteps
-animationScene1.UpdateAnimationUsingDataTimeSteps()
-
-# get active view
-renderView1 = GetActiveViewOrCreate("RenderView")
-
-# show data in view
-paraviewfoamDisplay = Show(paraviewfoam, renderView1, "UnstructuredGridRepresentation")
-
-# trace defaults for the display properties.
-paraviewfoamDisplay.Representation = "Surface"
-
-# Properties modified on renderView1
-renderView1.CameraParallelProjection = 1
-
-# Properties modified on paraviewfoam
-# In ParaView 5.13, the mesh region is 'patch/wing' not 'wing'
-paraviewfoam.MeshRegions = ["patch/wing"]
-
-# Enable the pressure array for ParaView 5.13
-paraviewfoam.CellArrays = ["p"]
-
-# create a new 'Slice'
-slice1 = Slice(registrationName="Slice1", Input=paraviewfoam)
-
-# Properties modified on slice1.SliceType
-slice1.SliceType.Normal = [0.0, 0.0, 1.0]
-
-# create a new 'Plot On Sorted Lines'
-plotOnSortedLines1 = PlotOnSortedLines(registrationName="PlotOnSortedLines1", Input=slice1)
-
-# go to the specific time step
-if args.time_step == -1:
-    # Get all available time steps
-    animationScene1 = GetAnimationScene()
-    time_steps = animationScene1.TimeKeeper.TimestepValues
-
-    # Loop through all time steps from last to first
-    for idx, time_value in enumerate(reversed(time_steps)):
-        animationScene1.AnimationTime = time_value
-        UpdatePipeline(time_value)
-
-        if time_value < 1.0:
-            iterI = "%04d" % int(time_value * 10000)
-        else:
-            iterI = "Final"
-
-        # Fetch the data to the client
-        multi_block_data = servermanager.Fetch(plotOnSortedLines1)
-
-        # Navigate through the nested structure (ParaView 5.13)
-        # For 2D airfoil: MultiBlock -> Block(0) -> Block(0) -> Block(0) to get to actual polydata
-        block0 = multi_block_data.GetBlock(0)
-        block1 = block0.GetBlock(0)
-        data = block1.GetBlock(0)
-
-        # Now you can get the point data
-        point_data = data.GetPointData()
-
-        # Get number of points
-        n_points = data.GetNumberOfPoints()
-
-        # Get coordinates (x, y, z)
-        points = np.array([data.GetPoint(i) for i in range(n_points)])
-        x = points[:, 0]
-        y = points[:, 1]
-        z = points[:, 2]
-
-        # Get pressure (p)
-        p_array = point_data.GetArray("p")
-        p = np.array([p_array.GetValue(i) for i in range(p_array.GetNumberOfTuples())])
-        cp = (p - 101325.0) / coeff
-
-        # Create figure with two subplots, share x-axis
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8), gridspec_kw={"height_ratios": [2, 1], "hspace": 0.05})
-
-        # Top plot: Cp vs x/c (complete distribution)
-        ax1.set_title(
-            f"Pressure profile on the airfoil. Iteration = {iterI}. Mach = {args.mach_number}",
-            fontsize=18,
-            fontweight="bold",
-        )
-        ax1.plot(x, cp, "-k", linewidth=2)
-        ax1.set_ylim([-2, 2])
-        ax1.invert_yaxis()  # Invert y-axis for Cp plot (standard in aerodynamics)
-        ax1.set_ylabel("$C_p$", fontsize=16, fontweight="bold")
-        ax1.tick_params(axis="x", labelsize=15)
-        ax1.tick_params(axis="y", labelsize=15)
-        # Completely remove x-axis for top plot
-        ax1.spines["bottom"].set_visible(False)
-        ax1.set_xticks([])
-        # Remove top and right spines
-        ax1.spines["top"].set_visible(False)
-        ax1.spines["right"].set_visible(False)
-
-        # Bottom plot: Airfoil profile
-        ax2.plot(x, y, "-k", linewidth=2)
-        ax2.set_xlabel("x/c", fontsize=16, fontweight="bold")
-        ax2.set_ylabel("y/c", fontsize=16, fontweight="bold")
-        ax2.tick_params(axis="x", labelsize=15)
-        ax2.tick_params(axis="y", labelsize=15)
-        ax2.set_aspect("equal", adjustable="datalim")
-        ax2.set_xlim([-0.05, 1.05])
-        # Remove top and right spines
-        ax2.spines["top"].set_visible(False)
-        ax2.spines["right"].set_visible(False)
-
-        # Use frame index in filename to ensure unique names
-        plt.savefig(f"plots/airfoil_pressure_profile_{iterI}.png", dpi=200, bbox_inches="tight")
-        plt.close()
-
-else:
-    time_value = args.time_step * 0.0001
+def mesh_fingerprint(topology):
+    """Hash the path, size, and modification time of the constant/polyMesh files of the topology directories"""
+    sha = hashlib.sha1()
+    for entry in topology:
+        mesh_path = os.path.join(entry["case_dir"], "constant", "polyMesh")
+        for name in sorted(os.listdir(mesh_path)):
+            stat = os.stat(os.path.join(mesh_path, name))
+            sha.update(f"{mesh_path}/{name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return sha.hexdigest()[:16]
+
+
+def order_surface_faces(topology, points):
+    """
+    Order the wing faces of the 2D (one cell thick) mesh along the airfoil contour, starting from
+    the trailing edge. Each face is reduced to its edge on the back (lower z) plane, the edges are
+    chained into a closed contour, and the faces are returned in contour order.
+
+    Inputs:
+        topology: the wing patch topology from foam_reader.read_patch_topology
+        points: the mesh points of each entry of the topology
+    Outputs:
+        The face indices (into the faces concatenated by foam_reader.read_patch_values) in contour order
+    """
+
+    # the back edge (the two points with the lowest z) of each face, in global coordinates
+    edges = []
+    for entry, entry_points in zip(topology, points):
+        for name in entry["patches"]:
+            offsets, labels = entry["faces"][name]
+            for start, end in zip(offsets[:-1], offsets[1:]):
+                face_points = entry_points[labels[start:end]]
+                edges.append(face_points[np.argsort(face_points[:, 2], kind="stable")[:2]])
+    edges = np.array(edges)
+
+    # the processors write their own copies of the shared points, so merge the points by coordinates
+    scale = np.max(np.abs(edges[:, :, :2]))
+    keys = np.round(edges[:, :, :2].reshape(-1, 2) / scale, 9)
+    _, point_ids = np.unique(keys, axis=0, return_inverse=True)
+    segments = point_ids.reshape(-1, 2)
+
+    neighbors = {}
+    for face, (a, b) in enumerate(segments):
+        neighbors.setdefault(a, []).append((b, face))
+        neighbors.setdefault(b, []).append((a, face))
+
+    # walk along the contour from the face with the largest x (the trailing edge)
+    centres_x = edges[:, :, 0].mean(axis=1)
+    face = int(np.argmax(centres_x))
+    current = segments[face, 1]
+    order = [face]
+    while len(order) < len(segments):
+        next_faces = [(n, f) for n, f in neighbors[current] if f != face]
+        if not next_faces or next_faces[0][1] == order[0]:
+            break
+        current, face = next_faces[0]
+        order.append(face)
+    return np.array(order)
+
+
+def load_surface(topology):
+    """
+    Return the ordered face indices and the x, y coordinates of the ordered face centres. They are
+    computed once per mesh and cached in plots/render_cache, so the time steps only gather p values
+    """
+
+    cache_file = f"plots/render_cache/airfoil_surface_{mesh_fingerprint(topology)}.npz"
+    if os.path.exists(cache_file):
+        with np.load(cache_file) as cache:
+            return cache["order"], cache["x"], cache["y"]
+
+    with span("order_surface_faces"):
+        points = foam_reader.read_patch_points(topology, "constant")
+        order = order_surface_faces(topology, points)
+        centres, _ = foam_reader.read_patch_geometry(topology, "constant")
+    x = centres[order, 0]
+    y = centres[order, 1]
+
+    # write to a temporary file first so concurrent render workers never read a partial cache
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez(f, order=order, x=x, y=y)
+    os.replace(tmp_file, cache_file)
+    return order, x, y
+
+
+def plot_pressure_profile(time_name):
+    """Gather the wing p values of one time step in contour order and plot the Cp profile"""
+
+    time_value = float(time_name)
     if time_value < 1.0:
-        iterI = "%04d" % int(time_value * 10000)
+        iterI = "%04d" % round(time_value * 10000)
     else:
         iterI = "Final"
-    animationScene1.AnimationTime = time_value
-    UpdatePipeline()
-
-    # Fetch and plot for specific time step (same code as in loop)
-    multi_block_data = servermanager.Fetch(plotOnSortedLines1)
-
-    # Navigate through the nested structure (ParaView 5.13)
-    # For 2D airfoil: MultiBlock -> Block(0) -> Block(0) -> Block(0) to get to actual polydata
-    block0 = multi_block_data.GetBlock(0)
-    block1 = block0.GetBlock(0)
-    data = block1.GetBlock(0)
-
-    point_data = data.GetPointData()
-    n_points = data.GetNumberOfPoints()
-    points = np.array([data.GetPoint(i) for i in range(n_points)])
-    x = points[:, 0]
-    y = points[:, 1]
-    p_array = point_data.GetArray("p")
-    p = np.array([p_array.GetValue(i) for i in range(p_array.GetNumberOfTuples())])
-    cp = (p - 101325.0) / coeff
 
+    with span("read_patch_values", time=time_value):
+        p = foam_reader.read_patch_values(topology, time_name, "p")[order]
+    cp = (p - p0) / coeff
+
+    # the optimization moves the mesh and writes the new points in the time directory
+    x, y = surface_x, surface_y
+    if any(os.path.isdir(os.path.join(entry["case_dir"], time_name, "polyMesh")) for entry in topology):
+        centres, _ = foam_reader.read_patch_geometry(topology, time_name)
+        x, y = centres[order, 0], centres[order, 1]
+
+    # close the contour
+    x, y, cp = np.append(x, x[0]), np.append(y, y[0]), np.append(cp, cp[0])
+
+    # Create figure with two subplots, share x-axis
     fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8), gridspec_kw={"height_ratios": [2, 1], "hspace": 0.05})
+
+    # Top plot: Cp vs x/c (complete distribution)
     ax1.set_title(
         f"Pressure profile on the airfoil. Iteration = {iterI}. Mach = {args.mach_number}",
         fontsize=18,
@@ -178,14 +148,18 @@ else:
     )
     ax1.plot(x, cp, "-k", linewidth=2)
     ax1.set_ylim([-2, 2])
-    ax1.invert_yaxis()
+    ax1.invert_yaxis()  # Invert y-axis for Cp plot (standard in aerodynamics)
     ax1.set_ylabel("$C_p$", fontsize=16, fontweight="bold")
     ax1.tick_params(axis="x", labelsize=15)
     ax1.tick_params(axis="y", labelsize=15)
+    # Completely remove x-axis for top plot
     ax1.spines["bottom"].set_visible(False)
     ax1.set_xticks([])
+    # Remove top and right spines
     ax1.spines["top"].set_visible(False)
     ax1.spines["right"].set_visible(False)
+
+    # Bottom plot: Airfoil profile
     ax2.plot(x, y, "-k", linewidth=2)
     ax2.set_xlabel("x/c", fontsize=16, fontweight="bold")
     ax2.set_ylabel("y/c", fontsize=16, fontweight="bold")
@@ -193,7 +167,37 @@ else:
     ax2.tick_params(axis="y", labelsize=15)
     ax2.set_aspect("equal", adjustable="datalim")
     ax2.set_xlim([-0.05, 1.05])
+    # Remove top and right spines
     ax2.spines["top"].set_visible(False)
     ax2.spines["right"].set_visible(False)
-    plt.savefig(f"plots/airfoil_pressure_profile_{iterI}.png", dpi=200, bbox_inches="tight")
+
+    # Use frame index in filename to ensure unique names
+    with span("matplotlib"):
+        plt.savefig(f"plots/airfoil_pressure_profile_{iterI}.png", dpi=200, bbox_inches="tight")
     plt.close()
+
+
+time_names = [t for t in foam_reader.list_times(".") if float(t) > 0.0]
+
+# go to the specific time step
+if args.time_step == -1:
+    if args.time_values is not None:
+        time_names = [t for t in time_names if any(abs(float(t) - v) < 1e-12 for v in args.time_values)]
+
+    # Loop through all time steps from last to first. Each render worker takes
+    # every n_workers-th time step starting from worker_rank
+    time_names = list(reversed(time_names))[args.worker_rank :: args.n_workers]
+
+else:
+    # use the closest written time step
+    time_value = args.time_step * 0.0001
+    time_names = [min(time_names, key=lambda t: abs(float(t) - time_value))]
+
+# the wing patch topology and its contour order do not change between time steps. The reconstructed
+# case is read instead of the processor* directories when reconstructPar has written these time steps
+with span("read_patch_topology"):
+    topology = foam_reader.read_patch_topology(".", ["wing"], time_names, ["p"])
+order, surface_x, surface_y = load_surface(topology)
+
+for time_name in time_names:
+    plot_pressure_profile(time_name)
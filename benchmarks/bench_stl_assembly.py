@@ -0,0 +1,106 @@
+"""
+Benchmark of the wing STL assembly in wing_generate_geometry.
+
+Compares the former shell chain (mv, sed -i, head, cat, and a for loop over the text files) with
+assemble_wing_stl (stl_io, one read and one write per file) on synthetic dense tessellations of the five
+IGES surfaces (wing0.stl - wing4.stl). It reports the assembly time, the size of constant/triSurface, and the
+time to read wing.stl back (as script_generate_ffd.py and the viewers do). The surfaces are ASCII files, or
+binary files as script_iges2stl.py writes them with -binary_input (the shell chain only works on ASCII files).
+
+Usage:
+    python benchmarks/bench_stl_assembly.py -n_triangles 20000 200000 1000000 -repeats 3
+    python benchmarks/bench_stl_assembly.py -n_triangles 20000 200000 -binary_input
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dafoam_mcp_server
+import stl_io
+
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "-n_triangles", help="numbers of triangles per surface to test", nargs="+", type=int, default=[20000, 200000]
+)
+parser.add_argument("-repeats", help="number of repeats per test (the best time is reported)", type=int, default=3)
+parser.add_argument("-binary_input", help="write the IGES surfaces as binary STL files", action="store_true")
+args = parser.parse_args()
+
+# the commands of wing_generate_geometry before stl_io, after script_iges2stl.py
+shell_chain = (
+    "mv wing0.stl wing_upper.stl && "
+    "sed -i '1s/^solid.*/solid wing_upper/' wing_upper.stl && "
+    "mv wing1.stl wing_lower.stl && "
+    "sed -i '1s/^solid.*/solid wing_lower/' wing_lower.stl && "
+    "mv wing2.stl wing_te.stl && "
+    "sed -i '1s/^solid.*/solid wing_te/' wing_te.stl && "
+    "head -n 1 wing3.stl > wing_tip.stl && "
+    "sed '1d;$d' wing3.stl >> wing_tip.stl && "
+    "sed '1d;$d' wing4.stl >> wing_tip.stl && "
+    "echo 'endsolid' >> wing_tip.stl && "
+    "rm -rf wing3.stl wing4.stl && "
+    "sed -i '1s/^solid.*/solid wing_tip/' wing_tip.stl && "
+    "cat wing_upper.stl wing_lower.stl wing_te.stl wing_tip.stl > wing_all_surfaces.stl && "
+    "head -n 1 wing_upper.stl > wing.stl && "
+    "for f in wing_upper.stl wing_lower.stl wing_te.stl wing_tip.stl; do "
+    "sed '1d;$d' $f >> wing.stl; done && "
+    "echo 'endsolid' >> wing.stl && "
+    "mv *.stl constant/triSurface/"
+)
+
+
+def make_surface(n_triangles, seed):
+    """Triangulate a wavy patch with about n_triangles triangles"""
+    n = max(int(np.sqrt(n_triangles / 2)), 1)
+    u, v = np.meshgrid(np.linspace(0.0, 1.0, n + 1), np.linspace(0.0, 3.0, n + 1), indexing="ij")
+    w = 0.06 * np.sin(np.pi * u + seed) * (1.0 - 0.1 * v)
+    points = np.stack([u, w, v], axis=-1)
+    a, b, c, d = points[:-1, :-1], points[1:, :-1], points[1:, 1:], points[:-1, 1:]
+    return np.concatenate([np.stack([a, b, c], axis=-2), np.stack([a, c, d], axis=-2)]).reshape(-1, 3, 3)
+
+
+def write_surfaces(case_path, surfaces):
+    """Write the IGES surfaces as the ParaView STL files wing0.stl - wing4.stl"""
+    os.makedirs(os.path.join(case_path, "constant", "triSurface"), exist_ok=True)
+    for i, triangles in enumerate(surfaces):
+        stl_io.write_stl(os.path.join(case_path, f"wing{i}.stl"), [("ascii", triangles)], args.binary_input)
+
+
+def tri_surface_size(case_path):
+    """Return the size in bytes of constant/triSurface"""
+    tri_surface = os.path.join(case_path, "constant", "triSurface")
+    return sum(os.path.getsize(os.path.join(tri_surface, name)) for name in os.listdir(tri_surface))
+
+
+def run(case_path, surfaces, method):
+    """Return the best assembly time, the triSurface size, and the wing.stl read time of a method"""
+    times = []
+    for _ in range(args.repeats):
+        write_surfaces(case_path, surfaces)
+        start_time = time.perf_counter()
+        if method == "shell":
+            subprocess.run(shell_chain, shell=True, cwd=case_path, check=True)
+        else:
+            dafoam_mcp_server.wing_stl_format = method
+            dafoam_mcp_server.assemble_wing_stl(case_path)
+        times.append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    stl_io.read_stl(os.path.join(case_path, "constant", "triSurface", "wing.stl"))
+    return min(times), tri_surface_size(case_path), time.perf_counter() - start_time
+
+
+print(f"{'triangles':>10} {'method':>12} {'assembly (s)':>13} {'triSurface (MB)':>16} {'read wing.stl (s)':>18}")
+with tempfile.TemporaryDirectory() as tmp_dir:
+    for n_triangles in args.n_triangles:
+        surfaces = [make_surface(n_triangles, seed) for seed in range(5)]
+        for method in ["ascii", "binary"] if args.binary_input else ["shell", "ascii", "binary"]:
+            t_assembly, size, t_read = run(os.path.join(tmp_dir, method), surfaces, method)
+            label = "shell" if method == "shell" else f"stl_io {method}"
+            print(f"{n_triangles:>10} {label:>12} {t_assembly:>13.3f} {size / 1024**2:>16.2f} {t_read:>18.3f}")
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark for the VTK-to-numpy extraction in script_plot_pressure_profile.py.
+
+Compares the old per-element Python loops (data.GetPoint(i) and p_array.GetValue(i)) with the
+zero-copy vtk_to_numpy views on a synthetic polydata that looks like an airfoil slice.
+
+Usage (with vtk installed, or with pvpython):
+    python bench_vtk_to_numpy.py -n_points 1000 10000 100000 -repeats 5
+"""
+
+import argparse
+import time
+import numpy as np
+from vtkmodules.vtkCommonCore import vtkPoints, vtkDoubleArray
+from vtkmodules.vtkCommonDataModel import vtkPolyData
+from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-n_points", help="numbers of points to test", nargs="+", type=int, default=[1000, 10000, 100000])
+parser.add_argument("-repeats", help="number of repeats per test (the best time is reported)", type=int, default=5)
+args = parser.parse_args()
+
+C0 = 347.2
+U0 = 0.1 * C0
+rho0 = 1.1768
+coeff = 0.5 * rho0 * U0 * U0
+
+
+def make_polydata(n_points):
+    """Create a polydata with points on a NACA0012-like contour and a pressure point array"""
+    theta = np.linspace(0.0, 2.0 * np.pi, n_points)
+    x = 0.5 * (1.0 + np.cos(theta))
+    y = 0.6 * (0.2969 * np.sqrt(x) - 0.126 * x - 0.3516 * x**2 + 0.2843 * x**3 - 0.1015 * x**4) * np.sign(np.sin(theta))
+    coords = np.column_stack([x, y, np.zeros(n_points)])
+
+    points = vtkPoints()
+    points.SetData(numpy_to_vtk(coords, deep=True))
+    polydata = vtkPolyData()
+    polydata.SetPoints(points)
+
+    p_array = numpy_to_vtk(101325.0 + 100.0 * np.cos(theta), deep=True, array_type=vtkDoubleArray().GetDataType())
+    p_array.SetName("p")
+    polydata.GetPointData().AddArray(p_array)
+    return polydata
+
+
+def extract_loop(data):
+    """The old extraction with per-element Python loops"""
+    point_data = data.GetPointData()
+    n_points = data.GetNumberOfPoints()
+    points = np.array([data.GetPoint(i) for i in range(n_points)])
+    p_array = point_data.GetArray("p")
+    p = np.array([p_array.GetValue(i) for i in range(p_array.GetNumberOfTuples())])
+    cp = (p - 101325.0) / coeff
+    return points[:, 0], points[:, 1], cp
+
+
+def extract_zero_copy(data):
+    """The new extraction with zero-copy numpy views"""
+    point_data = data.GetPointData()
+    points = vtk_to_numpy(data.GetPoints().GetData())
+    p = vtk_to_numpy(point_data.GetArray("p"))
+    cp = (p - 101325.0) / coeff
+    return points[:, 0], points[:, 1], cp
+
+
+def best_time(func, data):
+    """Return the best wall time of func(data) over args.repeats runs"""
+    times = []
+    for _ in range(args.repeats):
+        start_time = time.perf_counter()
+        func(data)
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+print(f"{'n_points':>10} {'loop (ms)':>12} {'zero-copy (ms)':>15} {'speedup':>9}")
+for n_points in args.n_points:
+    data = make_polydata(n_points)
+
+    # make sure both paths give the same answer
+    for old, new in zip(extract_loop(data), extract_zero_copy(data)):
+        assert np.allclose(old, new)
+
+    t_loop = best_time(extract_loop, data)
+    t_zero_copy = best_time(extract_zero_copy, data)
+    print(f"{n_points:>10} {t_loop * 1e3:>12.3f} {t_zero_copy * 1e3:>15.3f} {t_loop / t_zero_copy:>8.1f}x")
@@ -0,0 +1,125 @@
+"""
+Benchmark of the OpenFOAM field write formats (writeFormat ascii/binary x writeCompression on/off).
+
+For each option, the case is copied to a temporary directory, system/controlDict is updated, and the
+latest time step is rewritten with foamFormatConvert (or, with -run_solver, recomputed by running the
+DAFoam primal solver). It reports the write time, the disk footprint of the time directories, and the
+post-processing read time of p and U on the wing patch and of the whole p field with foam_reader.
+
+Usage (in the DAFoam docker container, after a cfd simulation):
+    cd airfoils && python ../benchmarks/bench_write_format.py -case=. -repeats=5
+    cd airfoils && python ../benchmarks/bench_write_format.py -case=. -run_solver -cpu_cores=2
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import foam_reader
+
+parser = argparse.ArgumentParser()
+parser.add_argument("-case", help="the case directory with a finished cfd simulation", type=str, default=".")
+parser.add_argument(
+    "-repeats", help="number of repeats for the read timings (the best time is reported)", type=int, default=5
+)
+parser.add_argument("-run_solver", help="time a full primal solution instead of foamFormatConvert", action="store_true")
+parser.add_argument("-cpu_cores", help="number of CPU cores for -run_solver", type=int, default=1)
+args = parser.parse_args()
+
+options = [("ascii", "on"), ("ascii", "off"), ("binary", "on"), ("binary", "off")]
+
+
+def set_write_format(case_path, write_format, write_compression):
+    """Set writeFormat and writeCompression in system/controlDict"""
+    control_dict = os.path.join(case_path, "system", "controlDict")
+    with open(control_dict) as f:
+        content = f.read()
+    content = re.sub(r"^writeFormat\s+\w+;", f"writeFormat     {write_format};", content, flags=re.M)
+    content = re.sub(r"^writeCompression\s+\w+;", f"writeCompression {write_compression};", content, flags=re.M)
+    with open(control_dict, "w") as f:
+        f.write(content)
+
+
+def disk_footprint(case_path, time_name):
+    """Return the size in bytes of the time directories (including processor*) named time_name"""
+    total = 0
+    for case_dir in foam_reader.case_dirs(case_path):
+        for root, _, files in os.walk(os.path.join(case_dir, time_name)):
+            total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def write_fields(case_path):
+    """Rewrite (or recompute) the latest time step and return the wall time"""
+    n_procs = len([d for d in foam_reader.case_dirs(case_path) if d != case_path])
+    if args.run_solver:
+        subprocess.run(
+            "rm -rf processor* .dafoam_run_finished && find . -maxdepth 1 -regex './[0-9.]+' ! -name 0 -exec rm -rf {} +",
+            shell=True,
+            cwd=case_path,
+            check=True,
+        )
+        command = f"mpirun -np {args.cpu_cores} python script_run_dafoam.py -task=run_model > log_bench.txt 2>&1"
+    elif n_procs > 0:
+        command = f"mpirun -np {n_procs} foamFormatConvert -parallel -latestTime > log_bench.txt 2>&1"
+    else:
+        command = "foamFormatConvert -latestTime > log_bench.txt 2>&1"
+
+    start_time = time.perf_counter()
+    subprocess.run(command, shell=True, cwd=case_path, check=True)
+    return time.perf_counter() - start_time
+
+
+def read_time(func):
+    """Return the best wall time of func() over args.repeats runs"""
+    times = []
+    for _ in range(args.repeats):
+        start_time = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+    return min(times)
+
+
+def read_internal_field(case_path, time_name):
+    """Read the whole internal p field of all processors"""
+    for case_dir in foam_reader.case_dirs(case_path):
+        foam_file = foam_reader.FoamFile(os.path.join(case_dir, time_name, "p"))
+        pos = foam_file.skip(foam_file.find_keyword("internalField"))
+        match = foam_reader.field_value_re.match(foam_file.buffer, pos)
+        if match.group(1) == b"nonuniform":
+            foam_file.read_list(match.end(), "scalar")[0].sum()
+
+
+print(
+    f"{'writeFormat':>12} {'compression':>12} {'write (s)':>10} {'disk (MB)':>10} "
+    f"{'read wing p,U (ms)':>19} {'read all p (ms)':>16}"
+)
+with tempfile.TemporaryDirectory() as tmp_dir:
+    for write_format, write_compression in options:
+        case_path = os.path.join(tmp_dir, f"{write_format}_{write_compression}")
+        shutil.copytree(
+            args.case,
+            case_path,
+            symlinks=True,
+            ignore=shutil.ignore_patterns("plots", "*.png", "*.html", ".dafoam_reconstructed"),
+        )
+        set_write_format(case_path, write_format, write_compression)
+
+        t_write = write_fields(case_path)
+        time_name = foam_reader.list_times(case_path)[-1]
+        disk_mb = disk_footprint(case_path, time_name) / 1024**2
+        t_wing = read_time(
+            lambda: foam_reader.read_patches(case_path, time_name, {"p": "scalar", "U": "vector"}, ["wing"])
+        )
+        t_all = read_time(lambda: read_internal_field(case_path, time_name))
+        print(
+            f"{write_format:>12} {write_compression:>12} {t_write:>10.2f} {disk_mb:>10.2f} "
+            f"{t_wing * 1e3:>19.2f} {t_all * 1e3:>16.2f}"
+        )
+        shutil.rmtree(case_path)
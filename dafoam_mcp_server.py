@@ -1,18 +1,40 @@
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Image as MCPImage
 from typing import List
 import base64
+import io
 from pathlib import Path
 import subprocess
 import asyncio
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 import threading
+import functools
 import logging
 import time
 import urllib.request
+import weakref
+import argparse
+import contextlib
+import contextvars
+import inspect
 import os
 import glob
+import hashlib
+import json
+import re
+import shlex
+import shutil
+import socket
 from PIL import Image
 import atexit
+from collections import OrderedDict
+import numpy as np
+import foam_reader
+import gltf_export
+import stl_io
+import profile_fetcher
+import profile_library
+import run_estimator
+from dafoam_tracing import TRACE_FILE_ENV, attach_subprocess_spans, format_summary, span, subprocess_env, traced
 
 # =============================================================================
 # USER CONFIGURATION
@@ -28,6 +50,114 @@ import atexit
 
 base_path = "/home/dafoamuser/mount"
 
+# Optional timing traces. Set trace_file to an absolute path (e.g., base_path + "/trace.jsonl")
+# to record nested timing spans for every tool call and its subprocess stages as JSON lines.
+# Set attach_trace_summary = True to also append a timing summary to the tool outputs.
+trace_file = ""
+attach_trace_summary = False
+
+# How often (in seconds) to sample the CPU, memory, and I/O usage of running mpirun jobs
+resource_sample_interval = 5.0
+
+# Set return_image_content = True to return the combined PNG of the plotting tools directly as MCP image
+# content, in addition to the HTML link and PNG path. Images larger than image_byte_budget bytes are
+# downscaled and recompressed to fit the budget.
+return_image_content = False
+image_byte_budget = 750000
+
+# Format of the flow fields written by the cfd simulations and optimizations: write_format = "ascii" or
+# "binary" and write_compression = "on" (gzip) or "off". ParaView and foam_reader read all of them. Use
+# benchmarks/bench_write_format.py to measure the write time, disk footprint, and read time of each option.
+write_format = "ascii"
+write_compression = "on"
+
+# After a parallel (cpu_cores > 1) cfd simulation or optimization finishes, run reconstructPar in the
+# background so the plotting tools read one case directory instead of every processor* directory.
+# reconstruct_times = "all" or "latest" (only the last time step). reconstruct_fields = [] reconstructs all
+# fields, or list the fields to reconstruct, e.g., ["p", "U"]. Until reconstructPar finishes, and for the
+# time steps and fields that are not reconstructed, the plotting tools read the processor* directories
+reconstruct_after_run = True
+reconstruct_times = "all"
+reconstruct_fields = []
+
+# Number of pvpython worker processes that render the time steps in parallel when the flow field and
+# pressure profile tools are called with time_step=-1
+n_render_workers = 4
+
+# Wing flow fields and pressure profiles of large meshes are rendered with MPI-parallel pvbatch directly on
+# the decomposed case: one rank per cells_per_render_rank mesh cells, up to the number of processor*
+# directories (the ranks of the solve). Smaller or serial cases use a single pvpython process. Set
+# cells_per_render_rank = 0 to always use pvpython
+cells_per_render_rank = 500000
+
+# The offline airfoil profile library (profile_library.py): the normalized coordinates of the profiles in one
+# memory-mapped .npy file with a name and alias index (.json). Profiles missing in the profiles folders are
+# written from it before they are downloaded from the UIUC database. The docker image builds it from the whole
+# UIUC database (coord_seligFmt.zip). Outside docker, build it with:
+# python profile_library.py -sources coord_seligFmt.zip -output /path/to/library
+profile_library_path = "/home/dafoamuser/dafoam/profiles/library"
+
+# Profiles that are neither in the profiles folders nor in the profile library are downloaded from
+# uiuc_base_url, several at once over keep-alive connections, with up to uiuc_retries retries (exponential
+# backoff). The downloads are cached in uiuc_cache_dir and revalidated with their ETag on later downloads
+uiuc_base_url = "https://m-selig.ae.illinois.edu/ads/coord/"
+uiuc_cache_dir = base_path + "/profiles/uiuc_cache"
+uiuc_retries = 3
+
+# Format of the single-surface wing STL files in wings/constant/triSurface (wing_upper.stl, wing_lower.stl,
+# wing_te.stl, wing_tip.stl, and wing.stl): "binary" (about half the size and much faster to read) or "ascii".
+# wing_all_surfaces.stl keeps one named solid per surface for cfMesh, so it is always ASCII
+wing_stl_format = "binary"
+
+# Tessellation tolerance of the wing IGES surfaces: the maximal distance between the surfaces and their STL
+# triangles relative to the mean chord, and the maximal angle (rad) between the normals of adjacent triangles.
+# As the tolerance scales with the chord, the number of triangles does not depend on the wing size
+stl_linear_deflection = 5e-5
+stl_angular_deflection = 0.2
+
+# Estimates of the mesh cells, wall time, and memory before a mesh generation or run (see estimate_run_cost).
+# Every finished mesh and run is appended to run_history_file, which calibrates the estimates: the wall time is
+# fitted on the past runs of the same module and run type, and the estimated cells are corrected by the ratio
+# of the actual to the estimated cells of the past meshes. Without past runs, the wall time is estimated with
+# default_core_seconds_per_cell (rough values of DAFoam runs; per iteration for an optimization, which is fitted
+# and estimated per iteration and scaled by max_opt_iters). Estimates above expensive_cells (per module),
+# expensive_wall_time (seconds), or 80% of the memory of the machine are flagged as expensive
+run_history_file = base_path + "/run_history.jsonl"
+default_core_seconds_per_cell = {"mesh": 1e-3, "cfd": 0.02, "optimization": 0.05}
+expensive_cells = {"airfoil": 200000, "wing": 5000000}
+expensive_wall_time = 4 * 3600.0
+
+# Interactive trame viewers of the wing geometry and mesh. Each viewer is a long-lived script_trame.py process
+# on a port of trame_ports (these ports need to be published by docker, see README.md). A viewer keeps showing
+# its dataset to all its browser sessions; a new dataset opens in a new viewer on a free port, or swaps the dataset
+# of the least recently used viewer once all ports are used (the tool result then says so). The URL is reported
+# after the viewer passes a health check, waiting at most trame_startup_timeout seconds. The viewer control files
+# and logs go to trame_control_dir
+trame_ports = list(range(8002, 8006))
+trame_startup_timeout = 60.0
+trame_control_dir = "/tmp/dafoam_trame"
+
+# The trame viewers send large meshes to the browser as decimated levels of detail (computed once per mesh file
+# and cached in plots/render_cache) and refine them on demand. Meshes with more than trame_remote_render_cells
+# cells are rendered on the server and streamed to the browser as images instead
+trame_remote_render_cells = 2000000
+
+# The static web viewers (wing_export_web_viewer) load quantized glTF files of the wing geometry, mesh, or surface
+# solution directly in the browser from the HTTP file server, so they need no viewer process. The glTF files are
+# exported once per source file version to wings/plots/web. The pages load the <model-viewer> web component from
+# web_viewer_script; change it to a local copy (e.g., in wings/plots/web) for offline use
+web_viewer_script = "https://ajax.googleapis.com/ajax/libs/model-viewer/3.5.0/model-viewer.min.js"
+
+# MCP transport. "stdio" serves one MCP client per server process. "streamable-http" (or "sse") lets one
+# long-lived server serve many MCP clients concurrently at http://localhost:{mcp_http_port}/mcp, sharing
+# the background jobs, caches, and HTTP/trame servers. It can also be set by: python dafoam_mcp_server.py
+# -transport=streamable-http -port=8000. The tools have no authentication and run shell commands, so the server
+# only listens on mcp_http_host = "127.0.0.1" by default. Set it (or -host) to "0.0.0.0" to accept clients
+# from outside the docker container, and only do so on a trusted network
+mcp_transport = "stdio"
+mcp_http_port = 8000
+mcp_http_host = "127.0.0.1"
+
 # =============================================================================
 # USER CONFIGURATION - End
 # =============================================================================
@@ -36,6 +166,10 @@ base_path = "/home/dafoamuser/mount"
 # Suppress all logging to stdout/stderr before MCP starts
 logging.basicConfig(level=logging.CRITICAL)
 
+# Timing spans go to trace_file, never to stdout/stderr. Subprocesses inherit the setting
+if trace_file:
+    os.environ[TRACE_FILE_ENV] = trace_file
+
 # Initialize FastMCP server
 mcp = FastMCP("dafoam_mcp_server")
 
@@ -44,7 +178,192 @@ airfoil_path = base_path + "/airfoils/"
 wing_path = base_path + "/wings/"
 
 
+class MetricsRegistry:
+    """Thread-safe counters, gauges, and histograms rendered in the Prometheus text format"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.descriptions = {}
+        self.values = {}
+        self.histograms = {}
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        """Register a metric name with its type (counter, gauge, or histogram) and help text"""
+        self.descriptions[name] = (metric_type, help_text)
+
+    def inc(self, name: str, labels: dict = None, value: float = 1.0):
+        """Add value to a counter or gauge. Use a negative value to decrease a gauge"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + value
+
+    def observe(self, name: str, labels: dict = None, value: float = 0.0):
+        """Add one observation to a histogram"""
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            histogram = self.histograms[key]
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    histogram[0][i] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format"""
+
+        def format_labels(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+        lines = []
+        with self.lock:
+            for name, (metric_type, help_text) in self.descriptions.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                if metric_type == "histogram":
+                    for (key_name, labels), (counts, total, count) in sorted(self.histograms.items()):
+                        if key_name != name:
+                            continue
+                        for upper, bucket_count in zip(self.buckets, counts):
+                            bucket_labels = labels + (("le", f"{upper:g}"),)
+                            lines.append(f"{name}_bucket{format_labels(bucket_labels)} {bucket_count}")
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+                        lines.append(f"{name}_sum{format_labels(labels)} {total:.6f}")
+                        lines.append(f"{name}_count{format_labels(labels)} {count}")
+                else:
+                    for (key_name, labels), value in sorted(self.values.items()):
+                        if key_name == name:
+                            lines.append(f"{name}{format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+# Metrics are served at http://localhost:{FILE_HTTP_PORT}/metrics
+METRICS = MetricsRegistry(buckets=[0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600])
+METRICS.describe("dafoam_tool_calls_total", "counter", "Number of MCP tool calls by tool and status")
+METRICS.describe("dafoam_tool_latency_seconds", "histogram", "MCP tool call latency in seconds")
+METRICS.describe("dafoam_tool_calls_in_flight", "gauge", "Number of MCP tool calls currently executing")
+METRICS.describe("dafoam_stage_seconds", "histogram", "Subprocess wall time in seconds by stage")
+METRICS.describe("dafoam_stage_queue_depth", "gauge", "Number of subprocess stages waiting for a worker thread")
+METRICS.describe("dafoam_jobs_running", "gauge", "Number of background mpirun jobs currently running")
+METRICS.describe("dafoam_cores_in_use", "gauge", "Number of CPU cores used by running background jobs")
+METRICS.describe("dafoam_cache_requests_total", "counter", "Number of cache lookups by cache and result")
+METRICS.describe("dafoam_http_bytes_served_total", "counter", "Number of bytes served by the artifact HTTP server")
+METRICS.inc("dafoam_jobs_running", value=0)
+METRICS.inc("dafoam_cores_in_use", value=0)
+METRICS.inc("dafoam_http_bytes_served_total", value=0)
+
+# The fetcher of the airfoil profiles from the UIUC database. Its worker threads keep their connections open
+PROFILE_FETCHER = profile_fetcher.ProfileFetcher(uiuc_base_url, uiuc_cache_dir, retries=uiuc_retries)
+
+
+# Tools that work in the same case directory are serialized, so that concurrent MCP sessions (with the
+# streamable-http transport) do not write the same files at once. Read-only tools do not take the lock.
+# All sessions share one case directory (and plots) per module, so a tool call replaces the mesh, results, or
+# plots of the previous call; when that call came from another session, the tool result says so (case_owners)
+case_locks = {"airfoil": asyncio.Lock(), "wing": asyncio.Lock()}
+held_case_locks = contextvars.ContextVar("held_case_locks", default=frozenset())
+lock_free_tools = {"mcp_check_run_status", "view_run_resource_usage"}
+read_only_tools = lock_free_tools | {"estimate_run_cost"}
+# The latest tool call that wrote each case directory: the session label, the tool name, and the time
+case_owners = {}
+session_labels = weakref.WeakKeyDictionary()
+
+
+def current_session_label() -> str:
+    """Return a label of the MCP session of the current tool call ("session 1", ...), or None outside a request"""
+    try:
+        session = mcp.get_context().session
+    except (LookupError, ValueError):
+        return None
+    if session not in session_labels:
+        session_labels[session] = f"session {len(session_labels) + 1}"
+    return session_labels[session]
+
+
+def claim_case(module: str, tool_name: str) -> str:
+    """
+    Record that a tool call of the current session wrote the case directory of module
+
+    Returns:
+        A note for the tool result if the previous call that wrote the case came from another session, else ""
+    """
+    session = current_session_label()
+    previous = case_owners.get(module)
+    case_owners[module] = {"session": session, "tool": tool_name, "time": time.time()}
+    if session is None or previous is None or previous["session"] in (None, session):
+        return ""
+    return (
+        f"\n\nNote: all MCP sessions share the {module} case directory. This call replaced the files written by "
+        f"{previous['tool']} of another MCP session ({previous['session']}) "
+        f"{format_duration(time.time() - previous['time'])} ago."
+    )
+
+
+def instrument_tool(func):
+    """
+    Decorator that records the call count and latency of an MCP tool in METRICS and runs the tool
+    while holding the lock of its case directory (airfoil or wing)
+    """
+
+    signature = inspect.signature(func)
+    nullcontext_lock = contextlib.nullcontext()
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        METRICS.inc("dafoam_tool_calls_in_flight")
+        start_time = time.perf_counter()
+        status = "error"
+
+        # find the module from the tool's module argument or its name prefix
+        bound_args = signature.bind(*args, **kwargs)
+        bound_args.apply_defaults()
+        module = bound_args.arguments.get("module", func.__name__.split("_")[0])
+        if func.__name__ in lock_free_tools or module not in case_locks or module in held_case_locks.get():
+            case_lock = nullcontext_lock
+        else:
+            case_lock = case_locks[module]
+
+        try:
+            shared_note = ""
+            async with case_lock:
+                token = held_case_locks.set(held_case_locks.get() | {module})
+                try:
+                    with span(func.__name__, kind="tool") as tool_span:
+                        result = await func(*args, **kwargs)
+                finally:
+                    held_case_locks.reset(token)
+                if not (isinstance(result, str) and result.startswith("Error")):
+                    status = "ok"
+                    # nested tool calls (the case lock is already held) belong to the outer call
+                    if case_lock is not nullcontext_lock and func.__name__ not in read_only_tools:
+                        shared_note = claim_case(module, func.__name__)
+            if shared_note:
+                if isinstance(result, str):
+                    result += shared_note
+                elif isinstance(result, (tuple, list)):
+                    result = list(result) + [shared_note]
+            if attach_trace_summary and tool_span is not None:
+                attach_subprocess_spans(tool_span)
+                summary = "\n\nTiming summary:\n" + format_summary(tool_span)
+                if isinstance(result, str):
+                    result += summary
+                elif isinstance(result, (tuple, list)):
+                    result = list(result) + [summary]
+            return result
+        finally:
+            METRICS.inc("dafoam_tool_calls_in_flight", value=-1)
+            METRICS.inc("dafoam_tool_calls_total", {"tool": func.__name__, "status": status})
+            METRICS.observe("dafoam_tool_latency_seconds", {"tool": func.__name__}, time.perf_counter() - start_time)
+
+    return wrapper
+
+
 @mcp.tool()
+@instrument_tool
 async def mcp_check_run_status(module: str):
     """
     Check whether the cfd simulation or optimization finished
@@ -61,6 +380,162 @@ async def mcp_check_run_status(module: str):
 
 
 @mcp.tool()
+@instrument_tool
+async def view_run_resource_usage(module: str = "airfoil"):
+    """
+    Airfoil or Wing Module:
+        Show the CPU, memory, and I/O usage sampled for the latest (or running) cfd simulation
+        or optimization. Use it to choose cpu_cores and estimate the memory needed for a mesh size.
+
+    Inputs:
+        module:
+            The module can be either "airfoil" or "wing"
+    Outputs:
+        Per-rank CPU utilization, peak memory, and read/write sizes, plus the peak memory per
+        mesh cell and the CPU efficiency of the run. Must show them to users.
+    """
+
+    if module == "airfoil":
+        case_path = airfoil_path
+    elif module == "wing":
+        case_path = wing_path
+    else:
+        return "Error: module must be either 'airfoil' or 'wing'."
+
+    metadata_file = f"{case_path}/.dafoam_run_metadata.json"
+    if not os.path.exists(metadata_file):
+        return f"Error: no resource usage found for the {module} module. Run a cfd simulation or optimization first."
+
+    try:
+        with open(metadata_file) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError) as e:
+        return f"Error reading the resource usage of the {module} module: {e}"
+
+    status = "finished" if metadata["end_time"] else "running"
+    message = (
+        f"Resource usage of the {status} {module} run:\n"
+        f"  - Wall time: {metadata['wall_time']:.1f} s on {metadata['cpu_cores']} CPU cores\n"
+        f"  - Mesh cells: {metadata['cells']}\n"
+        f"  - Peak memory (all ranks): {metadata['peak_memory_mb']:.1f} MB\n"
+    )
+    if metadata["peak_memory_kb_per_cell"] is not None:
+        message += f"  - Peak memory per cell: {metadata['peak_memory_kb_per_cell']:.2f} KB\n"
+    if metadata["cpu_efficiency"] is not None:
+        message += f"  - CPU efficiency: {metadata['cpu_efficiency'] * 100:.1f}%\n"
+    for rank, usage in sorted(metadata["ranks"].items(), key=lambda item: int(item[0])):
+        message += (
+            f"  - Rank {rank}: CPU {usage['cpu_utilization'] * 100:.1f}%, peak RSS {usage['peak_rss_mb']:.1f} MB, "
+            f"read {usage['read_mb']:.1f} MB, write {usage['write_mb']:.1f} MB\n"
+        )
+
+    return message
+
+
+@mcp.tool()
+@instrument_tool
+async def estimate_run_cost(
+    module: str = "wing",
+    run_type: str = "cfd",
+    cpu_cores: int = 1,
+    mesh_cells: int = 0,
+    mesh_tool: str = "cfMesh",
+    max_cell_size: float = 1.0,
+    mesh_refinement_level: int = 5,
+    n_boundary_layers: int = 10,
+    mean_chord: float = 1.0,
+    leading_edge_root: List[float] = [0.0, 0.0, 0.0],
+    leading_edge_tip: List[float] = [0.0, 0.0, 3.0],
+    max_opt_iters: int = 20,
+):
+    """
+    Airfoil or Wing Module:
+        Estimate the mesh cells, the mesh generation time, and the wall time and memory of a cfd simulation or
+        optimization BEFORE running them, and flag expensive runs. Call it before wing_generate_mesh with a
+        mesh_refinement_level above 5 or a smaller max_cell_size, before airfoil_generate_mesh with more than
+        50,000 mesh_cells, and before a cfd simulation or optimization on a large mesh. The estimates are
+        calibrated on the past runs, so they improve with every run.
+
+    Inputs:
+        module:
+            The module can be either "airfoil" or "wing"
+        run_type:
+            The run to estimate after the mesh: "cfd" (simulation) or "optimization"
+        cpu_cores:
+            The number of CPU cores of the cfd simulation or optimization (and of the parallel snappyHexMesh)
+        mesh_cells:
+            Airfoil: the mesh_cells of airfoil_generate_mesh (0 uses the current mesh).
+            Wing: 0 estimates the cells from the mesh settings below, or the cells of an existing mesh
+        mesh_tool, max_cell_size, mesh_refinement_level, n_boundary_layers, mean_chord, leading_edge_root,
+        leading_edge_tip:
+            Wing only: the same values as the wing_generate_mesh call. The wing geometry must exist
+            (wing_generate_geometry)
+        max_opt_iters:
+            Optimization only: the max_opt_iters of the optimization call. The wall time scales with it
+    Outputs:
+        The estimated cells, times, memory, and warnings of expensive runs. Must show them to users, and
+        the warnings in bold
+    """
+
+    if module == "airfoil":
+        case_path = airfoil_path
+    elif module == "wing":
+        case_path = wing_path
+    else:
+        return "Error: module must be either 'airfoil' or 'wing'."
+    if run_type not in ("cfd", "optimization"):
+        return "Error: run_type must be either 'cfd' or 'optimization'."
+
+    message = ""
+    if module == "airfoil" and mesh_cells <= 0:
+        if os.path.exists(f"{case_path}/log_mesh.txt"):
+            mesh_cells = parse_mesh_statistics(f"{case_path}/log_mesh.txt")["cells"]
+        if not mesh_cells:
+            return "Error: no airfoil mesh found. Set mesh_cells to the mesh_cells of airfoil_generate_mesh."
+        cells = mesh_cells
+        message += f"Airfoil mesh: {cells:,} cells (the current mesh)\n"
+    elif module == "wing" and mesh_cells > 0:
+        cells = mesh_cells
+        message += f"Wing mesh: {cells:,} cells\n"
+    else:
+        try:
+            loop = asyncio.get_event_loop()
+            mesh_estimate = await loop.run_in_executor(
+                None,
+                estimate_mesh_cells,
+                module,
+                mesh_tool,
+                mesh_cells,
+                max_cell_size,
+                mesh_refinement_level,
+                n_boundary_layers,
+                mean_chord,
+                leading_edge_root,
+                leading_edge_tip,
+            )
+        except ValueError as e:
+            return f"Error: {str(e)}"
+        cells = mesh_estimate["cells"]
+        message += f"Estimated {module} mesh ({mesh_estimate['mesh_tool']}): {cells:,.0f} cells\n"
+        for part, part_cells in (mesh_estimate["breakdown"] or {}).items():
+            if part != "total":
+                message += f"    {part}: {part_cells * mesh_estimate['correction']:,.0f} cells\n"
+        if mesh_estimate["n_meshes"]:
+            message += (
+                f"  - Corrected by x{mesh_estimate['correction']:.2f} from {mesh_estimate['n_meshes']} past meshes\n"
+            )
+        # only snappyHexMesh runs in parallel
+        mesh_cores = cpu_cores if mesh_estimate["mesh_tool"] == "snappyHexMesh" else 1
+        mesh_run = estimate_run(module, "mesh", cells, mesh_cores, mesh_tool=mesh_estimate["mesh_tool"])
+        message += format_run_estimate("mesh", mesh_run, mesh_cores if mesh_cores > 1 else None)
+
+    estimate = estimate_run(module, run_type, cells, cpu_cores, max_opt_iters)
+    message += format_run_estimate(run_type, estimate, cpu_cores)
+    return message
+
+
+@mcp.tool()
+@instrument_tool
 async def airfoil_generate_mesh(
     airfoil_profile: str = "naca0012",
     mesh_cells: int = 5000,
@@ -71,7 +546,8 @@ async def airfoil_generate_mesh(
     """
     Airfoil module:
         Generate the airfoil mesh. Call airfoil_view_mesh after airfoil_generate_mesh
-        to plot the mesh image image_airfoil_mesh.png
+        to plot the mesh image image_airfoil_mesh.png. Call estimate_run_cost first for more than
+        50,000 mesh_cells
 
     Inputs:
         airfoil_profile:
@@ -89,31 +565,31 @@ async def airfoil_generate_mesh(
         Mesh statistics. Must show them to users. Keep only one digit for non-orthogonality and skewness
     """
 
-    # first check if the airfoil exists in the profiles folder
-    # if not, we need to download it from the UIUC airfoil database
-    profile_file_name = os.path.join(airfoil_path, "profiles", airfoil_profile.lower() + ".dat")
-    download_message = ""
-    if not os.path.exists(profile_file_name):
-        logging.info(f"Downloading the {airfoil_profile} airfoil profile from the UIUC database!")
-        download_status = download_airfoil_from_uiuc(airfoil_profile, profile_file_name)
-        if download_status:
-            logging.info("Download completed!")
-            download_message = (
-                f"The {airfoil_profile} airfoil profile is not found in the profiles folder "
-                "and has been downloaded from the UIUC database! \n"
-            )
-        else:
-            return (
-                f"Error: the {airfoil_profile} airfoil profile is not found in the profiles folder "
-                "and it could not be downloaded from the UIUC database either! \n"
-            )
+    # check before cleaning the case, which a running job (or its reconstructPar) still uses
+    if case_busy(airfoil_path):
+        return (
+            "Error: a cfd simulation or optimization is already running in the airfoil module. "
+            "Use mcp_check_run_status to check if it's finished before generating a new mesh."
+        )
 
-    # Run DAFoam commands directly in this container with mpirun
-    bash_command = (
+    # the profile comes from the profiles folder, the profile library, or the UIUC airfoil database
+    try:
+        # run in non-blocking mode, the downloads may take a while
+        loop = asyncio.get_event_loop()
+        download_message = await loop.run_in_executor(None, ensure_airfoil_profiles, airfoil_path, [airfoil_profile])
+    except ValueError as e:
+        return f"Error: {str(e)}"
+
+    # Run DAFoam commands directly in this container. The commands are split into stages
+    # so that the wall time of each stage is recorded separately in the metrics
+    pyhyp_command = (
         f"cd {airfoil_path} && "
         f"./Allclean.sh && "
-        f"python script_generate_mesh.py -airfoil_profile={airfoil_profile} -mesh_cells={mesh_cells} "
-        f"-y_plus={y_plus} -n_ffd_points={n_ffd_points} -mach_number={mach_number} > log_mesh.txt && "
+        f"python script_generate_mesh.py -airfoil_profile={shlex.quote(airfoil_profile)} -mesh_cells={mesh_cells} "
+        f"-y_plus={y_plus} -n_ffd_points={n_ffd_points} -mach_number={mach_number} > log_mesh.txt"
+    )
+    openfoam_command = (
+        f"cd {airfoil_path} && "
         f"plot3dToFoam -noBlank volumeMesh.xyz >> log_mesh.txt && "
         f"autoPatch 30 -overwrite >> log_mesh.txt && "
         f"createPatch -overwrite >> log_mesh.txt && "
@@ -125,21 +601,22 @@ async def airfoil_generate_mesh(
         f"dafoam_plot3dtransform.py scale FFD/FFD.xyz FFD/FFD.xyz 1 1 0.01 >> log_mesh.txt && "
         f"dafoam_plot3d2tecplot.py FFD/FFD.xyz FFD/FFD.dat >> log_mesh.txt && "
         f'sed -i "/Zone T=\\"embedding_vol\\"/,\\$d" FFD/FFD.dat && '
-        f"rm volumeMesh.xyz surfMesh.xyz && "
-        f"pvpython --no-mpi script_plot_mesh.py -plot_all_views=1 "
+        f"rm volumeMesh.xyz surfMesh.xyz"
     )
+    plot_command = f"cd {airfoil_path} && pvpython --no-mpi script_plot_mesh.py -plot_all_views=1"
 
     try:
         # run in non-blocking mode
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: subprocess.run(["bash", "-c", bash_command], capture_output=True, text=True, check=True),
-        )
+        start_time = time.perf_counter()
+        await run_bash_stage("pyHyp", pyhyp_command)
+        await run_bash_stage("OpenFOAM", openfoam_command)
+        mesh_time = time.perf_counter() - start_time
+        await run_bash_stage("pvpython", plot_command)
 
         # Parse mesh statistics from log_mesh.txt
         log_file_path = f"{airfoil_path}/log_mesh.txt"
         mesh_stats = parse_mesh_statistics(log_file_path)
+        record_mesh_history("airfoil", "pyHyp", mesh_stats["cells"], mesh_cells, mesh_time, 1)
 
         # Create HTML wrapper using multi-image function
         output_filename = "airfoil_mesh_all_views"
@@ -151,15 +628,18 @@ async def airfoil_generate_mesh(
         create_image_html(airfoil_path, image_list, output_filename + ".html")
         combine_pngs(airfoil_path, image_list, output_filename + ".png")
 
-        return (
-            download_message,
-            f"Mesh successfully generated for {airfoil_profile}!\n\n"
-            f"Mesh Statistics:\n"
-            f"  - Number of mesh cells: {mesh_stats['cells']}\n"
-            f"  - Mesh max non-orthogonality: {mesh_stats['max_non_orthogonality']:.2f}°\n"
-            f"  - Mesh max skewness: {mesh_stats['max_skewness']:.2f}\n\n"
-            f"View the mesh: http://localhost:{FILE_HTTP_PORT}/airfoil/{output_filename}.html\n"
-            f"Combined PNG path: {airfoil_path}/plots/{output_filename}.png",
+        return tool_result(
+            download_message
+            + (
+                f"Mesh successfully generated for {airfoil_profile}!\n\n"
+                f"Mesh Statistics:\n"
+                f"  - Number of mesh cells: {mesh_stats['cells']}\n"
+                f"  - Mesh max non-orthogonality: {mesh_stats['max_non_orthogonality']:.2f}°\n"
+                f"  - Mesh max skewness: {mesh_stats['max_skewness']:.2f}\n\n"
+                f"View the mesh: http://localhost:{FILE_HTTP_PORT}/airfoil/{output_filename}.html\n"
+                f"Combined PNG path: {airfoil_path}/plots/{output_filename}.png"
+            ),
+            f"{airfoil_path}/plots/{output_filename}.png",
         )
 
     except subprocess.CalledProcessError as e:
@@ -167,6 +647,7 @@ async def airfoil_generate_mesh(
 
 
 @mcp.tool()
+@instrument_tool
 async def airfoil_run_cfd_simulation(
     cpu_cores: int = 1,
     angle_of_attack: float = 3.0,
@@ -194,6 +675,13 @@ async def airfoil_run_cfd_simulation(
         and the progress is written to log_cfd_simulation.txt
     """
 
+    # check before touching the case files, which a running job still uses
+    if case_busy(airfoil_path):
+        return (
+            "Error: a cfd simulation or optimization is already running in the airfoil module. "
+            "Use mcp_check_run_status to check if it's finished."
+        )
+
     if mach_number < 0.6:
         os.system(f"cp -r {airfoil_path}/system/fvSolution_subsonic {airfoil_path}/system/fvSolution")
     else:
@@ -209,24 +697,21 @@ async def airfoil_run_cfd_simulation(
     )
 
     try:
+        set_write_format(airfoil_path)
         # Run in non-blocking background mode
-        subprocess.Popen(
-            ["bash", "-c", bash_command],
-            stdout=subprocess.DEVNULL,  # Don't let child write to our stdout
-            stderr=subprocess.DEVNULL,  # Don't let child write to our stderr
-            stdin=subprocess.DEVNULL,  # Don't let child read from our stdin
-        )
+        launch_background_job(bash_command, cpu_cores, airfoil_path, "cfd")
         return (
             "CFD simulation started in the background. "
             "Progress is being written to log_cfd_simulation.txt. "
             "Use mcp_check_run_status to check if it's finished."
-        )
+        ) + run_estimate_message(airfoil_path, "cfd", cpu_cores)
 
     except Exception as e:
         return f"Error starting CFD simulation: {str(e)}"
 
 
 @mcp.tool()
+@instrument_tool
 async def airfoil_run_optimization(
     cpu_cores: int = 1,
     angle_of_attack: float = 3.0,
@@ -263,6 +748,13 @@ async def airfoil_run_optimization(
         and the progress is written to log_optimization.txt
     """
 
+    # check before touching the case files, which a running job still uses
+    if case_busy(airfoil_path):
+        return (
+            "Error: a cfd simulation or optimization is already running in the airfoil module. "
+            "Use mcp_check_run_status to check if it's finished."
+        )
+
     if mach_number < 0.6:
         os.system(f"cp -r {airfoil_path}/system/fvSolution_subsonic {airfoil_path}/system/fvSolution")
     else:
@@ -278,29 +770,27 @@ async def airfoil_run_optimization(
     )
 
     try:
+        set_write_format(airfoil_path)
         # Run in non-blocking background mode
-        subprocess.Popen(
-            ["bash", "-c", bash_command],
-            stdout=subprocess.DEVNULL,  # Don't let child write to our stdout
-            stderr=subprocess.DEVNULL,  # Don't let child write to our stderr
-            stdin=subprocess.DEVNULL,  # Don't let child read from our stdin
-        )
+        launch_background_job(bash_command, cpu_cores, airfoil_path, "optimization", max_opt_iters)
         return (
             "Optimization started in the background. "
             "Progress is being written to log_optimization.txt."
             "Use mcp_check_run_status to check if it's finished."
-        )
+        ) + run_estimate_message(airfoil_path, "optimization", cpu_cores, max_opt_iters)
     except Exception as e:
         return f"Error starting optimization: {str(e)}"
 
 
 @mcp.tool()
+@instrument_tool
 async def airfoil_view_flow_field(
     x_location: float = 0.5,
     y_location: float = 0.0,
     zoom_in_scale: float = 0.5,
     flow_field: str = "p",
     time_step: int = -1,
+    render_plan: List[dict] = [],
 ):
     """
     Airfoil module:
@@ -323,6 +813,12 @@ async def airfoil_view_flow_field(
         time_step:
             which time step to view. The time_step is the time-step for cfd simulation or
             optimization iteration for optimization. time_step=-1 means all time steps
+        render_plan:
+            Optional list of views to render in one pass, e.g., to view several flow fields and zoom windows
+            at once. Each view is a dict with any of the keys "flow_field", "x_location", "y_location",
+            "zoom_in_scale", and "time_step"; missing keys take the values of the arguments above. The case is
+            loaded only once for all views, and all views of a flow field share its color map.
+            Example: [{"flow_field": "p", "x_location": 0.0, "zoom_in_scale": 0.1}, {"flow_field": "nut"}]
     Outputs:
         Message indicating the status. Must show the HTML link and the path to the combine PNG in bold to users.
     """
@@ -330,27 +826,32 @@ async def airfoil_view_flow_field(
     bash_command = (
         f"cd {airfoil_path} && "
         f"pvpython --no-mpi script_plot_flow_field.py -x_location={x_location} -y_location={y_location} "
-        f"-zoom_in_scale={zoom_in_scale} -flow_field={flow_field} -time_step={time_step}"
+        f"-zoom_in_scale={zoom_in_scale} -flow_field={shlex.quote(flow_field)} -time_step={time_step}"
     )
 
     try:
         # run in non-blocking mode
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: subprocess.run(["bash", "-c", bash_command], capture_output=True, text=True, check=True),
-        )
+        # the plan frames have their own prefix, so they never mix with the frames of a call without a plan
+        if render_plan:
+            frame_prefix = "airfoil_flow_plan"
+            await run_render_plan(airfoil_path, bash_command, render_plan, frame_prefix)
+        else:
+            frame_prefix = "airfoil_flow_field"
+            await run_render_workers(airfoil_path, bash_command, time_step, frame_prefix)
 
         # Create HTML wrapper using multi-image function
         output_filename = "airfoil_flow_field"
-        image_names = glob.glob(f"{airfoil_path}/plots/airfoil_flow_field*.png")
+        image_names = glob.glob(f"{airfoil_path}/plots/{frame_prefix}_*.png")
         create_image_html(airfoil_path, sorted(image_names, reverse=True), output_filename + ".html")
         combine_pngs(airfoil_path, sorted(image_names, reverse=True), output_filename + ".png")
 
-        return (
-            "Flow field plots successfully generated!\n\n"
-            f"View convergence: http://localhost:{FILE_HTTP_PORT}/airfoil/{output_filename}.html\n"
-            f"Combined PNG path: {airfoil_path}/plots/{output_filename}.png"
+        return tool_result(
+            (
+                "Flow field plots successfully generated!\n\n"
+                f"View convergence: http://localhost:{FILE_HTTP_PORT}/airfoil/{output_filename}.html\n"
+                f"Combined PNG path: {airfoil_path}/plots/{output_filename}.png"
+            ),
+            f"{airfoil_path}/plots/{output_filename}.png",
         )
 
     except subprocess.CalledProcessError as e:
@@ -358,6 +859,7 @@ async def airfoil_view_flow_field(
 
 
 @mcp.tool()
+@instrument_tool
 async def view_optimization_history(module: str = "airfoil"):
     """
     Airfoil or Wing Module:
@@ -379,11 +881,7 @@ async def view_optimization_history(module: str = "airfoil"):
 
     try:
         # run in non-blocking mode
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: subprocess.run(["bash", "-c", bash_command], capture_output=True, text=True, check=True),
-        )
+        await run_bash_stage("python", bash_command)
 
         # Create HTML wrapper using multi-image function
         output_filename = f"{module}_optimization_history"
@@ -402,10 +900,13 @@ async def view_optimization_history(module: str = "airfoil"):
         create_image_html(case_path, image_files, output_filename + ".html")
         combine_pngs(case_path, image_files, output_filename + ".png")
 
-        return (
-            "Optimization history plots successfully generated!\n\n"
-            f"View convergence: http://localhost:{FILE_HTTP_PORT}/{module}/{output_filename}.html\n"
-            f"Combined PNG path: {case_path}/plots/{output_filename}.png"
+        return tool_result(
+            (
+                "Optimization history plots successfully generated!\n\n"
+                f"View convergence: http://localhost:{FILE_HTTP_PORT}/{module}/{output_filename}.html\n"
+                f"Combined PNG path: {case_path}/plots/{output_filename}.png"
+            ),
+            f"{case_path}/plots/{output_filename}.png",
         )
 
     except subprocess.CalledProcessError as e:
@@ -413,6 +914,7 @@ async def view_optimization_history(module: str = "airfoil"):
 
 
 @mcp.tool()
+@instrument_tool
 async def view_cfd_convergence(
     module: str = "airfoil",
     log_file: str = "log_cfd_simulation.txt",
@@ -451,19 +953,15 @@ async def view_cfd_convergence(
     bash_command = (
         f"cd {case_path} && "
         f"python script_plot_residual.py "
-        f"-log_file={log_file} -start_time_cfd={start_time_cfd} -end_time_cfd={end_time_cfd} "
+        f"-log_file={shlex.quote(log_file)} -start_time_cfd={start_time_cfd} -end_time_cfd={end_time_cfd} "
         f"-start_time_adjoint={start_time_adjoint} -end_time_adjoint={end_time_adjoint} && "
-        f"python script_plot_function.py -log_file={log_file} "
+        f"python script_plot_function.py -log_file={shlex.quote(log_file)} "
         f"-start_time={start_time_cfd} -end_time={end_time_cfd}"
     )
 
     try:
         # run in non-blocking mode
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: subprocess.run(["bash", "-c", bash_command], capture_output=True, text=True, check=True),
-        )
+        await run_bash_stage("python", bash_command)
 
         # Create HTML wrapper using multi-image function
         output_filename = f"{module}_convergence"
@@ -478,10 +976,13 @@ async def view_cfd_convergence(
         create_image_html(case_path, image_files, output_filename + ".html")
         combine_pngs(case_path, image_files, output_filename + ".png")
 
-        return (
-            "Residual and function plots successfully generated!\n\n"
-            f"View convergence: http://localhost:{FILE_HTTP_PORT}/{module}/{output_filename}.html\n"
-            f"Combined PNG path: {case_path}/plots/{output_filename}.png"
+        return tool_result(
+            (
+                "Residual and function plots successfully generated!\n\n"
+                f"View convergence: http://localhost:{FILE_HTTP_PORT}/{module}/{output_filename}.html\n"
+                f"Combined PNG path: {case_path}/plots/{output_filename}.png"
+            ),
+            f"{case_path}/plots/{output_filename}.png",
         )
 
     except subprocess.CalledProcessError as e:
@@ -489,6 +990,102 @@ async def view_cfd_convergence(
 
 
 @mcp.tool()
+@instrument_tool
+async def view_surface_loads(
+    module: str = "airfoil",
+    mach_number: float = 0.1,
+    angle_of_attack: float = 0.0,
+    time_step: int = -1,
+    reference_area: float = -1.0,
+    mean_chord: float = 1.0,
+    leading_edge_root: List[float] = [0.0, 0.0, 0.0],
+):
+    """
+    Airfoil or Wing Module:
+        Compute the surface pressure coefficient (Cp) and the integrated pressure loads (lift, drag,
+        and moment coefficients) on the wing patch. The fields are read directly from the OpenFOAM
+        files without ParaView, so it takes milliseconds. The cfd simulation or optimization must have been done.
+
+    Inputs:
+        module:
+            The module can be either "airfoil" or "wing"
+        mach_number:
+            The Mach number (Ma). We should use the same mach number set in the cfd simulation or optimization.
+        angle_of_attack:
+            The angle of attack in degree. We should use the same angle of attack set in the cfd simulation.
+            For optimization, use the optimized angle of attack.
+        time_step:
+            which time step to use. The time_step is the time-step for cfd simulation or
+            optimization iteration for optimization. time_step=-1 means the latest time step
+        reference_area:
+            The reference area to normalize the loads. reference_area=-1 means using the projected
+            area of the wing patch in the x-z plane (chord x span)
+        mean_chord:
+            Wing only: the average chord for the wing, the reference chord of the moment coefficient. NOTE: this
+            value must be consistent with the averaged chords from the spanwise_chords args from the
+            wing_generate_geometry function! The airfoil uses its unit chord
+        leading_edge_root:
+            Wing only: the coordinates for the leading edge at the wing root, the same as in wing_generate_mesh.
+            The moment is about the quarter chord (leading_edge_root + 0.25 * mean_chord in x) and the z axis
+    Outputs:
+        The lift, drag, and moment coefficients from the surface pressure (the viscous contribution
+        is not included) and the path to a CSV file with the Cp at each surface face. Must show them to users.
+    """
+
+    if module == "airfoil":
+        case_path = airfoil_path
+        reference_chord = 1.0
+        moment_reference = [0.25, 0.0, 0.0]
+    elif module == "wing":
+        case_path = wing_path
+        reference_chord = mean_chord
+        moment_reference = [leading_edge_root[0] + 0.25 * mean_chord, leading_edge_root[1], leading_edge_root[2]]
+    else:
+        return "Error: module must be either 'airfoil' or 'wing'."
+
+    time_names = [time_name for time_name in foam_reader.list_times(case_path) if float(time_name) > 0]
+    if not time_names:
+        return f"Error: no flow field found for the {module} module. Run a cfd simulation or optimization first."
+    if time_step == -1:
+        time_name = time_names[-1]
+    else:
+        matches = [time_name for time_name in time_names if abs(float(time_name) - time_step * 0.0001) < 1e-8]
+        if not matches:
+            return f"Error: time_step {time_step} not found. Available time steps: {', '.join(time_names)}"
+        time_name = matches[0]
+
+    try:
+        # run in non-blocking mode
+        loop = asyncio.get_event_loop()
+        loads = await loop.run_in_executor(
+            None,
+            compute_surface_loads,
+            case_path,
+            module,
+            time_name,
+            mach_number,
+            angle_of_attack,
+            reference_area,
+            moment_reference,
+            reference_chord,
+        )
+    except (OSError, ValueError) as e:
+        return f"Error occurred!\n\n{e}"
+
+    return (
+        f"Surface loads of the {module} at time {time_name} (pressure contribution only):\n"
+        f"  - CL: {loads['CL']:.5f}\n"
+        f"  - CD: {loads['CD']:.5f}\n"
+        f"  - CM: {loads['CM']:.5f} (about x, y = {moment_reference[0]:.4g}, {moment_reference[1]:.4g})\n"
+        f"  - Reference area: {loads['reference_area']:.5g}\n"
+        f"  - Surface faces: {loads['n_faces']}\n\n"
+        f"Cp CSV: http://localhost:{FILE_HTTP_PORT}/{module}/{module}_surface_cp.csv\n"
+        f"Cp CSV path: {case_path}/plots/{module}_surface_cp.csv"
+    )
+
+
+@mcp.tool()
+@instrument_tool
 async def airfoil_view_pressure_profile(mach_number: float = 0.1, time_step: int = -1):
     """
     Airfoil module:
@@ -507,16 +1104,12 @@ async def airfoil_view_pressure_profile(mach_number: float = 0.1, time_step: int
 
     bash_command = (
         f"cd {airfoil_path} && "
-        f"pvpython --no-mpi script_plot_pressure_profile.py -mach_number={mach_number} -time_step={time_step}"
+        f"python script_plot_pressure_profile.py -mach_number={mach_number} -time_step={time_step}"
     )
 
     try:
-        # run in non-blocking mode
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: subprocess.run(["bash", "-c", bash_command], capture_output=True, text=True, check=True),
-        )
+        # run in non-blocking mode. The script reads the wing patch with foam_reader, so it does not need pvpython
+        await run_render_workers(airfoil_path, bash_command, time_step, "airfoil_pressure_profile", "python")
 
         # Create HTML wrapper using multi-image function
         output_filename = "airfoil_pressure_profile"
@@ -524,10 +1117,13 @@ async def airfoil_view_pressure_profile(mach_number: float = 0.1, time_step: int
         create_image_html(airfoil_path, sorted(image_names, reverse=True), output_filename + ".html")
         combine_pngs(airfoil_path, sorted(image_names, reverse=True), output_filename + ".png")
 
-        return (
-            "Pressure profile successfully generated!\n\n"
-            f"View the result: http://localhost:{FILE_HTTP_PORT}/airfoil/{output_filename}.html\n"
-            f"Combined PNG path: {airfoil_path}/plots/{output_filename}.png"
+        return tool_result(
+            (
+                "Pressure profile successfully generated!\n\n"
+                f"View the result: http://localhost:{FILE_HTTP_PORT}/airfoil/{output_filename}.html\n"
+                f"Combined PNG path: {airfoil_path}/plots/{output_filename}.png"
+            ),
+            f"{airfoil_path}/plots/{output_filename}.png",
         )
 
     except subprocess.CalledProcessError as e:
@@ -535,6 +1131,7 @@ async def airfoil_view_pressure_profile(mach_number: float = 0.1, time_step: int
 
 
 @mcp.tool()
+@instrument_tool
 async def airfoil_view_mesh(x_location: float = 0.5, y_location: float = 0.0, zoom_in_scale: float = 0.5):
     """
     Airfoil module:
@@ -562,20 +1159,19 @@ async def airfoil_view_mesh(x_location: float = 0.5, y_location: float = 0.0, zo
 
     try:
         # run in non-blocking mode
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: subprocess.run(["bash", "-c", bash_command], capture_output=True, text=True, check=True),
-        )
+        await run_bash_stage("pvpython", bash_command)
 
         # Create HTML wrapper using multi-image function
         output_filename = "airfoil_mesh"
         create_image_html(airfoil_path, ["plots/airfoil_mesh.png"], output_filename + ".html")
 
-        return (
-            "Mesh visualization successfully generated!\n\n"
-            f"View the result: http://localhost:{FILE_HTTP_PORT}/airfoil/{output_filename}.html\n"
-            f"PNG path: {airfoil_path}/plots/{output_filename}.png"
+        return tool_result(
+            (
+                "Mesh visualization successfully generated!\n\n"
+                f"View the result: http://localhost:{FILE_HTTP_PORT}/airfoil/{output_filename}.html\n"
+                f"PNG path: {airfoil_path}/plots/{output_filename}.png"
+            ),
+            f"{airfoil_path}/plots/{output_filename}.png",
         )
 
     except subprocess.CalledProcessError as e:
@@ -583,6 +1179,7 @@ async def airfoil_view_mesh(x_location: float = 0.5, y_location: float = 0.0, zo
 
 
 @mcp.tool()
+@instrument_tool
 async def wing_generate_geometry(
     spanwise_airfoil_profiles: List[str] = ["naca0012", "naca0012"],
     spanwise_chords: List[float] = [1.0, 1.0],
@@ -622,46 +1219,53 @@ async def wing_generate_geometry(
         and path to combine PNG in bold to users.
     """
 
-    # Build command line arguments
-    bash_command = (
+    # check before cleaning the case, which a running job (or its reconstructPar) still uses
+    if case_busy(wing_path):
+        return (
+            "Error: a cfd simulation or optimization is already running in the wing module. "
+            "Use mcp_check_run_status to check if it's finished before generating a new geometry."
+        )
+
+    # the profiles come from the profiles folder, the profile library, or the UIUC airfoil database
+    try:
+        # run in non-blocking mode, the downloads may take a while
+        loop = asyncio.get_event_loop()
+        download_message = await loop.run_in_executor(
+            None, ensure_airfoil_profiles, wing_path, spanwise_airfoil_profiles
+        )
+    except ValueError as e:
+        return f"Error: {str(e)}"
+
+    # Build command line arguments. The commands are split into stages so that the
+    # wall time of each stage is recorded separately in the metrics
+    pygeo_command = (
         f"cd {wing_path} && "
         f"./Allclean.sh && "
         f"python script_generate_geometry.py "
-        f"-spanwise_airfoil_profiles {' '.join(map(str, spanwise_airfoil_profiles))} "
+        f"-spanwise_airfoil_profiles {' '.join(map(shlex.quote, spanwise_airfoil_profiles))} "
         f"-spanwise_chords {' '.join(map(str, spanwise_chords))} "
         f"-spanwise_x {' '.join(map(str, spanwise_x))} "
         f"-spanwise_y {' '.join(map(str, spanwise_y))} "
         f"-spanwise_z {' '.join(map(str, spanwise_z))} "
-        f"-spanwise_twists {' '.join(map(str, spanwise_twists))} && "
-        "pvpython --no-mpi script_iges2stl.py && "
-        # Rename wing0.stl to wing_upper.stl and fix solid name
-        "mv wing0.stl wing_upper.stl && "
-        "sed -i '1s/^solid.*/solid wing_upper/' wing_upper.stl && "
-        # Rename wing1.stl to wing_lower.stl and fix solid name
-        "mv wing1.stl wing_lower.stl && "
-        "sed -i '1s/^solid.*/solid wing_lower/' wing_lower.stl && "
-        # Rename wing2.stl to wing_te.stl and fix solid name
-        "mv wing2.stl wing_te.stl && "
-        "sed -i '1s/^solid.*/solid wing_te/' wing_te.stl && "
-        # Combine wing3 and wing4 into wing_tip.stl (one solid) and fix solid name
-        "head -n 1 wing3.stl > wing_tip.stl && "
-        "sed '1d;$d' wing3.stl >> wing_tip.stl && "
-        "sed '1d;$d' wing4.stl >> wing_tip.stl && "
-        "echo 'endsolid' >> wing_tip.stl && "
-        "rm -rf wing3.stl wing4.stl && "
-        "sed -i '1s/^solid.*/solid wing_tip/' wing_tip.stl && "
-        # Create wing_all_surfaces.stl with four separate solids
-        "cat wing_upper.stl wing_lower.stl wing_te.stl wing_tip.stl > wing_all_surfaces.stl && "
-        # Create wing.stl with one solid (combine all sections)
-        "head -n 1 wing_upper.stl > wing.stl && "
-        "for f in wing_upper.stl wing_lower.stl wing_te.stl wing_tip.stl; do "
-        "sed '1d;$d' $f >> wing.stl; done && "
-        "echo 'endsolid' >> wing.stl && "
-        # Move all files to constant/triSurface/
-        "mv *.stl constant/triSurface/ && "
+        f"-spanwise_twists {' '.join(map(str, spanwise_twists))}"
+    )
+    mean_chord = sum(spanwise_chords) / len(spanwise_chords)
+    wing_span = spanwise_z[-1] - spanwise_z[0]
+
+    # the IGES surfaces are tessellated to wing0.stl - wing4.stl, which are relabeled and merged by assemble_wing_stl
+    stl_command = (
+        f"cd {wing_path} && "
+        f"pvpython --no-mpi script_iges2stl.py -mean_chord={mean_chord} -wing_span={wing_span} "
+        f"-linear_deflection={stl_linear_deflection} -angular_deflection={stl_angular_deflection}"
+    )
+    plot_command = (
+        f"cd {wing_path} && "
         f"pvpython --no-mpi script_plot_geometry.py "
         f"-spanwise_z {' '.join(map(str, spanwise_z))} "
-        f"-spanwise_chords {' '.join(map(str, spanwise_chords))} && "
+        f"-spanwise_chords {' '.join(map(str, spanwise_chords))}"
+    )
+    ffd_command = (
+        f"cd {wing_path} && "
         f"python script_generate_ffd.py "
         f"-n_ffd_chord {n_ffd_chord} "
         f"-n_ffd_span {n_ffd_span} "
@@ -675,11 +1279,14 @@ async def wing_generate_geometry(
 
     try:
         # run in non-blocking mode
+        await run_bash_stage("pyGeo", pygeo_command)
+        start_time = time.perf_counter()
+        await run_bash_stage("pvpython", stl_command)
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: subprocess.run(["bash", "-c", bash_command], capture_output=True, text=True, check=True),
-        )
+        n_triangles = await loop.run_in_executor(None, assemble_wing_stl, wing_path)
+        stl_seconds = time.perf_counter() - start_time
+        await run_bash_stage("pvpython", plot_command)
+        await run_bash_stage("pyGeo", ffd_command)
 
         # Create HTML wrapper using multi-image function
         output_filename = "wing_geometry_all_views"
@@ -692,24 +1299,30 @@ async def wing_generate_geometry(
         create_image_html(wing_path, image_files, output_filename + ".html")
         combine_pngs(wing_path, image_files, output_filename + ".png")
 
-        # Calculate focal point coords for trame viewer
-        mean_chord = sum(spanwise_chords) / len(spanwise_chords)
-        wing_span = spanwise_z[-1] - spanwise_z[0]
-
         trame_viewer = await wing_view_geometry_mesh(mode="geometry", mean_chord=mean_chord, wing_span=wing_span)
 
-        return (
-            "Wing geometry is successfully generated!\n\n"
-            f"View the geometry at: http://localhost:{FILE_HTTP_PORT}/wing/{output_filename}.html\n"
-            f"Combined PNG path: {wing_path}/plots/{output_filename}.png \n"
-            f"Interactive 3D viewer: {trame_viewer}"
+        return tool_result(
+            (
+                f"{download_message}"
+                "Wing geometry is successfully generated!\n\n"
+                f"View the geometry at: http://localhost:{FILE_HTTP_PORT}/wing/{output_filename}.html\n"
+                f"Combined PNG path: {wing_path}/plots/{output_filename}.png \n"
+                f"Interactive 3D viewer: {trame_viewer}\n"
+                f"Surface triangles: {', '.join(f'{name} {n}' for name, n in n_triangles.items())} "
+                f"(total {sum(n_triangles.values())}, {wing_stl_format} STL, converted in {stl_seconds:.1f} s)"
+            ),
+            f"{wing_path}/plots/{output_filename}.png",
         )
 
     except subprocess.CalledProcessError as e:
         return f"Error occurred!\n\nStderr:\n{e.stderr}"
 
+    except (OSError, ValueError) as e:
+        return f"Error assembling the wing STL files: {str(e)}"
+
 
 @mcp.tool()
+@instrument_tool
 async def wing_generate_mesh(
     mesh_tool: str = "cfMesh",
     max_cell_size: float = 1.0,
@@ -719,11 +1332,13 @@ async def wing_generate_mesh(
     wing_span: float = 3.0,
     leading_edge_root: List[float] = [0.0, 0.0, 0.0],
     leading_edge_tip: List[float] = [0.0, 0.0, 3.0],
+    cpu_cores: int = 1,
 ):
     """
     Wing module:
         Generate wing mesh using cfMesh or snappyHexMesh. Here we assume x is the flow direction, y is
-        the airfoil vertical direction, and z is the wing spanwise direction.
+        the airfoil vertical direction, and z is the wing spanwise direction. Call estimate_run_cost first
+        for a mesh_refinement_level above 5 or a smaller max_cell_size, and show its warnings to users.
 
     Args:
         mesh_tool:
@@ -750,12 +1365,24 @@ async def wing_generate_mesh(
             spanwise_y, and spanwise_z from the wing_generate_geometry function. Here the size of spanwise_x
             is the number of spanwise sections, if there are more than two sections prescribed, we will use
             the first one (root section) and the last one (tip section).
+        cpu_cores:
+            snappyHexMesh only: the number of CPU cores to run snappyHexMesh with MPI. With more than 1 core,
+            the decomposed mesh is kept for the cfd simulation or optimization, so use the same cpu_cores as the
+            following wing_run_cfd_simulation or wing_run_optimization call (see its cpu_cores guideline).
+            cfMesh always runs on 1 core
 
     Returns:
         Status message and list of generated files. Must show the link to html, png, and interactive window in bold
         to users. Must show Mesh statistics to users. Keep only one digit for non-orthogonality and skewness
     """
 
+    # check before removing processor* and the mesh, which a running job (or its reconstructPar) still uses
+    if case_busy(wing_path):
+        return (
+            "Error: a cfd simulation or optimization is already running in the wing module. "
+            "Use mcp_check_run_status to check if it's finished before generating a new mesh."
+        )
+
     # Build command line arguments
     if mesh_tool == "cfMesh":
         Lx = mean_chord * 30.0
@@ -764,9 +1391,12 @@ async def wing_generate_mesh(
         refinementLevel = mesh_refinement_level
         refineP1 = mesh_refinement_level + 1
         refineP2 = mesh_refinement_level + 2
+        mesh_stage = "cartesianMesh"
+        mesh_cores = 1
         bash_command = (
             f". /home/dafoamuser/dafoam/loadDAFoam.sh && "
             f"cd {wing_path} && "
+            f"rm -rf processor* {foam_reader.reconstructed_flag} && "
             f"sed -i 's/^maxCellSize.*/maxCellSize {max_cell_size};/' system/meshDict && "
             f"sed -i 's/^refinementLevel.*/refinementLevel {refinementLevel};/' system/meshDict && "
             f"sed -i 's/^refineP1.*/refineP1 {refineP1};/' system/meshDict && "
@@ -780,10 +1410,7 @@ async def wing_generate_mesh(
             f"renumberMesh -overwrite >> log_mesh.txt && "
             f"checkMesh >> log_mesh.txt && "
             'foamToVTK -patches "(wing sym)" -one-boundary && '
-            f"cp -r 0_orig 0 && "
-            f"pvpython --no-mpi script_plot_mesh.py "
-            f"-mean_chord={mean_chord} "
-            f"-wing_span={wing_span} "
+            f"cp -r 0_orig 0"
         )
     elif mesh_tool == "snappyHexMesh":
         Lx = mean_chord * 30.0
@@ -793,8 +1420,11 @@ async def wing_generate_mesh(
         surfaceLevel = mesh_refinement_level
         lineLevel = surfaceLevel + 2
         prismLayer = n_boundary_layers
+        mesh_stage = "snappyHexMesh"
+        mesh_cores = max(cpu_cores, 1)
         bash_command = (
             f"cd {wing_path} && "
+            f"rm -rf processor* {foam_reader.reconstructed_flag} && "
             f"sed -i 's/^Lx .*/Lx {Lx};/' system/blockMeshDict && "
             f"sed -i 's/^LxNeg.*/LxNeg {LxNeg};/' system/blockMeshDict && "
             f"sed -i 's/^Nx.*/Nx {Nx};/' system/blockMeshDict && "
@@ -804,30 +1434,85 @@ async def wing_generate_mesh(
             f"sed -i 's/^[[:space:]]*prismLayer.*/    prismLayer {prismLayer};/' system/snappyHexMeshDict && "
             "blockMesh > log_mesh.txt && "
             "surfaceFeatureExtract >> log_mesh.txt && "
-            "snappyHexMesh -overwrite >> log_mesh.txt && "
-            "createPatch -overwrite >> log_mesh.txt && "
-            "renumberMesh -overwrite >> log_mesh.txt && "
-            "checkMesh >> log_mesh.txt && "
-            'foamToVTK -patches "(wing sym)" -one-boundary && '
-            "cp -r 0_orig 0 && "
-            f"pvpython --no-mpi script_plot_mesh.py "
-            f"-mean_chord={mean_chord} "
-            f"-wing_span={wing_span} "
         )
+        if mesh_cores > 1:
+            # Decompose the background mesh and run the rest in parallel. The mesh stays decomposed for the
+            # DAFoam run on the same cores (pyDAFoam keeps existing processor* directories), and the background
+            # mesh is removed from constant/polyMesh so it is never mistaken for the final mesh. A run on other
+            # cores reconstructs it first, see mesh_decomposition_command. The fields need processor patches, see
+            # setConstraintTypes in 0_orig. VTK/wings_0/boundary.vtp is written from the decomposed mesh by
+            # write_boundary_vtp
+            mpirun = f"mpirun -np {mesh_cores}"
+            bash_command += (
+                f"sed -i 's/^numberOfSubdomains.*/numberOfSubdomains     {mesh_cores};/' system/decomposeParDict && "
+                "decomposePar -force >> log_mesh.txt && "
+                "rm -rf constant/polyMesh && "
+                f"{mpirun} snappyHexMesh -parallel -overwrite >> log_mesh.txt && "
+                f"{mpirun} createPatch -parallel -overwrite >> log_mesh.txt && "
+                f"{mpirun} renumberMesh -parallel -overwrite >> log_mesh.txt && "
+                f"{mpirun} checkMesh -parallel >> log_mesh.txt && "
+                "cp -r 0_orig 0 && "
+                "for d in processor*; do rm -rf $d/0 && cp -r 0_orig $d/0; done"
+            )
+        else:
+            bash_command += (
+                "snappyHexMesh -overwrite >> log_mesh.txt && "
+                "createPatch -overwrite >> log_mesh.txt && "
+                "renumberMesh -overwrite >> log_mesh.txt && "
+                "checkMesh >> log_mesh.txt && "
+                'foamToVTK -patches "(wing sym)" -one-boundary && '
+                "cp -r 0_orig 0"
+            )
     else:
         return f"Error: mesh_tool {mesh_tool} not recognized. Options are 'cfMesh' and 'snappyHexMesh'."
 
+    plot_command = (
+        f"cd {wing_path} && "
+        f"pvpython --no-mpi script_plot_mesh.py "
+        f"-mean_chord={mean_chord} "
+        f"-wing_span={wing_span}"
+    )
+
+    # the estimated cells calibrate estimate_run_cost with the actual cells of the mesh
     try:
-        # run in non-blocking mode
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
+        mesh_estimate = await loop.run_in_executor(
             None,
-            lambda: subprocess.run(["bash", "-c", bash_command], capture_output=True, text=True, check=True),
+            estimate_mesh_cells,
+            "wing",
+            mesh_tool,
+            0,
+            max_cell_size,
+            mesh_refinement_level,
+            n_boundary_layers,
+            mean_chord,
+            leading_edge_root,
+            leading_edge_tip,
         )
+    except (OSError, ValueError):
+        mesh_estimate = None
+
+    try:
+        # run in non-blocking mode
+        start_time = time.perf_counter()
+        await run_bash_stage(mesh_stage, bash_command)
+        mesh_time = time.perf_counter() - start_time
+        if mesh_cores > 1:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(
+                None, write_boundary_vtp, wing_path, ["wing", "sym"], f"{wing_path}/VTK/wings_0/boundary.vtp"
+            )
+        await run_bash_stage("pvpython", plot_command)
 
         # Parse mesh statistics from log_mesh.txt
         log_file_path = f"{wing_path}/log_mesh.txt"
         mesh_stats = parse_mesh_statistics(log_file_path)
+        estimated_cells = ""
+        if mesh_estimate is not None:
+            record_mesh_history(
+                "wing", mesh_tool, mesh_stats["cells"], mesh_estimate["estimated_cells"], mesh_time, mesh_cores
+            )
+            estimated_cells = f" (estimated before the run: {mesh_estimate['cells']:,.0f})"
 
         # Create HTML wrapper using multi-image function
         output_filename = "wing_mesh_all_views"
@@ -843,15 +1528,18 @@ async def wing_generate_mesh(
 
         trame_viewer = await wing_view_geometry_mesh(mode="mesh", mean_chord=mean_chord, wing_span=wing_span)
 
-        return (
-            "Wing mesh is successfully generated!\n\n"
-            f"Mesh Statistics:\n"
-            f"  - Number of mesh cells: {mesh_stats['cells']}\n"
-            f"  - Mesh max non-orthogonality: {mesh_stats['max_non_orthogonality']:.2f}°\n"
-            f"  - Mesh max skewness: {mesh_stats['max_skewness']:.2f}\n\n"
-            f"View the mesh at: http://localhost:8001/wing/{output_filename}.html \n"
-            f"Combined PNG path:{wing_path}/plots/{output_filename}.png \n"
-            f"Interactive 3D viewer: {trame_viewer}"
+        return tool_result(
+            (
+                "Wing mesh is successfully generated!\n\n"
+                f"Mesh Statistics:\n"
+                f"  - Number of mesh cells: {mesh_stats['cells']}{estimated_cells}\n"
+                f"  - Mesh max non-orthogonality: {mesh_stats['max_non_orthogonality']:.2f}°\n"
+                f"  - Mesh max skewness: {mesh_stats['max_skewness']:.2f}\n\n"
+                f"View the mesh at: http://localhost:8001/wing/{output_filename}.html \n"
+                f"Combined PNG path:{wing_path}/plots/{output_filename}.png \n"
+                f"Interactive 3D viewer: {trame_viewer}"
+            ),
+            f"{wing_path}/plots/{output_filename}.png",
         )
 
     except subprocess.CalledProcessError as e:
@@ -859,6 +1547,7 @@ async def wing_generate_mesh(
 
 
 @mcp.tool()
+@instrument_tool
 async def wing_run_cfd_simulation(
     cpu_cores: int = 1,
     angle_of_attack: float = 2,
@@ -881,7 +1570,8 @@ async def wing_run_cfd_simulation(
         cpu_cores:
             The number of CPU cores to use. We should use 1 core for < 100,000 mesh cells,
             and use one more core for every 100,000 more cells. DO NOT use more cores than
-            the system has.
+            the system has. Use the cpu_cores of wing_generate_mesh if it ran snappyHexMesh in parallel,
+            so the decomposed mesh is used as is (otherwise the mesh is decomposed again).
         angle_of_attack:
             The angle of attack (aoa) boundary condition at the far field.
         mach_number:
@@ -913,6 +1603,13 @@ async def wing_run_cfd_simulation(
         A message indicating how the cfd simulation was started and where progress is written
     """
 
+    # check before touching the case files, which a running job still uses
+    if case_busy(wing_path):
+        return (
+            "Error: a cfd simulation or optimization is already running in the wing module. "
+            "Use mcp_check_run_status to check if it's finished."
+        )
+
     if mach_number < 0.6:
         os.system(f"cp -r {wing_path}/system/fvSolution_subsonic {wing_path}/system/fvSolution")
     else:
@@ -920,7 +1617,8 @@ async def wing_run_cfd_simulation(
 
     bash_command = (
         f"cd {wing_path} && "
-        f"rm -rf .dafoam_run_finished && "
+        f"rm -rf .dafoam_run_finished .dafoam_reconstructed && "
+        f"{mesh_decomposition_command(wing_path, cpu_cores)}"
         f"mpirun -np {cpu_cores} python script_run_dafoam.py -task=run_model "
         f"-angle_of_attack={angle_of_attack} "
         f"-mach_number={mach_number} "
@@ -933,28 +1631,25 @@ async def wing_run_cfd_simulation(
         f"-primal_func_std_tol={primal_func_std_tol} > log_cfd_simulation.txt 2>&1"
     )
 
-    if run_on_hpc:
-        return submit_to_hpc(bash_command, wing_path)
-
     try:
+        set_write_format(wing_path)
+        if run_on_hpc:
+            return submit_to_hpc(bash_command, wing_path)
+
         # Run in non-blocking background mode
-        subprocess.Popen(
-            ["bash", "-c", bash_command],
-            stdout=subprocess.DEVNULL,  # Don't let child write to our stdout
-            stderr=subprocess.DEVNULL,  # Don't let child write to our stderr
-            stdin=subprocess.DEVNULL,  # Don't let child read from our stdin
-        )
+        launch_background_job(bash_command, cpu_cores, wing_path, "cfd")
         return (
             "CFD simulation started in the background. "
             "Progress is being written to log_cfd_simulation.txt. "
             "Use mcp_check_run_status to check if it's finished."
-        )
+        ) + run_estimate_message(wing_path, "cfd", cpu_cores)
 
     except Exception as e:
         return f"Error starting CFD simulation: {str(e)}"
 
 
 @mcp.tool()
+@instrument_tool
 async def wing_run_optimization(
     cpu_cores: int = 1,
     angle_of_attack: float = 2,
@@ -979,7 +1674,8 @@ async def wing_run_optimization(
         cpu_cores:
             The number of CPU cores to use. We should use 1 core for < 100,000 mesh cells,
             and use one more core for every 100,000 more cells. DO NOT use more cores than
-            the system has.
+            the system has. Use the cpu_cores of wing_generate_mesh if it ran snappyHexMesh in parallel,
+            so the decomposed mesh is used as is (otherwise the mesh is decomposed again).
         angle_of_attack:
             The angle of attack (aoa) boundary condition at the far field.
         mach_number:
@@ -1015,6 +1711,13 @@ async def wing_run_optimization(
         A message indicating how the optimization was started and where progress is written
     """
 
+    # check before touching the case files, which a running job still uses
+    if case_busy(wing_path):
+        return (
+            "Error: a cfd simulation or optimization is already running in the wing module. "
+            "Use mcp_check_run_status to check if it's finished."
+        )
+
     if mach_number < 0.6:
         os.system(f"cp -r {wing_path}/system/fvSolution_subsonic {wing_path}/system/fvSolution")
     else:
@@ -1022,7 +1725,8 @@ async def wing_run_optimization(
 
     bash_command = (
         f"cd {wing_path} && "
-        f"rm -rf .dafoam_run_finished && "
+        f"rm -rf .dafoam_run_finished .dafoam_reconstructed && "
+        f"{mesh_decomposition_command(wing_path, cpu_cores)}"
         f"mpirun -np {cpu_cores} python script_run_dafoam.py -task=run_driver "
         f"-angle_of_attack={angle_of_attack} "
         f"-mach_number={mach_number} "
@@ -1037,42 +1741,46 @@ async def wing_run_optimization(
         f"-primal_func_std_tol={primal_func_std_tol} > log_optimization.txt 2>&1"
     )
 
-    if run_on_hpc:
-        return submit_to_hpc(bash_command, wing_path)
-
     try:
+        set_write_format(wing_path)
+        if run_on_hpc:
+            return submit_to_hpc(bash_command, wing_path)
+
         # Run in non-blocking background mode
-        subprocess.Popen(
-            ["bash", "-c", bash_command],
-            stdout=subprocess.DEVNULL,  # Don't let child write to our stdout
-            stderr=subprocess.DEVNULL,  # Don't let child write to our stderr
-            stdin=subprocess.DEVNULL,  # Don't let child read from our stdin
-        )
+        launch_background_job(bash_command, cpu_cores, wing_path, "optimization", max_opt_iters)
         return (
             "Optimization started in the background. "
             "Progress is being written to log_optimization.txt. "
             "Use mcp_check_run_status to check if it's finished."
-        )
+        ) + run_estimate_message(wing_path, "optimization", cpu_cores, max_opt_iters)
 
     except Exception as e:
         return f"Error starting optimization: {str(e)}"
 
 
 @mcp.tool()
-async def wing_view_geometry_mesh(mode: str = "geometry", mean_chord: float = 0.5, wing_span: float = 1.5):
+@instrument_tool
+async def wing_view_geometry_mesh(
+    mode: str = "geometry", mean_chord: float = 0.5, wing_span: float = 1.5, mach_number: float = 0.1
+):
     """
     Wing module:
-        Allow users to view detail wing geometry or mesh. The geometry and mesh must have been generated in wings
+        Allow users to view detail wing geometry or mesh in an interactive 3D viewer. The geometry and mesh must
+        have been generated in wings. mode="surface" shows the surface flow fields (p, Cp, U magnitude, and nut)
+        of the wing with a slider to scrub all time steps; the cfd simulation or optimization must have been done
 
     Inputs:
         mode:
-            which to view, "geometry" or "mesh"
+            which to view, "geometry", "mesh", or "surface"
         mean_chord:
             The average chord for the wing. NOTE: this value must be consistent with the averaged chords
             from the spanwise_chords args from the wing_generate_geometry function!
         wing_span:
             The span for the wing. NOTE: this value must be consistent with the spanwise_z args
             from the wing_generate_geometry function! wing_span = spanwise_z[-1] - spanwise_z[0]
+        mach_number:
+            The Mach number (Ma) to compute Cp for mode="surface". We should use the same mach number set in the
+            wing_run_cfd_simulation call.
 
     Outputs:
         Message indicating the status. Must show the HTML link in bold to users.
@@ -1086,71 +1794,147 @@ async def wing_view_geometry_mesh(mode: str = "geometry", mean_chord: float = 0.
         mesh_file = "constant/triSurface/wing.stl"
     elif mode == "mesh":
         mesh_file = "VTK/wings_0/boundary.vtp"
+    elif mode == "surface":
+        # the viewer reads the wing patch of the OpenFOAM case with foam_reader
+        mesh_file = "paraview.foam"
     else:
-        return "Error: mode must be either 'geometry' or 'mesh'."
+        return "Error: mode must be either 'geometry', 'mesh', or 'surface'."
 
-    # Start trame viewer with dynamic port allocation
-    result = start_trame_viewer(f"{wing_path}", mesh_file, focal_x, focal_z)
+    # Show the file in a trame viewer of the pool, with dynamic port allocation
+    result = await start_trame_viewer(f"{wing_path}", mesh_file, focal_x, focal_z, mach_number)
 
     return result
 
 
 @mcp.tool()
-async def wing_view_pressure_profile(
-    mach_number: float = 0.1,
-    time_step: int = -1,
-    wing_span: float = 3.0,
-    spanwise_chords: List[float] = [1.0, 1.0, 1.0],
-):
+@instrument_tool
+async def wing_export_web_viewer(mode: str = "geometry", mach_number: float = 0.1, time_step: int = -1):
     """
     Wing module:
-        Plot the pressure profile (distribution) at the 10%, 50%, and 90% of the wing span
+        Export the wing geometry, mesh, or surface pressure coefficient (Cp) as a compact quantized glTF file
+        and create a static 3D web viewer page for it. Unlike wing_view_geometry_mesh, the browser loads the
+        file directly from the HTTP file server, so any number of users can open it without a viewer process.
+        The glTF file is only exported again when the geometry, mesh, or flow field changes
 
     Inputs:
+        mode:
+            which to export, "geometry", "mesh", or "surface". The geometry and mesh must have been generated
+            in wings. mode="surface" needs a cfd simulation or optimization
         mach_number:
-            The Mach number (Ma). We should use the same mach number set in the
+            The Mach number (Ma) to compute Cp for mode="surface". We should use the same mach number set in the
             wing_run_cfd_simulation call.
         time_step:
-            which time step to view. The time_step is the time-step for cfd simulation or
-            optimization iteration for optimization. Default: -1 (all time steps)
-        wing_span:
-            The span for the wing. NOTE: this value must be consistent with the spanwise_z args
-            from the wing_generate_geometry function! wing_span = spanwise_z[-1] - spanwise_z[0]
-        spanwise_chords:
-            Airfoil chords for the 10%, 50%, and 90% of the spanwise location. Here spanwise_chords MUST be a 3D array.
-            NOTE: the array's value must be consistent with the spanwise_chords args from the wing_generate_geometry
-            function! If only the root and tip chords are set in wing_generate_geometry's spanwise_chords, we need to
-            use linear  interpolation to get the chord at 10%, 50%, and 90% of the span. We MUST recompute these
-            values instead of using the default.
+            which time step to export for mode="surface". The time_step is the time-step for cfd simulation or
+            optimization iteration for optimization. Default: -1 (the last time step)
+
     Outputs:
-        Message indicating the status. Must show the HTML link and the path to the combine PNG in bold to users.
+        Message indicating the status. Must show the HTML link in bold to users.
     """
 
-    bash_command = (
-        f"cd {wing_path} && "
-        f"pvpython --no-mpi script_plot_pressure_profile.py -mach_number={mach_number} "
-        f"-time_step={time_step} -wing_span={wing_span} "
-        f"-spanwise_chords {' '.join(map(str, spanwise_chords))} "
-    )
+    if mode not in ["geometry", "mesh", "surface"]:
+        return "Error: mode must be either 'geometry', 'mesh', or 'surface'."
+
+    time_name = None
+    if mode == "surface":
+        time_names = [time_name for time_name in foam_reader.list_times(wing_path) if float(time_name) > 0]
+        if not time_names:
+            return "Error: no flow field found for the wing module. Run a cfd simulation or optimization first."
+        if time_step == -1:
+            time_name = time_names[-1]
+        else:
+            matches = [time_name for time_name in time_names if abs(float(time_name) - time_step * 0.0001) < 1e-8]
+            if not matches:
+                return f"Error: time_step {time_step} not found. Available time steps: {', '.join(time_names)}"
+            time_name = matches[0]
 
     try:
         # run in non-blocking mode
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: subprocess.run(["bash", "-c", bash_command], capture_output=True, text=True, check=True),
+        glb_name, extras = await loop.run_in_executor(None, export_wing_gltf, mode, mach_number, time_name)
+        html_filename = f"wing_{mode}_viewer.html"
+        create_web_viewer_html(wing_path, f"web/{glb_name}", html_filename, extras)
+        size = os.path.getsize(f"{wing_path}/plots/web/{glb_name}")
+
+        return (
+            f"Wing {mode} web viewer successfully generated!\n\n"
+            f"View the result: http://localhost:{FILE_HTTP_PORT}/wing/{html_filename}\n"
+            f"glTF file ({size / 1024:.1f} KB): {wing_path}/plots/web/{glb_name}"
         )
 
-        # Create HTML wrapper using multi-image function
-        output_filename = "wing_pressure_profile"
+    except (OSError, ValueError) as e:
+        return f"Error exporting the wing {mode}: {str(e)}"
+
+
+@mcp.tool()
+@instrument_tool
+async def wing_view_pressure_profile(
+    mach_number: float = 0.1,
+    angle_of_attack: float = 2,
+    time_step: int = -1,
+    wing_span: float = 3.0,
+    span_stations: List[float] = [0.1, 0.5, 0.9],
+    n_load_stations: int = 20,
+):
+    """
+    Wing module:
+        Plot the pressure profile (distribution) at any span stations and the spanwise load distribution
+        (sectional lift, drag, and moment coefficients cl, cd, and cm from the surface pressure).
+        The chords are computed from the wing geometry.
+
+    Inputs:
+        mach_number:
+            The Mach number (Ma). We should use the same mach number set in the
+            wing_run_cfd_simulation call.
+        angle_of_attack:
+            The angle of attack in degree. We should use the same angle of attack set in the
+            wing_run_cfd_simulation call. It is used to compute the sectional lift and drag
+        time_step:
+            which time step to view. The time_step is the time-step for cfd simulation or
+            optimization iteration for optimization. Default: -1 (all time steps)
+        wing_span:
+            The span for the wing. NOTE: this value must be consistent with the spanwise_z args
+            from the wing_generate_geometry function! wing_span = spanwise_z[-1] - spanwise_z[0]
+        span_stations:
+            The span stations to plot the pressure profiles, as fractions of the wing span (0: root, 1: tip).
+            Default: 10%, 50%, and 90% of the span
+        n_load_stations:
+            The number of evenly spaced span stations to compute the spanwise load distribution.
+            All stations are cut in one pass, so using more stations costs little
+    Outputs:
+        Message indicating the status. Must show the HTML link and the path to the combine PNG in bold to users.
+    """
+
+    launcher, stage, n_ranks = render_launcher(wing_path)
+    bash_command = (
+        f"cd {wing_path} && "
+        f"{launcher} script_plot_pressure_profile.py -mach_number={mach_number} "
+        f"-angle_of_attack={angle_of_attack} -time_step={time_step} -wing_span={wing_span} "
+        f"-span_stations {' '.join(map(str, span_stations))} -n_load_stations={n_load_stations}"
+    )
+
+    try:
+        # remove the profiles of the span stations of previous calls
+        for file in glob.glob(f"{wing_path}/plots/wing_pressure_profile_*.png"):
+            os.remove(file)
+
+        # run in non-blocking mode. An MPI-parallel render already uses n_ranks cores, so it runs as one worker
+        max_workers = 1 if n_ranks > 1 else n_render_workers
+        await run_render_workers(wing_path, bash_command, time_step, "wing_pressure_profile", stage, max_workers)
+
+        # Create HTML wrapper using multi-image function
+        output_filename = "wing_pressure_profile"
         image_names = glob.glob(f"{wing_path}/plots/wing_pressure_profile*.png")
         create_image_html(wing_path, sorted(image_names, reverse=True), output_filename + ".html")
         combine_pngs(wing_path, sorted(image_names, reverse=True), output_filename + ".png")
 
-        return (
-            "Pressure profile successfully generated!\n\n"
-            f"View the result: http://localhost:{FILE_HTTP_PORT}/wing/{output_filename}.html\n"
-            f"Combined PNG path: {wing_path}/plots/{output_filename}.png"
+        return tool_result(
+            (
+                "Pressure profile and spanwise load distribution successfully generated!\n\n"
+                f"View the result: http://localhost:{FILE_HTTP_PORT}/wing/{output_filename}.html\n"
+                f"Combined PNG path: {wing_path}/plots/{output_filename}.png\n"
+                f"Spanwise loads (CSV): {wing_path}/plots/wing_spanwise_load_*.csv"
+            ),
+            f"{wing_path}/plots/{output_filename}.png",
         )
 
     except subprocess.CalledProcessError as e:
@@ -1158,7 +1942,10 @@ async def wing_view_pressure_profile(
 
 
 @mcp.tool()
-async def wing_view_flow_field(mean_chord: float = 1.0, wing_span: float = 3.0, flow_field: str = "p"):
+@instrument_tool
+async def wing_view_flow_field(
+    mean_chord: float = 1.0, wing_span: float = 3.0, flow_field: str = "p", render_plan: List[dict] = []
+):
     """
     Wing module:
         Allow users to view the details of a selected flow field variable.
@@ -1174,35 +1961,46 @@ async def wing_view_flow_field(mean_chord: float = 1.0, wing_span: float = 3.0,
         flow_field:
             which flow field variable to visualize. Options are "U": velocity, "T": temperature,
             "p": pressure, "nut": turbulence viscosity (turbulence variable). Default: "p"
+        render_plan:
+            Optional list of views to render in one pass, e.g., to view several flow fields at once. Each view
+            is a dict with any of the keys "flow_field" and "zoom_in_scale" (default: 0.4 * wing_span); missing
+            keys take the values of the arguments above. The case is loaded only once for all views.
+            Example: [{"flow_field": "p"}, {"flow_field": "U"}, {"flow_field": "nut"}]
 
     Outputs:
         Message indicating the status. Must show the HTML link and the path to the combine PNG in bold to users.
     """
 
+    launcher, stage, _ = render_launcher(wing_path)
     bash_command = (
         f"cd {wing_path} && "
-        f"pvpython --no-mpi script_plot_flow_field.py -mean_chord={mean_chord} -wing_span={wing_span} "
-        f"-flow_field={flow_field}"
+        f"{launcher} script_plot_flow_field.py -mean_chord={mean_chord} -wing_span={wing_span} "
+        f"-flow_field={shlex.quote(flow_field)}"
     )
 
     try:
         # run in non-blocking mode
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: subprocess.run(["bash", "-c", bash_command], capture_output=True, text=True, check=True),
-        )
+        # the plan frames have their own prefix, so they never mix with the frames of a call without a plan
+        if render_plan:
+            frame_prefix = "wing_flow_plan"
+            await run_render_plan(wing_path, bash_command, render_plan, frame_prefix, stage)
+        else:
+            frame_prefix = "wing_flow_field"
+            await run_bash_stage(stage, bash_command)
 
         # Create HTML wrapper using multi-image function
         output_filename = "wing_flow_field"
-        image_names = glob.glob(f"{wing_path}/plots/wing_flow_field*.png")
+        image_names = glob.glob(f"{wing_path}/plots/{frame_prefix}_*.png")
         create_image_html(wing_path, sorted(image_names, reverse=True), output_filename + ".html")
         combine_pngs(wing_path, sorted(image_names, reverse=True), output_filename + ".png")
 
-        return (
-            "Flow field plots successfully generated!\n\n"
-            f"View convergence: http://localhost:{FILE_HTTP_PORT}/wing/{output_filename}.html\n"
-            f"Combined PNG path: {wing_path}/plots/{output_filename}.png"
+        return tool_result(
+            (
+                "Flow field plots successfully generated!\n\n"
+                f"View convergence: http://localhost:{FILE_HTTP_PORT}/wing/{output_filename}.html\n"
+                f"Combined PNG path: {wing_path}/plots/{output_filename}.png"
+            ),
+            f"{wing_path}/plots/{output_filename}.png",
         )
 
     except subprocess.CalledProcessError as e:
@@ -1210,6 +2008,1040 @@ async def wing_view_flow_field(mean_chord: float = 1.0, wing_span: float = 3.0,
 
 
 # helper functions
+async def run_bash_stage(stage: str, bash_command: str) -> subprocess.CompletedProcess:
+    """
+    Run a bash command in a worker thread so that it does not block the MCP event loop,
+    and record its wall time in METRICS under the given stage label.
+
+    Args:
+        stage: The stage label, such as "pyHyp", "snappyHexMesh", "cartesianMesh", or "pvpython"
+        bash_command: The bash command to execute
+
+    Returns:
+        The completed process. Raises subprocess.CalledProcessError if the command fails
+    """
+    with span(f"stage:{stage}", command=bash_command):
+        # pass the current span to the subprocess so that its spans are nested under this stage
+        env = subprocess_env()
+        METRICS.inc("dafoam_stage_queue_depth")
+
+        def run():
+            METRICS.inc("dafoam_stage_queue_depth", value=-1)
+            start_time = time.perf_counter()
+            try:
+                return subprocess.run(["bash", "-c", bash_command], capture_output=True, text=True, check=True, env=env)
+            finally:
+                METRICS.observe("dafoam_stage_seconds", {"stage": stage}, time.perf_counter() - start_time)
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, run)
+
+
+async def run_render_workers(
+    case_path: str,
+    bash_command: str,
+    time_step: int,
+    frame_prefix: str,
+    stage: str = "pvpython",
+    max_workers: int = None,
+):
+    """
+    Run a pvpython (or python) plotting command. For time_step=-1, only the time steps that are not in the render
+    cache are rendered, split across up to n_render_workers concurrent pvpython processes; each one
+    renders every n_workers-th missing time step. The output files are named by iteration, so the
+    merged output keeps the iteration order.
+
+    Args:
+        case_path: Path to the case directory (airfoil_path or wing_path)
+        bash_command: The pvpython command, which must accept -worker_rank, -n_workers, and -time_values
+        time_step: The time step to plot. -1 means all time steps
+        frame_prefix: The output file prefix, e.g., "airfoil_flow_field" for plots/airfoil_flow_field_0001.png
+        stage: The stage label of the command, "pvpython" or "python" for the scripts that use foam_reader
+        max_workers: The maximal number of concurrent workers. Default: n_render_workers
+    """
+    if time_step != -1:
+        await run_bash_stage(stage, bash_command)
+        return
+
+    # copy the cached frames to plots and find the time steps to render
+    missing = {}
+    for time_value in list_time_steps(case_path):
+        frame_key = render_cache_key(case_path, bash_command, time_value)
+        if restore_cached_frame(case_path, frame_key):
+            METRICS.inc("dafoam_cache_requests_total", {"cache": "render_frames", "result": "hit"})
+        else:
+            METRICS.inc("dafoam_cache_requests_total", {"cache": "render_frames", "result": "miss"})
+            missing[time_value] = frame_key
+    if not missing:
+        return
+
+    bash_command += f" -time_values {' '.join(map(repr, missing))}"
+    n_workers = min(max_workers or n_render_workers, len(missing))
+    if n_workers == 1:
+        await run_bash_stage(stage, bash_command)
+    else:
+        await asyncio.gather(
+            *[
+                run_bash_stage(stage, f"{bash_command} -worker_rank={rank} -n_workers={n_workers}")
+                for rank in range(n_workers)
+            ]
+        )
+
+    for time_value, frame_key in missing.items():
+        store_cached_frame(case_path, frame_prefix, time_value, frame_key)
+
+
+async def run_render_plan(
+    case_path: str, bash_command: str, render_plan: List[dict], frame_prefix: str, stage: str = "pvpython"
+):
+    """
+    Render all views of a render plan in a single pvpython pass, so the case is loaded only once.
+    The previous plots with the same prefix are removed, so the outputs only show the views of the plan.
+
+    Args:
+        case_path: Path to the case directory (airfoil_path or wing_path)
+        bash_command: The pvpython command, which must accept -render_plan
+        render_plan: The list of views. Each view is a dict of the plotting script arguments
+        frame_prefix: The output file prefix of the plan frames, e.g., "airfoil_flow_plan"
+        stage: The stage label of the command, "pvpython" or "pvbatch" (see render_launcher)
+    """
+    for file in glob.glob(f"{case_path}/plots/{frame_prefix}_*.png"):
+        os.remove(file)
+
+    plan_file = f"{case_path}/plots/{frame_prefix}_render_plan.json"
+    with open(plan_file, "w") as f:
+        json.dump(render_plan, f)
+    await run_bash_stage(stage, f"{bash_command} -render_plan={plan_file}")
+
+
+def render_launcher(case_path: str):
+    """
+    Choose how to run a ParaView plotting script. Decomposed cases with more than cells_per_render_rank
+    mesh cells (from log_mesh.txt) are rendered with MPI-parallel pvbatch, one rank per
+    cells_per_render_rank cells and at most one rank per processor* directory
+
+    Args:
+        case_path: Path to the case directory (airfoil_path or wing_path)
+
+    Returns:
+        The launcher command (e.g., "mpirun -np 4 pvbatch" or "pvpython --no-mpi"), the stage label
+        ("pvbatch" or "pvpython"), and the number of ranks
+    """
+    n_processors = len(foam_reader.processor_dirs(case_path))
+    cells = 0
+    if cells_per_render_rank > 0 and n_processors > 1 and os.path.exists(f"{case_path}/log_mesh.txt"):
+        cells = parse_mesh_statistics(f"{case_path}/log_mesh.txt")["cells"]
+
+    n_ranks = min(-(-cells // cells_per_render_rank), n_processors) if cells else 1
+    if n_ranks > 1:
+        return f"mpirun -np {n_ranks} pvbatch", "pvbatch", n_ranks
+    return "pvpython --no-mpi", "pvpython", 1
+
+
+def frame_files(case_path: str, frame_prefix: str, time_value: float) -> List[str]:
+    """Return the plot files of one frame, named by iteration the same way as the plotting scripts"""
+    if time_value < 1.0:
+        iterI = "%04d" % round(time_value * 10000)
+    else:
+        iterI = "Final"
+    return glob.glob(f"{case_path}/plots/{frame_prefix}_{iterI}.png") + glob.glob(
+        f"{case_path}/plots/{frame_prefix}_{iterI}_*.png"
+    )
+
+
+def render_cache_key(case_path: str, bash_command: str, time_value: float) -> str:
+    """
+    Return the render cache key of a frame. It hashes the plotting command (field, camera, and other view
+    arguments), the size and modification time of the plotting script (image quality), the mesh, and
+    the files of the time step, so frames are re-rendered when the solver rewrites a time step.
+
+    Args:
+        case_path: Path to the case directory (airfoil_path or wing_path)
+        bash_command: The plotting command without the worker arguments
+        time_value: The time value of the frame
+    """
+    files = [f"{case_path}/{script}" for script in re.findall(r"script_\w+\.py", bash_command)]
+    # hash the processor* directories of decomposed cases, even when reconstructPar has written the time
+    # step, so the frames rendered before and after the reconstruction share the key
+    for case_dir in foam_reader.processor_dirs(case_path) or [case_path]:
+        files += glob.glob(f"{case_dir}/constant/polyMesh/*")
+        for name in os.listdir(case_dir):
+            try:
+                if float(name) == time_value:
+                    files += glob.glob(f"{case_dir}/{name}/**", recursive=True)
+            except ValueError:
+                continue
+
+    key = hashlib.sha1(f"{bash_command}\n{time_value!r}".encode())
+    for file in sorted(files):
+        stat = os.stat(file)
+        key.update(f"\n{file} {stat.st_size} {stat.st_mtime_ns}".encode())
+    return key.hexdigest()
+
+
+def restore_cached_frame(case_path: str, frame_key: str) -> bool:
+    """Copy a cached frame to the plots folder. Returns False if it is not in the render cache"""
+    cache_path = f"{case_path}/plots/render_cache/{frame_key}"
+    if not os.path.isdir(cache_path) or not os.listdir(cache_path):
+        return False
+    for file in os.listdir(cache_path):
+        shutil.copyfile(f"{cache_path}/{file}", f"{case_path}/plots/{file}")
+    return True
+
+
+def store_cached_frame(case_path: str, frame_prefix: str, time_value: float, frame_key: str):
+    """Copy a newly rendered frame from the plots folder to the render cache"""
+    cache_path = f"{case_path}/plots/render_cache/{frame_key}"
+    os.makedirs(cache_path, exist_ok=True)
+    for file in frame_files(case_path, frame_prefix, time_value):
+        shutil.copyfile(file, f"{cache_path}/{os.path.basename(file)}")
+
+
+def list_time_steps(case_path: str) -> List[float]:
+    """
+    Return the sorted non-zero time step values written in a case, the same ones the
+    OpenFOAM reader shows. For decomposed cases, the time steps are read from processor0
+
+    Args:
+        case_path: Path to the case directory (airfoil_path or wing_path)
+    """
+    time_path = f"{case_path}/processor0" if os.path.exists(f"{case_path}/processor0") else case_path
+    time_steps = []
+    for name in os.listdir(time_path):
+        try:
+            time_value = float(name)
+        except ValueError:
+            continue
+        if time_value > 0 and os.path.isdir(f"{time_path}/{name}"):
+            time_steps.append(time_value)
+    return sorted(time_steps)
+
+
+@traced
+def compute_surface_loads(
+    case_path: str,
+    module: str,
+    time_name: str,
+    mach_number: float,
+    angle_of_attack: float,
+    reference_area: float,
+    moment_reference: List[float],
+    reference_chord: float,
+) -> dict:
+    """
+    Read p on the wing patch with foam_reader, write the Cp of each face to plots/{module}_surface_cp.csv,
+    and integrate the pressure loads. Uses the same reference values as the pressure profile scripts.
+
+    Args:
+        case_path: Path to the case directory (airfoil_path or wing_path)
+        module: "airfoil" or "wing"
+        time_name: The time directory to read
+        mach_number: The Mach number
+        angle_of_attack: The angle of attack in degree. The flow is in the x-y plane
+        reference_area: The reference area. A negative value means the projected area in the x-z plane
+        moment_reference: The point the moment is taken about (the quarter chord), e.g., [0.25, 0, 0] for the airfoil
+        reference_chord: The reference chord of the moment coefficient
+
+    Returns:
+        A dict with CL, CD, CM (about moment_reference and the z axis), reference_area, and n_faces
+    """
+    C0 = 347.2
+    U0 = mach_number * C0
+    rho0 = 1.1768
+    p0 = 101325.0
+    coeff = 0.5 * rho0 * U0 * U0
+
+    surface = foam_reader.read_patches(case_path, time_name, {"p": "scalar"}, ["wing"])
+    centres, areas, p = surface["centres"], surface["areas"], surface["p"]
+
+    cp = (p - p0) / coeff
+    np.savetxt(
+        f"{case_path}/plots/{module}_surface_cp.csv",
+        np.column_stack([centres, cp]),
+        delimiter=",",
+        header="x,y,z,cp",
+        comments="",
+    )
+
+    if reference_area <= 0:
+        # the upper and lower surfaces both project onto the x-z plane
+        reference_area = 0.5 * np.abs(areas[:, 1]).sum()
+    force, moment = foam_reader.integrate_pressure_loads(centres, areas, p, p0, moment_reference)
+    alpha = np.radians(angle_of_attack)
+    drag_direction = np.array([np.cos(alpha), np.sin(alpha), 0.0])
+    lift_direction = np.array([-np.sin(alpha), np.cos(alpha), 0.0])
+
+    return {
+        "CL": force @ lift_direction / (coeff * reference_area),
+        "CD": force @ drag_direction / (coeff * reference_area),
+        "CM": moment[2] / (coeff * reference_area * reference_chord),
+        "reference_area": reference_area,
+        "n_faces": len(p),
+    }
+
+
+@traced
+def assemble_wing_stl(case_path: str):
+    """
+    Relabel and merge the STL files of the IGES surfaces (wing0.stl - wing4.stl, written by script_iges2stl.py)
+    into the wing STL files in constant/triSurface: wing_upper.stl (wing0), wing_lower.stl (wing1), wing_te.stl
+    (wing2), wing_tip.stl (wing3 and wing4), wing_all_surfaces.stl (the four surfaces as separate solids), and
+    wing.stl (one solid of all surfaces). Each file is read and written once.
+
+    Args:
+        case_path: Path to the case directory (wing_path)
+
+    Returns:
+        The number of triangles of each wing surface
+    """
+
+    if wing_stl_format not in ["ascii", "binary"]:
+        raise ValueError(f"wing_stl_format must be 'ascii' or 'binary', not '{wing_stl_format}'")
+
+    with span("read_stl"):
+        # ASCII facets stay text, so they are only parsed if a binary file is written
+        surfaces = [
+            stl_io.merge_solids(stl_io.read_stl(f"{case_path}/wing{i}.stl", parse=False), f"wing{i}") for i in range(5)
+        ]
+
+    solids = [
+        ("wing_upper", surfaces[0][1]),
+        ("wing_lower", surfaces[1][1]),
+        ("wing_te", surfaces[2][1]),
+        stl_io.merge_solids(surfaces[3:], "wing_tip"),
+    ]
+
+    binary = wing_stl_format == "binary"
+    with span("write_stl", binary=binary):
+        stl_io.write_stl(f"{case_path}/constant/triSurface/wing_all_surfaces.stl", solids)
+        if binary:
+            # parse each surface once for all the binary files
+            solids = [(name, stl_io.triangles_of(facets)) for name, facets in solids]
+        for name, facets in solids:
+            stl_io.write_stl(f"{case_path}/constant/triSurface/{name}.stl", [(name, facets)], binary)
+        stl_io.write_stl(f"{case_path}/constant/triSurface/wing.stl", [stl_io.merge_solids(solids, "wing")], binary)
+
+    for i in range(5):
+        os.remove(f"{case_path}/wing{i}.stl")
+
+    return {name: stl_io.count_facets(facets) for name, facets in solids}
+
+
+@traced
+def export_wing_gltf(mode: str, mach_number: float, time_name: str = None):
+    """
+    Export the wing geometry (constant/triSurface/wing.stl), the wing patch faces and edges of the mesh, or the
+    wing patch colored by Cp at one time step to a quantized glTF file in wings/plots/web. The file name has a
+    fingerprint of the source files, so an existing file is reused and older files of the mode are removed.
+
+    Args:
+        mode: "geometry", "mesh", or "surface"
+        mach_number: The Mach number to compute Cp for mode="surface"
+        time_name: The time directory to read for mode="surface"
+
+    Returns:
+        The glTF file name and the extras (title, field name and range) for the viewer page
+    """
+
+    if mode == "geometry":
+        source_files = [f"{wing_path}/constant/triSurface/wing.stl"]
+    else:
+        # the reconstructed case is read instead of the processor* directories when it has the time step
+        time_names = [time_name] if time_name else None
+        fields = ["p"] if time_name else None
+        source_files = []
+        for case_dir in foam_reader.case_dirs(wing_path, time_names, fields):
+            source_files += sorted(glob.glob(f"{case_dir}/constant/polyMesh/*"))
+            if time_name:
+                source_files += sorted(glob.glob(f"{case_dir}/{time_name}/polyMesh/points*"))
+                source_files += sorted(glob.glob(f"{case_dir}/{time_name}/p")) + glob.glob(
+                    f"{case_dir}/{time_name}/p.gz"
+                )
+
+    sha = hashlib.sha1(f"{mode}:{mach_number}:{time_name}".encode())
+    for file in source_files:
+        stat = os.stat(file)
+        sha.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    glb_name = f"wing_{mode}_{sha.hexdigest()[:16]}.glb"
+    glb_path = f"{wing_path}/plots/web/{glb_name}"
+
+    extras = {"title": f"Wing {mode}"}
+    if mode == "surface":
+        if time_name and float(time_name) < 1.0:
+            iterI = "%04d" % round(float(time_name) * 10000)
+        else:
+            iterI = "Final"
+        extras["title"] = f"Wing surface Cp. Iteration = {iterI}. Mach = {mach_number}"
+
+    if os.path.exists(glb_path):
+        return glb_name, gltf_export.read_glb_json(glb_path)["scenes"][0]["extras"]
+
+    if mode == "geometry":
+        with span("read_stl"):
+            solids = stl_io.read_stl(source_files[0])
+            points, triangles = gltf_export.merge_vertices(np.concatenate([facets for _, facets in solids]))
+        lines = None
+        point_values = None
+    else:
+        topology = foam_reader.read_patch_topology(wing_path, ["wing"], time_names, fields)
+        if not topology:
+            raise ValueError("No wing patch found. Generate the wing mesh first")
+
+        # the points used by the wing faces, concatenated over the processors
+        points = []
+        triangles = []
+        edges = []
+        offsets = []
+        labels = []
+        n_points = 0
+        for entry, entry_points in zip(topology, foam_reader.read_patch_points(topology, time_name or "constant")):
+            for name in entry["patches"]:
+                face_offsets, face_labels = entry["faces"][name]
+                used, local = np.unique(face_labels, return_inverse=True)
+                local = local.reshape(-1) + n_points
+                points.append(entry_points[used])
+                triangles.append(gltf_export.triangulate(face_offsets, local))
+                edges.append(gltf_export.face_edges(face_offsets, local))
+                offsets.append(face_offsets[1:] + (offsets[-1][-1] if offsets else 0))
+                labels.append(local)
+                n_points += len(used)
+        points = np.concatenate(points)
+        triangles = np.concatenate(triangles)
+
+        lines = np.concatenate(edges) if mode == "mesh" else None
+        point_values = None
+        if mode == "surface":
+            C0 = 347.2
+            U0 = mach_number * C0
+            rho0 = 1.1768
+            p0 = 101325.0
+            coeff = 0.5 * rho0 * U0 * U0
+
+            cp = (foam_reader.read_patch_values(topology, time_name, "p") - p0) / coeff
+            offsets = np.concatenate([np.zeros(1, dtype=np.int64)] + offsets)
+            point_values = gltf_export.face_to_point_values(offsets, np.concatenate(labels), cp, n_points)
+            extras.update({"field": "Cp", "min": float(cp.min()), "max": float(cp.max())})
+
+    # write to a temporary file first so the HTTP server never serves a partial file
+    os.makedirs(f"{wing_path}/plots/web", exist_ok=True)
+    with span("write_glb", mode=mode, n_points=len(points)):
+        tmp_path = f"{glb_path}.{os.getpid()}.tmp"
+        value_range = (extras["min"], extras["max"]) if point_values is not None else None
+        gltf_export.write_glb(tmp_path, points, triangles, lines, point_values, value_range, extras)
+        os.replace(tmp_path, glb_path)
+
+    for file in glob.glob(f"{wing_path}/plots/web/wing_{mode}_*.glb"):
+        if file != glb_path:
+            os.remove(file)
+
+    return glb_name, extras
+
+
+@traced
+def write_boundary_vtp(case_path: str, patch_names: List[str], vtp_path: str):
+    """
+    Write patches of the mesh (the processor* directories of a decomposed mesh) to a VTK XML PolyData file,
+    like foamToVTK -one-boundary does for the reconstructed mesh. The arrays are appended as raw binary data
+
+    Args:
+        case_path: Path to the case directory
+        patch_names: The patches to write, e.g., ["wing", "sym"]
+        vtp_path: The .vtp file
+    """
+
+    topology = foam_reader.read_patch_topology(case_path, patch_names)
+    points = []
+    offsets = []
+    connectivity = []
+    n_points = 0
+    n_labels = 0
+    for entry, entry_points in zip(topology, foam_reader.read_patch_points(topology, "constant")):
+        for name in entry["patches"]:
+            face_offsets, labels = entry["faces"][name]
+            used, local = np.unique(labels, return_inverse=True)
+            points.append(entry_points[used])
+            connectivity.append(local.reshape(-1) + n_points)
+            # VTK stores the end of each face
+            offsets.append(face_offsets[1:] + n_labels)
+            n_points += len(used)
+            n_labels += len(labels)
+
+    arrays = [
+        np.concatenate(points).astype("<f4"),
+        np.concatenate(connectivity).astype("<i8"),
+        np.concatenate(offsets).astype("<i8"),
+    ]
+    positions = np.cumsum([0] + [8 + array.nbytes for array in arrays])
+    header = (
+        '<?xml version="1.0"?>\n'
+        '<VTKFile type="PolyData" version="1.0" byte_order="LittleEndian" header_type="UInt64">\n'
+        "  <PolyData>\n"
+        f'    <Piece NumberOfPoints="{n_points}" NumberOfVerts="0" NumberOfLines="0" NumberOfStrips="0" '
+        f'NumberOfPolys="{len(arrays[2])}">\n'
+        "      <Points>\n"
+        f'        <DataArray type="Float32" NumberOfComponents="3" format="appended" offset="{positions[0]}"/>\n'
+        "      </Points>\n"
+        "      <Polys>\n"
+        f'        <DataArray type="Int64" Name="connectivity" format="appended" offset="{positions[1]}"/>\n'
+        f'        <DataArray type="Int64" Name="offsets" format="appended" offset="{positions[2]}"/>\n'
+        "      </Polys>\n"
+        "    </Piece>\n"
+        "  </PolyData>\n"
+        '  <AppendedData encoding="raw">\n'
+        "_"
+    )
+
+    os.makedirs(os.path.dirname(vtp_path), exist_ok=True)
+    tmp_path = f"{vtp_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header.encode())
+        for array in arrays:
+            f.write(np.uint64(array.nbytes).tobytes())
+            f.write(array.tobytes())
+        f.write(b"\n  </AppendedData>\n</VTKFile>\n")
+    os.replace(tmp_path, vtp_path)
+
+
+def mesh_decomposition_command(case_path: str, cpu_cores: int) -> str:
+    """
+    Return the commands that prepare a mesh decomposed by the parallel snappyHexMesh for a run on cpu_cores.
+    A mesh decomposed for cpu_cores goes to the run as is ("" if the mesh is not decomposed). Otherwise, the
+    processor* directories are removed so that the run decomposes constant/polyMesh again; a mesh that only
+    exists in the processor* directories is reconstructed with reconstructParMesh first
+    """
+    n_processors = len(foam_reader.processor_dirs(case_path))
+    if not n_processors or n_processors == cpu_cores:
+        return ""
+    command = "rm -rf processor* && "
+    if not os.path.exists(f"{case_path}/constant/polyMesh"):
+        command = "reconstructParMesh -constant > log_reconstruct_mesh.txt 2>&1 && " + command
+    return command
+
+
+def set_write_format(case_path: str):
+    """
+    Set writeFormat and writeCompression in system/controlDict from write_format and write_compression
+
+    Args:
+        case_path: Path to the case directory (airfoil_path or wing_path)
+    """
+    if write_format not in ("ascii", "binary") or write_compression not in ("on", "off"):
+        raise ValueError("write_format must be 'ascii' or 'binary' and write_compression must be 'on' or 'off'")
+
+    control_dict = f"{case_path}/system/controlDict"
+    with open(control_dict) as f:
+        content = f.read()
+    content = re.sub(r"^writeFormat\s+\w+;", f"writeFormat     {write_format};", content, flags=re.M)
+    content = re.sub(r"^writeCompression\s+\w+;", f"writeCompression {write_compression};", content, flags=re.M)
+    with open(control_dict, "w") as f:
+        f.write(content)
+
+
+# The watcher thread of the latest background job launched in each case directory, keyed by case path. The
+# watcher holds the case until the job has exited and its history, metrics, and reconstructPar are done
+running_jobs = {}
+
+
+def case_busy(case_path: str) -> bool:
+    """Return True if a background job is running in case_path. Check it before changing the case files"""
+    watcher = running_jobs.get(case_path)
+    return watcher is not None and watcher.is_alive()
+
+
+def launch_background_job(
+    bash_command: str, cpu_cores: int, case_path: str, run_type: str, max_opt_iters: int = None
+) -> subprocess.Popen:
+    """
+    Launch a CFD simulation or optimization in the background, track it in METRICS until it exits,
+    and periodically sample the CPU, memory, and I/O usage of its MPI ranks into the run metadata
+    file .dafoam_run_metadata.json in case_path. The finished run is appended to run_history_file.
+
+    Args:
+        bash_command: The bash command to execute, typically an mpirun call
+        cpu_cores: The number of CPU cores used by the job
+        case_path: Path to the case directory (airfoil_path or wing_path)
+        run_type: "cfd" or "optimization"
+        max_opt_iters: The maximum number of optimization iterations, recorded in the history of an optimization
+
+    Returns:
+        The Popen object of the launched job. Raises RuntimeError if a job is already running in case_path
+    """
+    if reconstruct_times not in ("all", "latest"):
+        raise ValueError("reconstruct_times must be 'all' or 'latest'")
+
+    # background jobs are shared by all MCP sessions; only one job can run in a case directory
+    if case_busy(case_path):
+        raise RuntimeError(f"a cfd simulation or optimization is already running in {case_path}")
+
+    process = subprocess.Popen(
+        ["bash", "-c", bash_command],
+        stdout=subprocess.DEVNULL,  # Don't let child write to our stdout
+        stderr=subprocess.DEVNULL,  # Don't let child write to our stderr
+        stdin=subprocess.DEVNULL,  # Don't let child read from our stdin
+    )
+    METRICS.inc("dafoam_jobs_running")
+    METRICS.inc("dafoam_cores_in_use", value=cpu_cores)
+    start_time = time.perf_counter()
+
+    metadata = {
+        "module": "airfoil" if case_path == airfoil_path else "wing",
+        "run_type": run_type,
+        "command": bash_command,
+        "cpu_cores": cpu_cores,
+        "cells": 0,
+        "start_time": time.time(),
+        "end_time": None,
+        "wall_time": 0.0,
+        "return_code": None,
+        "ranks": {},
+    }
+    if max_opt_iters is not None:
+        metadata["max_opt_iters"] = max_opt_iters
+
+    if os.path.exists(f"{case_path}/log_mesh.txt"):
+        metadata["cells"] = parse_mesh_statistics(f"{case_path}/log_mesh.txt")["cells"]
+
+    def watch():
+        rank_usage = {}
+        while process.poll() is None:
+            sample_rank_usage(process.pid, rank_usage)
+            metadata["wall_time"] = time.perf_counter() - start_time
+            write_run_metadata(case_path, metadata, rank_usage)
+            # wake up as soon as the job exits, so the case is released without delay
+            try:
+                process.wait(timeout=resource_sample_interval)
+            except subprocess.TimeoutExpired:
+                pass
+        metadata["wall_time"] = time.perf_counter() - start_time
+        metadata["end_time"] = time.time()
+        metadata["return_code"] = process.returncode
+        write_run_metadata(case_path, metadata, rank_usage)
+        record_run_history(metadata)
+        METRICS.observe("dafoam_stage_seconds", {"stage": "mpirun"}, metadata["wall_time"])
+        METRICS.inc("dafoam_jobs_running", value=-1)
+        METRICS.inc("dafoam_cores_in_use", value=-cpu_cores)
+
+        if reconstruct_after_run and cpu_cores > 1 and process.returncode == 0:
+            reconstruct_case(case_path)
+
+    # registered before it starts, so the case stays busy from the launch to the end of reconstructPar
+    watcher = threading.Thread(target=watch, daemon=True)
+    running_jobs[case_path] = watcher
+    watcher.start()
+
+    return process
+
+
+def reconstruct_case(case_path: str):
+    """
+    Run reconstructPar for the time steps and fields set by reconstruct_times and reconstruct_fields, then
+    write the foam_reader.reconstructed_flag file listing them, so the plotting scripts and foam_reader read
+    the case directory instead of the processor* directories. It runs in the watcher thread of the finished job,
+    which holds the case in running_jobs, so no new job can rewrite the processor* directories while it reads them.
+
+    Args:
+        case_path: Path to the case directory (airfoil_path or wing_path)
+    """
+    processors = foam_reader.processor_dirs(case_path)
+    if not processors:
+        return
+    time_names = [time_name for time_name in foam_reader.time_dir_names(processors[0]) if float(time_name) > 0]
+    if reconstruct_times == "latest":
+        time_names = time_names[-1:]
+    if not time_names:
+        return
+
+    # the case directory only has time steps reconstructed after an earlier parallel run, remove them
+    for time_name in foam_reader.time_dir_names(case_path):
+        if float(time_name) > 0:
+            shutil.rmtree(f"{case_path}/{time_name}", ignore_errors=True)
+
+    # the parallel snappyHexMesh leaves only the decomposed mesh, which reconstructPar needs reconstructed
+    bash_command = f"cd {case_path} && "
+    if not os.path.exists(f"{case_path}/constant/polyMesh"):
+        bash_command += "reconstructParMesh -constant > log_reconstruct_mesh.txt 2>&1 && "
+    bash_command += "reconstructPar"
+    if reconstruct_times == "latest":
+        bash_command += " -latestTime"
+    if reconstruct_fields:
+        bash_command += f" -fields '({' '.join(reconstruct_fields)})'"
+    bash_command += " > log_reconstruct.txt 2>&1"
+
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        ["bash", "-c", bash_command],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        stdin=subprocess.DEVNULL,
+    )
+    process.wait()
+    METRICS.observe("dafoam_stage_seconds", {"stage": "reconstructPar"}, time.perf_counter() - start_time)
+
+    if process.returncode == 0:
+        with open(f"{case_path}/{foam_reader.reconstructed_flag}", "w") as f:
+            json.dump({"times": time_names, "fields": reconstruct_fields}, f)
+
+
+def sample_rank_usage(root_pid: int, rank_usage: dict):
+    """
+    Walk the process tree under root_pid through /proc and update rank_usage with the CPU time,
+    RSS, and read/write bytes of every MPI rank (a python process running script_run_dafoam.py).
+
+    Args:
+        root_pid: The pid of the bash process that launched mpirun
+        rank_usage: Dictionary keyed by rank that is updated in place. Each value holds the latest
+            cpu_time, rss, read_bytes, and write_bytes, plus peak_rss and the first/last sample times.
+            The peak of the summed RSS of all ranks is stored under "peak_total_rss"
+    """
+
+    clock_ticks = os.sysconf("SC_CLK_TCK")
+    page_size = os.sysconf("SC_PAGE_SIZE")
+
+    # build the parent -> children map for all processes
+    children = {}
+    for stat_file in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat_file) as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(stat_file.split("/")[2]))
+        except (OSError, IndexError, ValueError):
+            continue
+
+    # collect all descendants of root_pid
+    descendants = []
+    stack = [root_pid]
+    while stack:
+        pid = stack.pop()
+        descendants.append(pid)
+        stack.extend(children.get(pid, []))
+
+    now = time.time()
+    total_rss = 0
+    for pid in descendants:
+        try:
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                argv = f.read().decode(errors="ignore").split("\0")
+            if "python" not in os.path.basename(argv[0]) or "script_run_dafoam.py" not in argv:
+                continue
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{pid}/environ", "rb") as f:
+                environ = dict(item.split(b"=", 1) for item in f.read().split(b"\0") if b"=" in item)
+            io = {}
+            if os.access(f"/proc/{pid}/io", os.R_OK):
+                with open(f"/proc/{pid}/io") as f:
+                    io = dict((k, int(v)) for k, v in (line.split(":") for line in f if ":" in line))
+        except (OSError, ValueError):
+            continue  # the process exited between listing and reading
+
+        rank = int(environ.get(b"OMPI_COMM_WORLD_RANK", environ.get(b"PMI_RANK", str(pid).encode())))
+        # stat fields after the command name: utime=11, stime=12, rss=21 (0-based)
+        cpu_time = (int(fields[11]) + int(fields[12])) / clock_ticks
+        rss = int(fields[21]) * page_size
+        usage = rank_usage.setdefault(rank, {"pid": pid, "first_sample": now, "first_cpu_time": cpu_time})
+        usage.update(
+            {
+                "cpu_time": cpu_time,
+                "rss": rss,
+                "peak_rss": max(rss, usage.get("peak_rss", 0)),
+                "read_bytes": io.get("read_bytes", 0),
+                "write_bytes": io.get("write_bytes", 0),
+                "last_sample": now,
+            }
+        )
+        total_rss += rss
+
+    rank_usage["peak_total_rss"] = max(total_rss, rank_usage.get("peak_total_rss", 0))
+
+
+def write_run_metadata(case_path: str, metadata: dict, rank_usage: dict):
+    """
+    Summarize the sampled rank usage and write the run metadata to .dafoam_run_metadata.json.
+
+    The summary includes per-rank CPU utilization, peak RSS, and read/write bytes, plus the peak
+    memory of all ranks, the peak memory per mesh cell, and the CPU efficiency (CPU time of all
+    ranks divided by wall time times cpu_cores).
+    """
+
+    ranks = {}
+    total_cpu_time = 0.0
+    for rank, usage in rank_usage.items():
+        if rank == "peak_total_rss":
+            continue
+        elapsed = usage["last_sample"] - usage["first_sample"]
+        cpu_used = usage["cpu_time"] - usage["first_cpu_time"]
+        total_cpu_time += usage["cpu_time"]
+        ranks[str(rank)] = {
+            "pid": usage["pid"],
+            "cpu_utilization": cpu_used / elapsed if elapsed > 0 else 0.0,
+            "cpu_time_s": usage["cpu_time"],
+            "peak_rss_mb": usage["peak_rss"] / 1024**2,
+            "read_mb": usage["read_bytes"] / 1024**2,
+            "write_mb": usage["write_bytes"] / 1024**2,
+        }
+
+    peak_memory = rank_usage.get("peak_total_rss", 0)
+    metadata["ranks"] = ranks
+    metadata["peak_memory_mb"] = peak_memory / 1024**2
+    metadata["peak_memory_kb_per_cell"] = peak_memory / 1024 / metadata["cells"] if metadata["cells"] else None
+    wall_core_time = metadata["wall_time"] * metadata["cpu_cores"]
+    metadata["cpu_efficiency"] = total_cpu_time / wall_core_time if wall_core_time > 0 else None
+
+    # written every few seconds while view_run_resource_usage may read it, so replace the file atomically
+    metadata_file = f"{case_path}/.dafoam_run_metadata.json"
+    tmp_file = f"{metadata_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "w") as f:
+            json.dump(metadata, f, indent=4)
+        os.replace(tmp_file, metadata_file)
+    except OSError:
+        pass
+
+
+@functools.lru_cache(maxsize=4)
+def wing_surface_statistics(stl_files: tuple) -> dict:
+    """
+    Read the wing STL files and compute their area, feature edges, and bounding box
+
+    Args:
+        stl_files: A tuple of (surface name, path, modification time), so a new geometry is read again
+
+    Returns:
+        A dictionary of surface name -> run_estimator.surface_statistics
+    """
+    statistics = {}
+    for name, path, _ in stl_files:
+        triangles = np.concatenate([stl_io.triangles_of(facets) for _, facets in stl_io.read_stl(path)])
+        statistics[name] = run_estimator.surface_statistics(triangles)
+    return statistics
+
+
+def read_n_cells_between_levels(dict_path: str) -> int:
+    """Return nCellsBetweenLevels of a snappyHexMeshDict (3, the default of the wing case, if not found)"""
+    try:
+        with open(dict_path) as f:
+            match = re.search(r"^\s*nCellsBetweenLevels\s+(\d+)\s*;", f.read(), re.MULTILINE)
+    except OSError:
+        match = None
+    return int(match.group(1)) if match else 3
+
+
+@traced
+def estimate_mesh_cells(
+    module: str,
+    mesh_tool: str,
+    mesh_cells: int,
+    max_cell_size: float,
+    mesh_refinement_level: int,
+    n_boundary_layers: int,
+    mean_chord: float,
+    leading_edge_root: List[float],
+    leading_edge_tip: List[float],
+) -> dict:
+    """
+    Estimate the cells of a mesh before it is generated. The airfoil mesh has about the mesh_cells asked from
+    pyHyp. The wing mesh is estimated from the mesh settings of wing_generate_mesh and the wing STL files in
+    constant/triSurface (run_estimator.estimate_octree_cells). Both are corrected by the past meshes in
+    run_history_file.
+
+    Returns:
+        Dictionary containing:
+            - mesh_tool: the mesh tool ("pyHyp" for the airfoil)
+            - estimated_cells: the cells estimated from the mesh settings
+            - cells: the estimated cells corrected by the past meshes
+            - breakdown: the cells of the background, the refinements, and the boundary layers (None for airfoils)
+            - correction, n_meshes: the correction factor and the number of past meshes it is based on
+        Raises ValueError if the mesh tool is unknown or the wing geometry has not been generated
+    """
+
+    breakdown = None
+    if module == "airfoil":
+        mesh_tool = "pyHyp"
+        estimated_cells = float(mesh_cells)
+    else:
+        surfaces = ["wing_upper", "wing_lower", "wing_te", "wing_tip"]
+        paths = [f"{wing_path}/constant/triSurface/{name}.stl" for name in surfaces]
+        if not all(os.path.exists(path) for path in paths):
+            raise ValueError("no wing geometry found. Run wing_generate_geometry first.")
+        stats = wing_surface_statistics(
+            tuple((name, path, os.path.getmtime(path)) for name, path in zip(surfaces, paths))
+        )
+        level = mesh_refinement_level
+        Lx = mean_chord * 30.0
+
+        if mesh_tool == "cfMesh":
+            # the domain of surfaceGenerateBoundingBox and the localRefinement and objectRefinements of meshDict:
+            # refinementLevel on the upper and lower surfaces, refineP1 on the trailing edge, the tip, and the
+            # leading edge line. The octree keeps about two cells of each level
+            extent = np.max([s["upper"] for s in stats.values()], axis=0) - np.min(
+                [s["lower"] for s in stats.values()], axis=0
+            )
+            volume = (extent[0] + 2 * Lx) * (extent[1] + 2 * Lx) * (extent[2] + Lx)
+            levels = {"wing_upper": level, "wing_lower": level, "wing_te": level + 1, "wing_tip": level + 1}
+            le_length = float(np.linalg.norm(np.subtract(leading_edge_tip, leading_edge_root)))
+            breakdown = run_estimator.estimate_octree_cells(
+                volume / max_cell_size**3,
+                max_cell_size,
+                [(stats[name]["area"], levels[name]) for name in surfaces],
+                [(le_length, level + 1, level)],
+                2,
+                n_boundary_layers,
+            )
+        elif mesh_tool == "snappyHexMesh":
+            # the blockMeshDict of wing_generate_mesh, surfaceLevel on all surfaces, and lineLevel on the features
+            # of surfaceFeatureExtract. The patch boundaries are features of the two surfaces they separate
+            Nx = max(int(Lx / max_cell_size), 1)
+            Nz = max(int(Nx / 2), 1)
+            feature_length = sum(s["feature_length"] - 0.5 * s["open_length"] for s in stats.values())
+            breakdown = run_estimator.estimate_octree_cells(
+                Nx * Nx * Nz,
+                2 * Lx / Nx,
+                [(stats[name]["area"], level) for name in surfaces],
+                [(feature_length, level + 2, level)],
+                read_n_cells_between_levels(f"{wing_path}/system/snappyHexMeshDict"),
+                n_boundary_layers,
+            )
+        else:
+            raise ValueError(f"mesh_tool {mesh_tool} not recognized. Options are 'cfMesh' and 'snappyHexMesh'.")
+        estimated_cells = breakdown["total"]
+
+    correction, n_meshes = run_estimator.cell_correction(
+        run_estimator.read_history(run_history_file), module, mesh_tool
+    )
+    return {
+        "mesh_tool": mesh_tool,
+        "estimated_cells": estimated_cells,
+        "cells": estimated_cells * correction,
+        "breakdown": breakdown,
+        "correction": correction,
+        "n_meshes": n_meshes,
+    }
+
+
+@traced
+def estimate_run(
+    module: str, run_type: str, cells: float, cpu_cores: int, max_opt_iters: int = 1, mesh_tool: str = None
+) -> dict:
+    """
+    Estimate the wall time and peak memory of a mesh generation or run from run_history_file and flag
+    expensive runs
+
+    Args:
+        module: "airfoil" or "wing"
+        run_type: "mesh", "cfd", or "optimization"
+        cells: The (estimated) number of mesh cells
+        cpu_cores: The number of CPU cores of the run
+        max_opt_iters: The maximum number of optimization iterations (optimization only)
+        mesh_tool: The mesh tool (mesh only), the wall time is fitted on the past meshes of this tool
+
+    Returns:
+        Dictionary containing:
+            - wall_time, range, n_runs: see run_estimator.estimate_wall_time
+            - memory_mb: the estimated peak memory of all ranks, or None without past runs
+            - warnings: the reasons why the run is expensive
+    """
+
+    history = run_estimator.read_history(run_history_file)
+    estimate = run_estimator.estimate_wall_time(
+        history, module, run_type, cells, cpu_cores, default_core_seconds_per_cell[run_type], max_opt_iters, mesh_tool
+    )
+    estimate["memory_mb"] = run_estimator.estimate_memory(history, module, cells) if run_type != "mesh" else None
+
+    warnings = []
+    if run_type == "mesh" and cells > expensive_cells[module]:
+        warnings.append(
+            f"{cells:,.0f} cells is more than the {expensive_cells[module]:,} cells of a large {module} mesh"
+        )
+    if estimate["wall_time"] > expensive_wall_time:
+        warnings.append(
+            f"the {run_type} may take {format_duration(estimate['wall_time'])}, "
+            f"more than {format_duration(expensive_wall_time)}"
+        )
+    physical_memory_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024**2
+    if estimate["memory_mb"] is not None and estimate["memory_mb"] > 0.8 * physical_memory_mb:
+        warnings.append(
+            f"the {run_type} may need {estimate['memory_mb']:,.0f} MB of memory, "
+            f"more than 80% of the {physical_memory_mb:,.0f} MB of this machine"
+        )
+    if cpu_cores > (os.cpu_count() or 1):
+        warnings.append(f"{cpu_cores} CPU cores is more than the {os.cpu_count()} cores of this machine")
+    estimate["warnings"] = warnings
+    return estimate
+
+
+def format_duration(seconds: float) -> str:
+    """Format a duration in seconds, minutes, or hours"""
+    if seconds < 120:
+        return f"{seconds:.0f} s"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def format_run_estimate(run_type: str, estimate: dict, cpu_cores: int = None) -> str:
+    """Format the wall time, memory, and warnings of estimate_run"""
+    cores = f" on {cpu_cores} CPU cores" if cpu_cores else ""
+    message = f"  - Estimated {run_type} wall time{cores}: {format_duration(estimate['wall_time'])}"
+    if estimate["range"] is not None and estimate["n_runs"] >= 3:
+        low, high = estimate["range"]
+        message += f" (typically {format_duration(low)} - {format_duration(high)})"
+    if estimate["n_runs"]:
+        message += f", calibrated on {estimate['n_runs']} past runs\n"
+    else:
+        message += ", a rough default until the first run finishes\n"
+    if estimate["memory_mb"] is not None:
+        message += f"  - Estimated peak memory: {estimate['memory_mb']:,.0f} MB\n"
+    for warning in estimate["warnings"]:
+        message += f"  - WARNING: {warning}\n"
+    return message
+
+
+def run_estimate_message(case_path: str, run_type: str, cpu_cores: int, max_opt_iters: int = 1) -> str:
+    """Return the estimated wall time and memory of a run on the mesh of case_path ("" without a mesh)"""
+    if not os.path.exists(f"{case_path}/log_mesh.txt"):
+        return ""
+    cells = parse_mesh_statistics(f"{case_path}/log_mesh.txt")["cells"]
+    if not cells:
+        return ""
+    module = "airfoil" if case_path == airfoil_path else "wing"
+    estimate = estimate_run(module, run_type, cells, cpu_cores, max_opt_iters)
+    return "\n\n" + format_run_estimate(run_type, estimate, cpu_cores)
+
+
+def record_mesh_history(
+    module: str, mesh_tool: str, cells: int, estimated_cells: float, wall_time: float, cpu_cores: int
+):
+    """Append a generated mesh and its estimated cells (before the correction) to run_history_file"""
+    metadata = {
+        "module": module,
+        "run_type": "mesh",
+        "mesh_tool": mesh_tool,
+        "cells": cells,
+        "estimated_cells": estimated_cells,
+        "cpu_cores": cpu_cores,
+        "wall_time": wall_time,
+        "return_code": 0,
+    }
+    record_run_history(metadata)
+
+
+def record_run_history(metadata: dict):
+    """Append a finished mesh generation or run to run_history_file, which calibrates estimate_run"""
+    fields = ["module", "run_type", "mesh_tool", "cells", "estimated_cells", "cpu_cores", "max_opt_iters", "wall_time"]
+    record = {key: metadata[key] for key in fields if key in metadata}
+    record.update(
+        {
+            "return_code": metadata["return_code"],
+            "peak_memory_kb_per_cell": metadata.get("peak_memory_kb_per_cell"),
+            "end_time": metadata.get("end_time") or time.time(),
+        }
+    )
+    try:
+        run_estimator.append_history(run_history_file, record)
+    except OSError:
+        pass
+
+
 def submit_to_hpc(bash_command: str, case_path: str) -> str:
     """
     Write bash command to script and submit to HPC if sbatch is available.
@@ -1267,7 +3099,7 @@ def check_run_status(module: str = "airfoil"):
     Inputs:
         module: either "airfoil" or "wing"
     Outputs:
-        finished: 1 = the run finishes. 0 = the run does not finish
+        finished: 1 = the run finishes. 0 = the run does not finish (or its reconstructPar is still running)
     """
 
     if module == "airfoil":
@@ -1278,12 +3110,13 @@ def check_run_status(module: str = "airfoil"):
     file_path = f"{case_path}/.dafoam_run_finished"
     path = Path(file_path).expanduser()
 
-    if path.exists():
+    if path.exists() and not case_busy(case_path):
         return 1
     else:
         return 0
 
 
+@traced
 def parse_mesh_statistics(log_file_path: str) -> dict:
     """
     Parse mesh statistics from the log_mesh.txt file.
@@ -1327,6 +3160,9 @@ def parse_mesh_statistics(log_file_path: str) -> dict:
 class CustomHTTPHandler(SimpleHTTPRequestHandler):
     """Custom HTTP handler to serve files from both airfoil_path and wing_path"""
 
+    # the exported glTF files of the static web viewers
+    extensions_map = {**SimpleHTTPRequestHandler.extensions_map, ".glb": "model/gltf-binary"}
+
     def translate_path(self, path):
         """Translate URL path to local file path, using prefixes to distinguish directories"""
         import urllib.parse
@@ -1355,6 +3191,24 @@ class CustomHTTPHandler(SimpleHTTPRequestHandler):
         else:
             return os.path.join(airfoil_path, "plots", path)
 
+    def do_GET(self):
+        """Serve the Prometheus metrics at /metrics and plot files for all other paths"""
+        if self.path.split("?", 1)[0] == "/metrics":
+            body = METRICS.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        super().do_GET()
+
+    def copyfile(self, source, outputfile):
+        """Copy the file to the client and count the bytes served"""
+        start = source.tell()
+        super().copyfile(source, outputfile)
+        METRICS.inc("dafoam_http_bytes_served_total", value=source.tell() - start)
+
     def log_message(self, format, *args):
         """Suppress HTTP server logs"""
         pass
@@ -1366,10 +3220,10 @@ def start_http_server():
     try:
         # Try binding to 0.0.0.0 first, fallback to 127.0.0.1
         try:
-            http_server = HTTPServer(("0.0.0.0", FILE_HTTP_PORT), CustomHTTPHandler)
+            http_server = ThreadingHTTPServer(("0.0.0.0", FILE_HTTP_PORT), CustomHTTPHandler)
         except OSError:
             # If 0.0.0.0 fails (common on some Windows configurations), try 127.0.0.1
-            http_server = HTTPServer(("127.0.0.1", FILE_HTTP_PORT), CustomHTTPHandler)
+            http_server = ThreadingHTTPServer(("127.0.0.1", FILE_HTTP_PORT), CustomHTTPHandler)
 
         server_started = True
         http_server.serve_forever()
@@ -1380,6 +3234,7 @@ def start_http_server():
         server_started = False
 
 
+@traced
 def combine_pngs(case_path: str, image_files: List[str], output_filename: str, spacing: int = 50) -> str:
     """
     Combine multiple PNG images vertically into a single PNG with white space between them.
@@ -1436,6 +3291,70 @@ def combine_pngs(case_path: str, image_files: List[str], output_filename: str, s
     return str(output_path)
 
 
+def tool_result(message: str, png_path: str):
+    """
+    Return the tool output message, plus the PNG as MCP image content if return_image_content is True
+
+    Inputs:
+        message: the text output of the tool
+        png_path: absolute path to the (combined) PNG generated by the tool
+    """
+    if not return_image_content or not os.path.exists(png_path):
+        return message
+    return [message, encode_image_content(png_path)]
+
+
+# Encoded MCP images keyed by (png_path, mtime, size, image_byte_budget); the least recently used is evicted first
+image_content_cache = OrderedDict()
+image_content_cache_size = 64
+image_content_cache_lock = threading.Lock()
+
+
+@traced
+def encode_image_content(png_path: str) -> MCPImage:
+    """
+    Encode a PNG as MCP image content that fits in image_byte_budget bytes. The PNG is kept if it
+    fits; otherwise it is recompressed as JPEG and downscaled by 25% per step until it fits.
+    The encoded image is cached per artifact until the PNG changes.
+
+    Inputs:
+        png_path: absolute path to the PNG file
+    """
+    stat = os.stat(png_path)
+    key = (png_path, stat.st_mtime_ns, stat.st_size, image_byte_budget)
+    with image_content_cache_lock:
+        if key in image_content_cache:
+            image_content_cache.move_to_end(key)
+            METRICS.inc("dafoam_cache_requests_total", {"cache": "image_content", "result": "hit"})
+            return image_content_cache[key]
+    METRICS.inc("dafoam_cache_requests_total", {"cache": "image_content", "result": "miss"})
+
+    if stat.st_size <= image_byte_budget:
+        with open(png_path, "rb") as f:
+            image_content = MCPImage(data=f.read(), format="png")
+    else:
+        with Image.open(png_path) as img:
+            img = img.convert("RGB")
+            scale = 1.0
+            while True:
+                size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+                resized = img.resize(size, Image.LANCZOS) if scale < 1.0 else img
+                buffer = io.BytesIO()
+                resized.save(buffer, "JPEG", quality=80, optimize=True)
+                if buffer.tell() <= image_byte_budget or min(size) <= 64:
+                    break
+                scale *= 0.75
+        image_content = MCPImage(data=buffer.getvalue(), format="jpeg")
+
+    with image_content_cache_lock:
+        image_content_cache[key] = image_content
+        while len(image_content_cache) > image_content_cache_size:
+            image_content_cache.popitem(last=False)
+
+    return image_content
+
+
+@traced
 def create_image_html(case_path: str, image_files: List, html_filename: str) -> str:
     """
     Create an HTML wrapper for multiple images displayed side by side with embedded base64 images
@@ -1591,39 +3510,180 @@ def create_image_html(case_path: str, image_files: List, html_filename: str) ->
         f.write(html_content)
 
 
-def download_airfoil_from_uiuc(airfoil_name, save_path):
+def create_web_viewer_html(case_path: str, glb_url: str, html_filename: str, extras: dict):
     """
-    Download airfoil coordinates from UIUC Airfoil Database
+    Create a static HTML page that shows a glTF file with the <model-viewer> web component. The browser
+    loads the glTF file from the HTTP file server. A color bar is added when the file has a field
 
     Inputs:
-        airfoil_name:
-            Name of the airfoil (e.g., 'naca4412')
-        save_path:
-            Path where to save the downloaded file
+        case_path: airfoils for the Airfoil Module and wings for the Wing Module
+        glb_url: the glTF file relative to the plots directory, e.g., web/wing_surface_0123456789abcdef.glb
+        html_filename: name of the generated html file
+        extras: the scene extras of the glTF file: title, and field, min, max for a color bar
+    """
+
+    color_bar = ""
+    if "field" in extras:
+        stops = ", ".join(f"rgb({r:.0f},{g:.0f},{b:.0f})" for r, g, b in gltf_export.colormap_stops)
+        color_bar = f"""
+        <div class="color-bar">
+            <span>{extras['min']:.3f}</span>
+            <div class="gradient" style="background: linear-gradient(to right, {stops});"></div>
+            <span>{extras['max']:.3f}</span>
+            <span class="field">{extras['field']}</span>
+        </div>"""
+
+    html_content = f"""<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{extras['title']}</title>
+    <script type="module" src="{web_viewer_script}"></script>
+    <style>
+        body {{
+            font-family: Arial, sans-serif;
+            margin: 0;
+            padding: 20px;
+            background-color: #f5f5f5;
+        }}
+        .main-container {{
+            max-width: 1400px;
+            margin: 0 auto;
+            background-color: white;
+            padding: 30px;
+            border-radius: 8px;
+            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+        }}
+        h1 {{
+            color: #333;
+            text-align: center;
+            margin-bottom: 20px;
+            font-size: 24px;
+        }}
+        model-viewer {{
+            width: 100%;
+            height: 75vh;
+            background-color: #fafafa;
+            border: 1px solid #ddd;
+            border-radius: 4px;
+        }}
+        .color-bar {{
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            gap: 10px;
+            margin-top: 20px;
+            color: #444;
+            font-size: 14px;
+        }}
+        .color-bar .gradient {{
+            width: 400px;
+            height: 16px;
+            border: 1px solid #ddd;
+        }}
+        .color-bar .field {{
+            font-weight: bold;
+        }}
+    </style>
+</head>
+<body>
+    <div class="main-container">
+        <h1>{extras['title']}</h1>
+        <model-viewer src="{glb_url}" camera-controls interaction-prompt="none" shadow-intensity="0"
+            environment-image="neutral" exposure="1.0"></model-viewer>{color_bar}
+    </div>
+</body>
+</html>"""
+
+    html_path = Path(case_path) / "plots" / html_filename
+
+    with open(html_path, "w", encoding="utf-8") as f:
+        f.write(html_content)
+
+
+def ensure_airfoil_profiles(case_path: str, airfoil_profiles: List[str]) -> str:
+    """
+    Make sure that profiles/{airfoil_profile}.dat (lower case) exists in the case directory for each profile.
+    A missing profile is written from the profile library (names and aliases such as "NACA 0012" are
+    resolved), and the profiles that the library does not have are downloaded concurrently from the UIUC
+    airfoil database.
+
+    Args:
+        case_path: airfoil_path or wing_path
+        airfoil_profiles: The names of the airfoil profiles, e.g., ["naca0012", "naca4412"]
 
     Returns:
-        True if download successful, False otherwise
+        A message for the users about the profiles written from the library or downloaded, or ""
+        Raises ValueError with similar profile names if a profile is not found
     """
-    base_url = "https://m-selig.ae.illinois.edu/ads/coord/"
-    url = f"{base_url}{airfoil_name.lower()}.dat"
+    message = ""
+    library = load_profile_library()
+    missing = {}
+    for airfoil_profile in dict.fromkeys(airfoil_profiles):
+        profile_file_name = os.path.join(case_path, "profiles", airfoil_profile.lower() + ".dat")
+        if os.path.exists(profile_file_name):
+            METRICS.inc("dafoam_cache_requests_total", {"cache": "airfoil_profiles", "result": "hit"})
+        elif library is not None and library.resolve(airfoil_profile) is not None:
+            METRICS.inc("dafoam_cache_requests_total", {"cache": "airfoil_profiles", "result": "library"})
+            library.write_dat(airfoil_profile, profile_file_name)
+            message += (
+                f"The {airfoil_profile} airfoil profile is not found in the profiles folder "
+                f"and has been written from the profile library ({library.resolve(airfoil_profile)})! \n"
+            )
+        else:
+            METRICS.inc("dafoam_cache_requests_total", {"cache": "airfoil_profiles", "result": "miss"})
+            missing[airfoil_profile] = profile_file_name
+
+    if not missing:
+        return message
+
+    logging.info(f"Downloading the {', '.join(missing)} airfoil profiles from the UIUC database!")
+    with span("fetch_profiles", n_profiles=len(missing)):
+        results = PROFILE_FETCHER.fetch_many(list(missing))
+    errors = []
+    for airfoil_profile, profile_file_name in missing.items():
+        result = results[airfoil_profile]
+        if isinstance(result, profile_fetcher.FetchError):
+            suggestions = library.suggest(airfoil_profile) if library is not None else []
+            errors.append(
+                f"the {airfoil_profile} airfoil profile is not found in the profiles folder or the profile library "
+                f"and it could not be downloaded from the UIUC database either ({result})! \n"
+                + (f"Similar profiles in the library: {', '.join(suggestions)} \n" if suggestions else "")
+            )
+            continue
+        shutil.copyfile(result, profile_file_name)
+        message += (
+            f"The {airfoil_profile} airfoil profile is not found in the profiles folder "
+            "and has been downloaded from the UIUC database! \n"
+        )
+    if errors:
+        raise ValueError("".join(errors))
+    return message
 
-    try:
-        # Download the file
-        with urllib.request.urlopen(url, timeout=10) as response:
-            content = response.read()
 
-        # Save to file
-        with open(save_path, "wb") as f:
-            f.write(content)
-        return True
+@functools.lru_cache(maxsize=1)
+def load_profile_library():
+    """Open the profile library at profile_library_path once, or return None if it does not exist"""
+    if not os.path.exists(profile_library_path + ".json"):
+        return None
+    return profile_library.ProfileLibrary(profile_library_path)
 
-    except Exception:
-        return False
+
+# The trame viewers started by this MCP server, keyed by port. Each is a dict with the process, the
+# control file, the dataset (mesh file path) it shows, its dataset version, and the last time it was used
+trame_viewers = {}
+trame_lock = threading.Lock()
 
 
-def start_trame_viewer(case_path: str, mesh_file: str, focal_x: float = 1.0, focal_z: float = 1.5) -> str:
+async def start_trame_viewer(
+    case_path: str, mesh_file: str, focal_x: float = 1.0, focal_z: float = 1.5, mach_number: float = 0.1
+) -> str:
     """
-    Start trame viewer in background process.
+    Show a mesh file in a trame viewer from a pool of long-lived script_trame.py processes, one per port in
+    trame_ports. A viewer that already shows the file, or else a new viewer on a free port, or else the
+    least recently used viewer, swaps to the dataset through its control file without restarting, so the
+    other viewers and their sessions are kept. The URL is returned once the viewer passes the health check.
     Python need to pip install vtk trame trame-vuetify trame-vtk --break-system-packages
 
     Args:
@@ -1635,44 +3695,115 @@ def start_trame_viewer(case_path: str, mesh_file: str, focal_x: float = 1.0, foc
              the focal point x coordinate
         focal_z:
             the focal point z coordinate
+        mach_number:
+            the Mach number to compute Cp when mesh_file is paraview.foam (the surface flow fields)
     """
-    # Use current port and increment for next call
-    port = 8002
-
-    # First kill any existing trame processes
-    try:
-        subprocess.run(["pkill", "-f", "script_trame.py"], capture_output=True, timeout=2)
-        time.sleep(0.5)  # Wait for processes to terminate
-    except Exception:
-        pass  # Ignore errors if no process found
+    dataset = os.path.abspath(os.path.join(case_path, mesh_file))
+    os.makedirs(trame_control_dir, exist_ok=True)
+
+    with trame_lock:
+        for port, viewer in list(trame_viewers.items()):
+            if viewer["process"].poll() is not None:
+                del trame_viewers[port]
+
+        port = next((port for port, viewer in trame_viewers.items() if viewer["dataset"] == dataset), None)
+        if port is None:
+            port = next((port for port in trame_ports if port not in trame_viewers and port_is_free(port)), None)
+        swapped_dataset = None
+        if port is None and trame_viewers:
+            port = min(trame_viewers, key=lambda port: trame_viewers[port]["last_used"])
+            swapped_dataset = trame_viewers[port]["dataset"]
+        if port is None:
+            return f"Error starting trame viewer: no free port in {trame_ports[0]}-{trame_ports[-1]}"
+
+        viewer = trame_viewers.get(port)
+        control_file = f"{trame_control_dir}/viewer_{port}.json"
+        version = viewer["version"] + 1 if viewer else 1
+        with open(f"{control_file}.tmp", "w") as f:
+            control = {"mesh_file": dataset, "focal_x": focal_x, "focal_z": focal_z, "mach_number": mach_number}
+            json.dump({**control, "version": version}, f)
+        os.replace(f"{control_file}.tmp", control_file)
+
+        if viewer is None:
+            # a ready file left by an earlier MCP server process would pass the health check too early
+            if os.path.exists(f"{control_file}.ready"):
+                os.remove(f"{control_file}.ready")
+            bash_command = (
+                f"cd {case_path} && "
+                f"exec python script_trame.py -port={port} -control_file={control_file} "
+                f"-remote_render_cells={trame_remote_render_cells} "
+                f"> {trame_control_dir}/viewer_{port}.log 2>&1"
+            )
+            try:
+                # run in non-blocking mode
+                process = subprocess.Popen(
+                    ["bash", "-c", bash_command],
+                    stdout=subprocess.DEVNULL,  # Don't let child write to our stdout
+                    stderr=subprocess.DEVNULL,  # Don't let child write to our stderr
+                    stdin=subprocess.DEVNULL,  # Don't let child read from our stdin
+                )
+            except Exception as e:
+                return f"Error starting trame viewer: {str(e)}"
+            viewer = trame_viewers[port] = {"process": process, "control_file": control_file}
+        viewer.update({"dataset": dataset, "version": version, "last_used": time.time()})
+
+    loop = asyncio.get_event_loop()
+    if not await loop.run_in_executor(None, wait_for_trame_viewer, port, viewer, version):
+        return (
+            f"Error starting trame viewer: it did not pass the health check within {trame_startup_timeout} s. "
+            f"See {trame_control_dir}/viewer_{port}.log"
+        )
+    message = f"Trame viewer started at http://localhost:{port}"
+    if swapped_dataset is not None:
+        message += (
+            f"\nNote: all trame ports ({trame_ports[0]}-{trame_ports[-1]}) are in use, so the least recently used "
+            f"viewer was switched from {swapped_dataset} to this dataset. Browser sessions already open at "
+            f"http://localhost:{port} now show this dataset too."
+        )
+    return message
 
-    bash_command = (
-        f"cd {case_path} && "
-        f"python script_trame.py "
-        f"-mesh_file={mesh_file} -focal_x={focal_x} -focal_z={focal_z} "
-    )
 
-    try:
-        # run in non-blocking mode
-        subprocess.Popen(
-            ["bash", "-c", bash_command],
-            stdout=subprocess.DEVNULL,  # Don't let child write to our stdout
-            stderr=subprocess.DEVNULL,  # Don't let child write to our stderr
-            stdin=subprocess.DEVNULL,  # Don't let child read from our stdin
-        )
-    except Exception as e:
-        return f"Error starting trame viewer: {str(e)}"
+def port_is_free(port: int) -> bool:
+    """Check whether a TCP port can be bound, e.g., it is not used by a viewer of another MCP server process"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind(("0.0.0.0", port))
+            return True
+        except OSError:
+            return False
 
-    return f"Trame viewer started at http://localhost:{port}"
 
+def wait_for_trame_viewer(port: int, viewer: dict, version: int) -> bool:
+    """
+    Health check of a trame viewer: wait until it has loaded the dataset version (written by script_trame.py
+    to the ready file next to its control file) and its web page is served
 
-# Cleanup function to kill trame processes on exit
+    Returns:
+        True if the viewer is ready, False if it exited or did not become ready within trame_startup_timeout
+    """
+    deadline = time.perf_counter() + trame_startup_timeout
+    while time.perf_counter() < deadline and viewer["process"].poll() is None:
+        try:
+            with open(f"{viewer['control_file']}.ready") as f:
+                loaded = f.read().strip() == str(version)
+            if loaded:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=2) as response:
+                    if response.status == 200:
+                        return True
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.25)
+    return False
+
+
+# Cleanup function to stop the trame viewers on exit
 def cleanup_on_exit():
-    """Kill all trame viewer processes when MCP server exits"""
-    try:
-        subprocess.run(["pkill", "-f", "script_trame.py"], capture_output=True, timeout=2)
-    except Exception:
-        pass  # Ignore errors
+    """Stop the trame viewer processes started by this MCP server when it exits"""
+    for viewer in trame_viewers.values():
+        try:
+            viewer["process"].terminate()
+        except Exception:
+            pass  # Ignore errors
 
 
 # Register cleanup function to run on exit
@@ -1692,6 +3823,23 @@ server_thread.start()
 time.sleep(0.5)
 
 if __name__ == "__main__":
-    # Use stdio mode only - FastMCP doesn't directly support SSE
-    # For HTTP support, you'd need to use the low-level MCP SDK
-    mcp.run(transport="stdio")
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-transport",
+        help="MCP transport: stdio, streamable-http, or sse",
+        type=str,
+        default=mcp_transport,
+        choices=["stdio", "streamable-http", "sse"],
+    )
+    parser.add_argument(
+        "-port", help="MCP port for the streamable-http and sse transports", type=int, default=mcp_http_port
+    )
+    parser.add_argument(
+        "-host", help="MCP host for the streamable-http and sse transports", type=str, default=mcp_http_host
+    )
+    args = parser.parse_args()
+
+    if args.transport != "stdio":
+        mcp.settings.host = args.host
+        mcp.settings.port = args.port
+    mcp.run(transport=args.transport)
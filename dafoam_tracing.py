@@ -0,0 +1,165 @@
+"""
+Opt-in tracing of nested timing spans for the DAFoam MCP server and its helper scripts.
+
+Tracing is enabled when the DAFOAM_TRACE_FILE environment variable points to a file. The MCP server sets
+it from trace_file in its user configuration, and the pvpython/python scripts inherit it, so spans from
+all processes are appended to the same JSON-lines file. Spans are never written to stdout/stderr to
+protect the stdio MCP transport.
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+
+TRACE_FILE_ENV = "DAFOAM_TRACE_FILE"
+TRACE_PARENT_ENV = "DAFOAM_TRACE_PARENT"
+
+current_span = contextvars.ContextVar("dafoam_current_span", default=None)
+write_lock = threading.Lock()
+
+
+def tracing_enabled() -> bool:
+    """Return True if spans are recorded in this process"""
+    return bool(os.environ.get(TRACE_FILE_ENV))
+
+
+@contextlib.contextmanager
+def span(name: str, **attributes):
+    """
+    Record a timing span. Spans opened inside another span become its children. In a subprocess,
+    the parent is taken from DAFOAM_TRACE_PARENT ("trace_id:span_id") set by the MCP server.
+
+    Inputs:
+        name: the span name, such as the tool name or "stage:pvpython"
+        attributes: extra JSON-serializable values stored with the span
+    Outputs:
+        Yields the span record (a dict), or None if tracing is disabled
+    """
+
+    trace_path = os.environ.get(TRACE_FILE_ENV)
+    if not trace_path:
+        yield None
+        return
+
+    parent = current_span.get()
+    if parent is not None:
+        trace_id, parent_id = parent["trace_id"], parent["span_id"]
+    elif os.environ.get(TRACE_PARENT_ENV):
+        trace_id, parent_id = os.environ[TRACE_PARENT_ENV].split(":", 1)
+    else:
+        trace_id, parent_id = uuid.uuid4().hex, None
+
+    record = {
+        "trace_id": trace_id,
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent_id,
+        "name": name,
+        "pid": os.getpid(),
+        "start": time.time(),
+        "duration": None,
+        "status": "ok",
+        "attributes": attributes,
+        "children": [],
+    }
+    if parent is None:
+        # the spans of this trace are appended after this offset, see attach_subprocess_spans
+        try:
+            record["offset"] = os.path.getsize(trace_path)
+        except OSError:
+            record["offset"] = 0
+    token = current_span.set(record)
+    start_time = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        record["status"] = "error"
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - start_time
+        current_span.reset(token)
+        if parent is not None:
+            parent["children"].append(record)
+        write_span(trace_path, record)
+
+
+def traced(func):
+    """Decorator that records a span named after the function for every call"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(func.__name__):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def write_span(trace_path: str, record: dict):
+    """Append one span (without its in-memory children and file offset) to the JSON-lines trace file"""
+    line = json.dumps({k: v for k, v in record.items() if k not in ["children", "offset"]}, default=str)
+    try:
+        with write_lock:
+            with open(trace_path, "a") as f:
+                f.write(line + "\n")
+    except OSError:
+        pass  # tracing must never break a tool call
+
+
+def subprocess_env() -> dict:
+    """Return a copy of os.environ with DAFOAM_TRACE_PARENT set to the current span, if any"""
+    env = dict(os.environ)
+    record = current_span.get()
+    if record is not None:
+        env[TRACE_PARENT_ENV] = f"{record['trace_id']}:{record['span_id']}"
+    return env
+
+
+def attach_subprocess_spans(record: dict):
+    """
+    Read the spans written by subprocesses for the trace of record from the trace file and attach
+    them as children of their parent spans, so that format_summary also shows subprocess timings.
+    Only the part of the file appended since the root span started is read.
+    """
+
+    trace_path = os.environ.get(TRACE_FILE_ENV)
+    if not trace_path or not os.path.exists(trace_path):
+        return
+
+    spans_by_id = {}
+    stack = [record]
+    while stack:
+        item = stack.pop()
+        spans_by_id[item["span_id"]] = item
+        stack.extend(item["children"])
+
+    subprocess_spans = []
+    with open(trace_path) as f:
+        f.seek(record.get("offset", 0))
+        for line in f:
+            if record["trace_id"] not in line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if item.get("trace_id") == record["trace_id"] and item.get("pid") != os.getpid():
+                item["children"] = []
+                spans_by_id[item["span_id"]] = item
+                subprocess_spans.append(item)
+
+    for item in sorted(subprocess_spans, key=lambda x: x["start"]):
+        parent = spans_by_id.get(item["parent_id"])
+        if parent is not None:
+            parent["children"].append(item)
+
+
+def format_summary(record: dict, indent: int = 0) -> str:
+    """Format a span and its children as an indented list of durations"""
+    lines = [f"{'  ' * indent}- {record['name']}: {record['duration']:.3f} s"]
+    for child in record["children"]:
+        lines.append(format_summary(child, indent + 1))
+    return "\n".join(lines)
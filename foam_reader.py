@@ -0,0 +1,527 @@
+"""
+A ParaView-free reader for OpenFOAM meshes and fields on selected boundary patches.
+
+It only needs numpy, so the MCP server and the python scripts can extract surface values (such as Cp)
+and integrated loads in milliseconds instead of starting pvpython and OpenFOAMReader. It handles
+ascii and binary files, compressed files (writeCompression on), moving meshes (the points written
+in the time directories by the optimization), and decomposed processor* directories (or the case
+directory once reconstructPar has written the time steps, see is_reconstructed). Uncompressed files
+are memory-mapped, so reading one patch of a large binary field only touches the pages it needs.
+"""
+
+import gzip
+import json
+import mmap
+import os
+import re
+import numpy as np
+
+# number of components for the OpenFOAM field types
+n_components = {"label": 1, "scalar": 1, "vector": 3, "symmTensor": 6, "tensor": 9}
+
+skip_re = re.compile(rb"(?:\s+|//[^\n]*|/\*.*?\*/)*", re.DOTALL)
+header_re = re.compile(rb"FoamFile\s*\{(.*?)\}", re.DOTALL)
+header_entry_re = re.compile(rb'(\w+)\s+("[^"]*"|[^;]*);')
+word_re = re.compile(rb'"[^"]*"|[^\s{};"]+')
+list_start_re = re.compile(rb"(\d+)\s*([({])")
+field_value_re = re.compile(rb"(uniform|nonuniform)\s+(?:List<(\w+)>\s*)?")
+
+# written to the case directory by the job runner after reconstructPar, see is_reconstructed
+reconstructed_flag = ".dafoam_reconstructed"
+
+
+class FoamFile:
+    """
+    An OpenFOAM file opened for reading. Compressed files (*.gz) are decompressed in memory and
+    uncompressed files are memory-mapped. The header (format, class, arch) is parsed on open.
+    """
+
+    def __init__(self, path: str):
+        if not os.path.exists(path) and os.path.exists(path + ".gz"):
+            path += ".gz"
+        self.path = path
+        if path.endswith(".gz"):
+            with gzip.open(path, "rb") as f:
+                self.buffer = f.read()
+        else:
+            with open(path, "rb") as f:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        match = header_re.search(self.buffer[:8192])
+        if match is None:
+            raise ValueError(f"{path} is not an OpenFOAM file (no FoamFile header)")
+        self.header = {
+            key.decode(): value.decode().strip().strip('"') for key, value in header_entry_re.findall(match.group(1))
+        }
+        self.header_end = match.end()
+        self.binary = self.header.get("format", "ascii") == "binary"
+
+        arch = self.header.get("arch", "")
+        label_bits = re.search(r"label=(\d+)", arch)
+        scalar_bits = re.search(r"scalar=(\d+)", arch)
+        self.label_dtype = np.dtype("<i8" if label_bits and label_bits.group(1) == "64" else "<i4")
+        self.scalar_dtype = np.dtype("<f4" if scalar_bits and scalar_bits.group(1) == "32" else "<f8")
+
+    def skip(self, pos: int) -> int:
+        """Return the position of the next token after whitespace and comments"""
+        return skip_re.match(self.buffer, pos).end()
+
+    def find_keyword(self, keyword: str, pos: int = None) -> int:
+        """Return the position right after a top-level keyword, searching from pos"""
+        match = re.compile(rb"(?:^|\n)\s*" + keyword.encode() + rb"\b").search(
+            self.buffer, self.header_end if pos is None else pos
+        )
+        if match is None:
+            raise ValueError(f"{keyword} not found in {self.path}")
+        return match.end()
+
+    def read_list(self, pos: int, kind: str = "scalar", rows: slice = None, parse: bool = True):
+        """
+        Read a list (N(...) or N{value}) starting at pos.
+
+        Inputs:
+            pos: the position of the list size N
+            kind: the element type: "label", "scalar", "vector", "symmTensor", or "tensor"
+            rows: only return these rows. For large ascii lists, only the lines up to rows.stop are split
+            parse: if False, only find the end of the list
+        Outputs:
+            The list as an array (N x components for non-scalar types; a view into the memory-mapped
+            file for uncompressed binary lists), or None if parse=False, and the position after the list
+        """
+
+        match = list_start_re.match(self.buffer, self.skip(pos))
+        if match is None:
+            raise ValueError(f"Cannot read a list at position {pos} of {self.path}")
+        n_items = int(match.group(1))
+        n_comp = n_components[kind]
+        dtype = self.label_dtype if kind == "label" else self.scalar_dtype
+        start = match.end()
+
+        # uniform list: N{value}. Binary files always write the N(...) form
+        if match.group(2) == b"{":
+            end = self.buffer.find(b"}", start)
+            array = None
+            if parse:
+                array = np.broadcast_to(self.parse_ascii(self.buffer[start:end], dtype), (n_items, n_comp))
+            return self.shape(array, n_comp, rows), end + 1
+
+        if self.binary:
+            end = start + n_items * n_comp * dtype.itemsize
+            array = None
+            if parse:
+                array = np.frombuffer(self.buffer, dtype, count=n_items * n_comp, offset=start)
+                array = self.shape(array.reshape(n_items, n_comp), n_comp, rows)
+            return array, self.buffer.find(b")", end) + 1
+
+        # ascii: nested lists end with "))", scalar lists with ")"
+        if n_comp == 1 or n_items == 0:
+            end = self.buffer.find(b")", start)
+        else:
+            end = re.compile(rb"\)\s*\)").search(self.buffer, start).start() + 1
+        if not parse:
+            return None, end + 1
+
+        if rows is not None and n_items > 10 and rows.stop is not None:
+            # long ascii lists have one item per line, so only split the lines that are needed
+            lines = self.buffer[start:end].split(b"\n", rows.stop + 1)
+            array = self.parse_ascii(b" ".join(lines[1 : rows.stop + 1][rows]), dtype).reshape(-1, n_comp)
+            return self.shape(array, n_comp, None), end + 1
+        array = self.parse_ascii(self.buffer[start:end], dtype).reshape(n_items, n_comp)
+        return self.shape(array, n_comp, rows), end + 1
+
+    @staticmethod
+    def parse_ascii(text: bytes, dtype) -> np.ndarray:
+        """Parse the numbers in an ascii list, ignoring the parentheses"""
+        return np.array(bytes(text).replace(b"(", b" ").replace(b")", b" ").split(), dtype=dtype)
+
+    @staticmethod
+    def shape(array, n_comp: int, rows: slice):
+        """Select rows and drop the component axis of scalar and label lists"""
+        if array is None:
+            return None
+        if rows is not None:
+            array = array[rows]
+        return array[:, 0] if n_comp == 1 else array
+
+
+def processor_dirs(case_path: str) -> list:
+    """Return the processor* directories of a decomposed case in processor order (empty if not decomposed)"""
+    names = [d for d in os.listdir(case_path) if re.fullmatch(r"processor\d+", d)]
+    return [os.path.join(case_path, d) for d in sorted(names, key=lambda d: int(d[9:]))]
+
+
+def time_dir_names(path: str) -> list:
+    """Return the names of the time directories in path, sorted by value"""
+    times = []
+    for name in os.listdir(path):
+        try:
+            float(name)
+        except ValueError:
+            continue
+        if os.path.isdir(os.path.join(path, name)):
+            times.append(name)
+    return sorted(times, key=float)
+
+
+def is_reconstructed(case_path: str, time_names: list = None, fields: list = None) -> bool:
+    """
+    Check whether reconstructPar has written the given time steps and fields of a decomposed case
+    to the case directory. The job runner writes the reconstructed_flag file (with the reconstructed
+    times and fields) after reconstructPar succeeds
+
+    Inputs:
+        case_path: the case directory, e.g., airfoils
+        time_names: the time steps to read. None means all the non-zero time steps of processor0
+        fields: the fields to read. None means all fields
+    Outputs:
+        True if the case directory has all of them, so the readers can skip the processor* directories
+    """
+
+    flag_file = os.path.join(case_path, reconstructed_flag)
+    processors = processor_dirs(case_path)
+    if not os.path.exists(flag_file) or not processors:
+        return False
+    try:
+        with open(flag_file) as f:
+            reconstructed = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    if time_names is None:
+        time_names = [t for t in time_dir_names(processors[0]) if float(t) > 0]
+    reconstructed_times = [float(t) for t in reconstructed["times"]]
+    for time_name in time_names:
+        if all(abs(float(time_name) - t) > 1e-12 for t in reconstructed_times):
+            return False
+
+    # an empty field list means that all fields were reconstructed
+    if reconstructed["fields"] and (fields is None or not set(fields) <= set(reconstructed["fields"])):
+        return False
+    return True
+
+
+def case_dirs(case_path: str, time_names: list = None, fields: list = None) -> list:
+    """
+    Return the directories to read: the processor* directories of a decomposed case (in processor order),
+    or [case_path] if the case is not decomposed or reconstructPar has written the time steps and
+    fields to read (see is_reconstructed)
+    """
+    processors = processor_dirs(case_path)
+    if not processors or is_reconstructed(case_path, time_names, fields):
+        return [case_path]
+    return processors
+
+
+def list_times(case_path: str) -> list:
+    """Return the names of the time directories of a case (from processor0 if decomposed), sorted by value"""
+    return time_dir_names(case_dirs(case_path)[0])
+
+
+def read_boundary(mesh_path: str) -> dict:
+    """
+    Read polyMesh/boundary
+
+    Inputs:
+        mesh_path: the polyMesh directory
+    Outputs:
+        A dict of patch name -> {"type": str, "nFaces": int, "startFace": int}, in file order
+    """
+
+    foam_file = FoamFile(os.path.join(mesh_path, "boundary"))
+    buffer = foam_file.buffer
+    pos = list_start_re.match(buffer, foam_file.skip(foam_file.header_end)).end()
+
+    patches = {}
+    while True:
+        pos = foam_file.skip(pos)
+        if buffer[pos : pos + 1] == b")":
+            return patches
+        name = word_re.match(buffer, pos)
+        pos = foam_file.skip(name.end()) + 1  # skip "{"
+        end = buffer.find(b"}", pos)
+        entries = dict(header_entry_re.findall(buffer[pos:end]))
+        patches[name.group().decode().strip('"')] = {
+            "type": entries[b"type"].decode().strip(),
+            "nFaces": int(entries[b"nFaces"]),
+            "startFace": int(entries[b"startFace"]),
+        }
+        pos = end + 1
+
+
+def read_points(path: str) -> np.ndarray:
+    """Read a pointField file (polyMesh/points) as an N x 3 array"""
+    foam_file = FoamFile(path)
+    return foam_file.read_list(foam_file.header_end, "vector")[0]
+
+
+def read_faces(foam_file: FoamFile, start_face: int, n_faces: int):
+    """
+    Read the faces start_face to start_face + n_faces from polyMesh/faces
+
+    Outputs:
+        offsets (n_faces + 1) and point labels of the faces in the compact format: the points
+        of face i are labels[offsets[i] : offsets[i + 1]]
+    """
+
+    rows = slice(start_face, start_face + n_faces)
+
+    # binary meshes are written as faceCompactList: a list of offsets followed by a list of labels
+    if foam_file.header.get("class") == "faceCompactList":
+        offsets, pos = foam_file.read_list(foam_file.header_end, "label")
+        offsets = offsets[start_face : start_face + n_faces + 1]
+        labels, _ = foam_file.read_list(pos, "label", rows=slice(offsets[0], offsets[-1]))
+        return offsets - offsets[0], labels
+
+    # ascii faceList: one face "n(p0 p1 ...)" per line
+    buffer = foam_file.buffer
+    match = list_start_re.match(buffer, foam_file.skip(foam_file.header_end))
+    lines = buffer[match.end() :].split(b"\n", rows.stop + 1)[1 : rows.stop + 1][rows]
+    tokens = FoamFile.parse_ascii(b" ".join(lines), foam_file.label_dtype)
+    if tokens.size == 5 * n_faces and np.all(tokens[::5] == 4):
+        # all quads
+        return np.arange(0, 4 * n_faces + 1, 4), tokens.reshape(-1, 5)[:, 1:].ravel()
+
+    sizes = []
+    labels = []
+    pos = 0
+    while pos < tokens.size:
+        sizes.append(tokens[pos])
+        labels.append(tokens[pos + 1 : pos + 1 + tokens[pos]])
+        pos += 1 + tokens[pos]
+    return np.concatenate([[0], np.cumsum(sizes)]), np.concatenate(labels)
+
+
+def face_geometry(points: np.ndarray, offsets: np.ndarray, labels: np.ndarray):
+    """
+    Compute face centres and area vectors the way OpenFOAM does: the face is split into triangles
+    around the mean of its points
+
+    Outputs:
+        centres (N x 3) and area vectors (N x 3, pointing out of the domain for boundary faces)
+    """
+
+    n_faces = offsets.size - 1
+    sizes = np.diff(offsets)
+    centres = np.zeros((n_faces, 3))
+    areas = np.zeros((n_faces, 3))
+    for size in np.unique(sizes):
+        faces = np.nonzero(sizes == size)[0]
+        face_points = points[labels[offsets[faces][:, None] + np.arange(size)]]
+        mean_point = face_points.mean(axis=1, keepdims=True)
+        next_points = np.roll(face_points, -1, axis=1)
+        triangle_areas = 0.5 * np.cross(face_points - mean_point, next_points - mean_point)
+        triangle_centres = (face_points + next_points + mean_point) / 3.0
+        weights = np.linalg.norm(triangle_areas, axis=2, keepdims=True)
+        areas[faces] = triangle_areas.sum(axis=1)
+        centres[faces] = (triangle_centres * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-300)
+    return centres, areas
+
+
+def uniform_values(value: np.ndarray, n_faces: int) -> np.ndarray:
+    """Broadcast a uniform scalar or vector value to n_faces faces"""
+    if value.size == 1:
+        return np.full(n_faces, value[0])
+    return np.broadcast_to(value, (n_faces, value.size))
+
+
+def skip_entry(foam_file: FoamFile, pos: int) -> int:
+    """Return the position after a dictionary entry value (ending with ";") or a sub-dictionary"""
+    buffer = foam_file.buffer
+    if buffer[pos : pos + 1] != b"{":
+        return buffer.find(b";", pos) + 1
+    depth = 0
+    while True:
+        pos = re.compile(rb"[{}]").search(buffer, pos)
+        depth += 1 if pos.group() == b"{" else -1
+        pos = pos.end()
+        if depth == 0:
+            return pos
+
+
+def read_patch_field(path: str, patches: dict, owner: dict, kind: str) -> dict:
+    """
+    Read the values of a volume field on selected boundary patches
+
+    Inputs:
+        path: the field file, e.g., case/1000/p
+        patches: patch name -> boundary entry (see read_boundary)
+        owner: patch name -> owner cells of the patch faces, used for patches that do not write
+            a value (e.g., zeroGradient), whose face values are the owner cell values
+        kind: "scalar" or "vector"
+    Outputs:
+        A dict of patch name -> array of face values
+    """
+
+    foam_file = FoamFile(path)
+    buffer = foam_file.buffer
+
+    # the internal field is only parsed if a patch needs its owner cell values
+    pos = foam_file.skip(foam_file.find_keyword("internalField"))
+    match = field_value_re.match(buffer, pos)
+    internal_start = None
+    if match.group(1) == b"uniform":
+        end = buffer.find(b";", match.end())
+        internal_value = FoamFile.parse_ascii(buffer[match.end() : end], foam_file.scalar_dtype)
+    else:
+        internal_start = match.end()
+        _, end = foam_file.read_list(internal_start, kind, parse=False)
+
+    values = {}
+    pos = foam_file.skip(foam_file.find_keyword("boundaryField", end)) + 1  # skip "{"
+    while True:
+        pos = foam_file.skip(pos)
+        if buffer[pos : pos + 1] in (b"}", b""):
+            break
+        name = word_re.match(buffer, pos)
+        patch_name = name.group().decode().strip('"')
+        selected = patch_name in patches
+        pos = foam_file.skip(name.end()) + 1  # skip "{"
+
+        # read the entries of the patch, only parsing the values of the selected patches
+        while True:
+            pos = foam_file.skip(pos)
+            if buffer[pos : pos + 1] == b"}":
+                pos += 1
+                break
+            key = word_re.match(buffer, pos)
+            is_value = selected and key.group() == b"value"
+            pos = foam_file.skip(key.end())
+            match = field_value_re.match(buffer, pos)
+            if match is not None and match.group(1) == b"nonuniform":
+                array, pos = foam_file.read_list(match.end(), match.group(2).decode(), parse=is_value)
+                if is_value:
+                    values[patch_name] = array
+                pos = buffer.find(b";", pos) + 1
+            elif match is not None and is_value:
+                end = buffer.find(b";", match.end())
+                value = FoamFile.parse_ascii(buffer[match.end() : end], foam_file.scalar_dtype)
+                values[patch_name] = uniform_values(value, patches[patch_name]["nFaces"])
+                pos = end + 1
+            else:
+                pos = skip_entry(foam_file, pos)
+
+    # patches without a value entry take the values of their owner cells
+    missing = [patch_name for patch_name in patches if patch_name not in values]
+    if missing and internal_start is None:
+        for patch_name in missing:
+            values[patch_name] = uniform_values(internal_value, patches[patch_name]["nFaces"])
+    elif missing:
+        internal_field = foam_file.read_list(internal_start, kind)[0]
+        for patch_name in missing:
+            values[patch_name] = internal_field[owner[patch_name]]
+    return values
+
+
+def read_patch_topology(case_path: str, patch_names: list, time_names: list = None, fields: list = None) -> list:
+    """
+    Read the boundary entries, faces, and owner cells of selected patches. They do not change between
+    time steps, so they can be read once and reused for all time steps (see read_patch_values)
+
+    Inputs:
+        case_path: the case directory, e.g., airfoils
+        patch_names: the patches to read, e.g., ["wing"]
+        time_names, fields: the time steps and fields that will be read with this topology. They select
+            the reconstructed case directory over the processor* directories when possible (see case_dirs)
+    Outputs:
+        A list with one dict per processor* directory (or the case directory) that has the patches:
+        {"case_dir": str, "patches": name -> boundary entry, "faces": name -> (offsets, labels),
+        "owner": name -> owner cells of the faces}
+    """
+
+    topology = []
+    for case_dir in case_dirs(case_path, time_names, fields):
+        mesh_path = os.path.join(case_dir, "constant", "polyMesh")
+        boundary = read_boundary(mesh_path)
+        patches = {name: boundary[name] for name in patch_names if name in boundary and boundary[name]["nFaces"] > 0}
+        if not patches:
+            continue
+
+        faces_file = FoamFile(os.path.join(mesh_path, "faces"))
+        owner_file = FoamFile(os.path.join(mesh_path, "owner"))
+        faces = {}
+        owner = {}
+        for name, patch in patches.items():
+            rows = slice(patch["startFace"], patch["startFace"] + patch["nFaces"])
+            faces[name] = read_faces(faces_file, patch["startFace"], patch["nFaces"])
+            owner[name] = owner_file.read_list(owner_file.header_end, "label", rows=rows)[0]
+        topology.append({"case_dir": case_dir, "patches": patches, "faces": faces, "owner": owner})
+
+    if not topology:
+        raise ValueError(f"Patches {patch_names} not found in {case_path}")
+    return topology
+
+
+def read_patch_points(topology: list, time_name: str) -> list:
+    """
+    Return the points of each entry of the topology at one time. The optimization moves the mesh
+    and writes the new points in the time directories; otherwise the points are in constant/polyMesh
+    """
+
+    points = []
+    for entry in topology:
+        points_path = os.path.join(entry["case_dir"], time_name, "polyMesh", "points")
+        if not os.path.exists(points_path) and not os.path.exists(points_path + ".gz"):
+            points_path = os.path.join(entry["case_dir"], "constant", "polyMesh", "points")
+        points.append(read_points(points_path))
+    return points
+
+
+def read_patch_geometry(topology: list, time_name: str):
+    """Return the face centres and area vectors (N x 3) of the patches, concatenated like read_patch_values"""
+    centres = []
+    areas = []
+    for entry, points in zip(topology, read_patch_points(topology, time_name)):
+        for name in entry["patches"]:
+            face_centres, face_areas = face_geometry(points, *entry["faces"][name])
+            centres.append(face_centres)
+            areas.append(face_areas)
+    return np.concatenate(centres), np.concatenate(areas)
+
+
+def read_patch_values(topology: list, time_name: str, field: str, kind: str = "scalar") -> np.ndarray:
+    """Return the face values of a field on the patches, concatenated over the patches and processors"""
+    values = []
+    for entry in topology:
+        patches = entry["patches"]
+        patch_values = read_patch_field(
+            os.path.join(entry["case_dir"], time_name, field), patches, entry["owner"], kind
+        )
+        values.extend(patch_values[name] for name in patches)
+    return np.concatenate(values)
+
+
+def read_patches(case_path: str, time_name: str, fields: dict, patch_names: list) -> dict:
+    """
+    Read the geometry and field values of selected boundary patches at one time, merging
+    the processor* directories of decomposed cases
+
+    Inputs:
+        case_path: the case directory, e.g., airfoils
+        time_name: the time directory name, e.g., "1000" or "0.0001" (see list_times)
+        fields: field name -> kind ("scalar" or "vector"), e.g., {"p": "scalar", "U": "vector"}
+        patch_names: the patches to read, e.g., ["wing"]
+    Outputs:
+        A dict with "centres" and "areas" (face centres and area vectors, N x 3) and one array per
+        field, concatenated over the selected patches and processors
+    """
+
+    topology = read_patch_topology(case_path, patch_names, [time_name], list(fields))
+    centres, areas = read_patch_geometry(topology, time_name)
+    result = {"centres": centres, "areas": areas}
+    for field, kind in fields.items():
+        result[field] = read_patch_values(topology, time_name, field, kind)
+    return result
+
+
+def integrate_pressure_loads(centres: np.ndarray, areas: np.ndarray, p: np.ndarray, p_ref: float, center) -> tuple:
+    """
+    Integrate the pressure force and moment on boundary faces, whose area vectors point out of
+    the fluid domain (into the body)
+
+    Outputs:
+        The force vector and the moment vector about center
+    """
+
+    forces = (p - p_ref)[:, None] * areas
+    moments = np.cross(centres - np.asarray(center), forces)
+    return forces.sum(axis=0), moments.sum(axis=0)
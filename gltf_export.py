@@ -0,0 +1,225 @@
+"""
+A numpy-only exporter of surfaces to binary glTF (.glb) files for the static web viewer.
+
+The files are small enough to be served to many browsers by the artifact HTTP server: the positions are
+quantized to normalized 16-bit integers (KHR_mesh_quantization, the dequantization is the node transform),
+the indices use the smallest unsigned integer type, and scalar fields are baked into 8-bit vertex colors.
+Mesh edges are exported as a line primitive.
+"""
+
+import json
+import struct
+import numpy as np
+
+# glTF component types and buffer view targets
+UNSIGNED_BYTE, SHORT, UNSIGNED_SHORT, UNSIGNED_INT = 5121, 5122, 5123, 5125
+ARRAY_BUFFER, ELEMENT_ARRAY_BUFFER = 34962, 34963
+
+# the diverging colormap of the vertex colors (blue - light gray - red), also used by the viewer color bar
+colormap_stops = np.array([[59, 76, 192], [221, 221, 221], [180, 4, 38]], dtype=np.float64)
+
+
+def merge_vertices(triangles: np.ndarray, tolerance: float = 1e-9):
+    """
+    Merge the duplicated vertices of triangle soups (e.g., from STL files)
+
+    Inputs:
+        triangles: n x 3 x 3 triangle vertices
+        tolerance: vertices closer than tolerance (relative to the bounding box) are merged
+    Outputs:
+        The m x 3 unique points and the n x 3 point labels of the triangles
+    """
+    vertices = triangles.reshape(-1, 3)
+    size = max(np.ptp(vertices, axis=0).max(), 1e-300)
+    _, first, inverse = np.unique(
+        np.round(vertices / (size * tolerance)), axis=0, return_index=True, return_inverse=True
+    )
+    return vertices[first], inverse.reshape(-1, 3)
+
+
+def triangulate(offsets: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """
+    Split polygon faces into triangles (fans around the first point of each face)
+
+    Inputs:
+        offsets, labels: the faces in the compact format of foam_reader.read_faces
+    Outputs:
+        n x 3 point labels of the triangles
+    """
+    sizes = np.diff(offsets)
+    # triangle j of a face uses the points 0, j + 1, j + 2 of the face
+    face = np.repeat(np.arange(len(sizes)), sizes - 2)
+    j = np.arange(len(face)) - np.repeat(np.cumsum(sizes - 2) - (sizes - 2), sizes - 2)
+    first = offsets[:-1][face]
+    return np.column_stack([labels[first], labels[first + j + 1], labels[first + j + 2]])
+
+
+def face_edges(offsets: np.ndarray, labels: np.ndarray) -> np.ndarray:
+    """Return the unique edges (n x 2 point labels) of polygon faces in the compact format"""
+    # the next point of each face point, wrapping around to the first point of the face
+    next_index = np.arange(len(labels)) + 1
+    next_index[offsets[1:] - 1] = offsets[:-1]
+    edges = np.sort(np.column_stack([labels, labels[next_index]]), axis=1)
+    return np.unique(edges, axis=0)
+
+
+def face_to_point_values(offsets: np.ndarray, labels: np.ndarray, face_values: np.ndarray, n_points: int):
+    """Average face values to the points of the faces"""
+    sizes = np.diff(offsets)
+    weights = np.repeat(face_values, sizes)
+    counts = np.bincount(labels, minlength=n_points)
+    return np.bincount(labels, weights=weights, minlength=n_points) / np.maximum(counts, 1)
+
+
+def apply_colormap(values: np.ndarray, value_range) -> np.ndarray:
+    """Map values to n x 4 RGBA colors (uint8) with colormap_stops over value_range"""
+    vmin, vmax = value_range
+    t = np.clip((values - vmin) / (vmax - vmin), 0.0, 1.0) if vmax > vmin else np.full(len(values), 0.5)
+    position = t * (len(colormap_stops) - 1)
+    lower = np.minimum(position.astype(int), len(colormap_stops) - 2)
+    fraction = (position - lower)[:, None]
+    rgb = colormap_stops[lower] * (1.0 - fraction) + colormap_stops[lower + 1] * fraction
+    return np.column_stack([np.round(rgb), np.full(len(values), 255)]).astype(np.uint8)
+
+
+def quantize_positions(points: np.ndarray):
+    """
+    Quantize positions to normalized 16-bit integers in the bounding box
+
+    Outputs:
+        n x 4 int16 positions (padded to 8 bytes per vertex, as glTF aligns vertex attributes to 4 bytes),
+        and the node scale and translation that map them back to the original coordinates
+    """
+    lower = points.min(axis=0)
+    upper = points.max(axis=0)
+    translation = 0.5 * (lower + upper)
+    scale = np.maximum(0.5 * (upper - lower), 1e-12)
+    quantized = np.zeros((len(points), 4), dtype=np.int16)
+    quantized[:, :3] = np.round((points - translation) / scale * 32767.0)
+    return quantized, scale, translation
+
+
+def write_glb(
+    path: str,
+    points: np.ndarray,
+    triangles: np.ndarray = None,
+    lines: np.ndarray = None,
+    point_values: np.ndarray = None,
+    value_range=None,
+    extras: dict = None,
+):
+    """
+    Write a binary glTF file with a triangle surface and/or line edges sharing quantized points
+
+    Inputs:
+        path: the .glb file to write
+        points: n x 3 point coordinates
+        triangles: m x 3 point labels of the surface triangles, or None
+        lines: k x 2 point labels of the edges, or None
+        point_values: n scalar values baked into vertex colors of the surface, or None
+        value_range: the (min, max) of the colormap. Default: the range of point_values
+        extras: application data stored in the scene extras, e.g., the field name and its range
+    """
+
+    buffer = bytearray()
+    gltf = {
+        "asset": {"version": "2.0", "generator": "dafoam_mcp_server gltf_export"},
+        "extensionsUsed": ["KHR_mesh_quantization", "KHR_materials_unlit"],
+        "extensionsRequired": ["KHR_mesh_quantization"],
+        "buffers": [],
+        "bufferViews": [],
+        "accessors": [],
+        "materials": [],
+        "meshes": [{"primitives": []}],
+    }
+
+    def add_accessor(array, component_type, accessor_type, target, count, normalized=False, stride=None, bounds=None):
+        # every buffer view starts at a 4 byte boundary
+        buffer.extend(b"\0" * (-len(buffer) % 4))
+        view = {"buffer": 0, "byteOffset": len(buffer), "byteLength": array.nbytes, "target": target}
+        if stride:
+            view["byteStride"] = stride
+        buffer.extend(array.tobytes())
+        gltf["bufferViews"].append(view)
+        accessor = {
+            "bufferView": len(gltf["bufferViews"]) - 1,
+            "componentType": component_type,
+            "count": count,
+            "type": accessor_type,
+        }
+        if normalized:
+            accessor["normalized"] = True
+        if bounds is not None:
+            accessor["min"], accessor["max"] = bounds
+        gltf["accessors"].append(accessor)
+        return len(gltf["accessors"]) - 1
+
+    quantized, scale, translation = quantize_positions(points)
+    bounds = (quantized[:, :3].min(axis=0).tolist(), quantized[:, :3].max(axis=0).tolist())
+    position = add_accessor(quantized, SHORT, "VEC3", ARRAY_BUFFER, len(points), True, 8, bounds)
+
+    index_dtype, index_type = (np.uint16, UNSIGNED_SHORT) if len(points) < 65535 else (np.uint32, UNSIGNED_INT)
+
+    if triangles is not None and len(triangles):
+        attributes = {"POSITION": position}
+        if point_values is not None:
+            if value_range is None:
+                value_range = (float(point_values.min()), float(point_values.max()))
+            colors = apply_colormap(point_values, value_range)
+            attributes["COLOR_0"] = add_accessor(colors, UNSIGNED_BYTE, "VEC4", ARRAY_BUFFER, len(points), True)
+        indices = triangles.astype(index_dtype).ravel()
+        gltf["materials"].append(
+            {
+                "pbrMetallicRoughness": {"baseColorFactor": [1.0, 1.0, 1.0, 1.0], "metallicFactor": 0.0},
+                "doubleSided": True,
+            }
+        )
+        gltf["meshes"][0]["primitives"].append(
+            {
+                "attributes": attributes,
+                "indices": add_accessor(indices, index_type, "SCALAR", ELEMENT_ARRAY_BUFFER, len(indices)),
+                "material": len(gltf["materials"]) - 1,
+                "mode": 4,
+            }
+        )
+
+    if lines is not None and len(lines):
+        indices = lines.astype(index_dtype).ravel()
+        gltf["materials"].append(
+            {
+                "pbrMetallicRoughness": {"baseColorFactor": [0.1, 0.1, 0.1, 1.0]},
+                "extensions": {"KHR_materials_unlit": {}},
+            }
+        )
+        gltf["meshes"][0]["primitives"].append(
+            {
+                "attributes": {"POSITION": position},
+                "indices": add_accessor(indices, index_type, "SCALAR", ELEMENT_ARRAY_BUFFER, len(indices)),
+                "material": len(gltf["materials"]) - 1,
+                "mode": 1,
+            }
+        )
+
+    # the node transform dequantizes the positions
+    gltf["nodes"] = [{"mesh": 0, "scale": scale.tolist(), "translation": translation.tolist()}]
+    gltf["scenes"] = [{"nodes": [0], "extras": extras or {}}]
+    gltf["scene"] = 0
+
+    buffer.extend(b"\0" * (-len(buffer) % 4))
+    gltf["buffers"].append({"byteLength": len(buffer)})
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode()
+    json_chunk += b" " * (-len(json_chunk) % 4)
+
+    with open(path, "wb") as f:
+        f.write(struct.pack("<4sII", b"glTF", 2, 12 + 8 + len(json_chunk) + 8 + len(buffer)))
+        f.write(struct.pack("<I4s", len(json_chunk), b"JSON"))
+        f.write(json_chunk)
+        f.write(struct.pack("<I4s", len(buffer), b"BIN\0"))
+        f.write(buffer)
+
+
+def read_glb_json(path: str) -> dict:
+    """Read the JSON chunk of a binary glTF file, e.g., to get the scene extras of an exported file"""
+    with open(path, "rb") as f:
+        _, _, _, json_length, _ = struct.unpack("<4sIII4s", f.read(20))
+        return json.loads(f.read(json_length))
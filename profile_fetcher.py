@@ -0,0 +1,190 @@
+"""
+A fetcher of airfoil coordinate files from the UIUC airfoil database (or any server with the same layout).
+
+Each worker thread keeps one keep-alive connection per host, so a batch of profiles is downloaded
+concurrently without a new TCP/TLS handshake per file. Failed requests (connection errors, 429, and 5xx)
+are retried with exponential backoff, and the content is validated as an airfoil profile before it is
+accepted. The files are cached on disk with their ETag and Last-Modified headers; a cached file is
+revalidated with a conditional request (304 Not Modified costs no download) and used as is when the
+server cannot be reached.
+"""
+
+import concurrent.futures
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+import profile_library
+
+
+class FetchError(Exception):
+    """A profile could not be fetched: not found, invalid content, or the server could not be reached"""
+
+
+class ProfileFetcher:
+    """
+    Fetch profiles as {base_url}{name}.dat into a cache directory
+
+    Inputs:
+        base_url: the URL of the directory of .dat files, e.g., https://m-selig.ae.illinois.edu/ads/coord/
+        cache_dir: the directory of the cached .dat files and their headers (.json)
+        timeout: the timeout in seconds of one request
+        retries: the number of retries after a failed request
+        backoff: the wait in seconds before the first retry, doubled for each following retry
+        max_workers: the number of concurrent downloads of fetch_many
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        cache_dir: str,
+        timeout: float = 10.0,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_workers: int = 4,
+    ):
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_workers = max_workers
+        self.local = threading.local()
+        # the worker threads (and their keep-alive connections) are kept between batches
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+    def connection(self, scheme: str, netloc: str, new: bool = False) -> http.client.HTTPConnection:
+        """Return the keep-alive connection of this thread to a host, or a new one"""
+        if not hasattr(self.local, "connections"):
+            self.local.connections = {}
+        key = (scheme, netloc)
+        if new and key in self.local.connections:
+            self.local.connections.pop(key).close()
+        if key not in self.local.connections:
+            connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            self.local.connections[key] = connection_class(netloc, timeout=self.timeout)
+        return self.local.connections[key]
+
+    def request(self, url: str, headers: dict) -> tuple:
+        """
+        Send a GET request on the keep-alive connection of this thread, following up to 3 redirects
+
+        Outputs:
+            The status, the response headers (lower case names), and the body
+        """
+        for _ in range(4):
+            parts = urllib.parse.urlsplit(url)
+            path = parts.path + (f"?{parts.query}" if parts.query else "")
+            # a kept-alive connection may have been closed by the server, so retry once on a new connection
+            for new in [False, True]:
+                connection = self.connection(parts.scheme, parts.netloc, new)
+                try:
+                    connection.request("GET", path, headers=headers)
+                    response = connection.getresponse()
+                    body = response.read()
+                    break
+                except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                    if new:
+                        self.local.connections.pop((parts.scheme, parts.netloc)).close()
+                        raise
+                except (OSError, http.client.HTTPException):
+                    # e.g., a timeout leaves the connection in an unknown state
+                    self.local.connections.pop((parts.scheme, parts.netloc)).close()
+                    raise
+            response_headers = {name.lower(): value for name, value in response.getheaders()}
+            if response.status in [301, 302, 303, 307, 308] and "location" in response_headers:
+                url = urllib.parse.urljoin(url, response_headers["location"])
+                continue
+            return response.status, response_headers, body
+        raise FetchError(f"too many redirects for {url}")
+
+    def cache_paths(self, name: str) -> tuple:
+        """Return the paths of the cached .dat file and its headers"""
+        return os.path.join(self.cache_dir, f"{name}.dat"), os.path.join(self.cache_dir, f"{name}.json")
+
+    def fetch(self, name: str) -> str:
+        """
+        Fetch one profile into the cache, revalidating a cached file
+
+        Inputs:
+            name: the profile name, e.g., naca4412 (the file is {base_url}{name}.dat)
+        Outputs:
+            The path of the cached .dat file. Raises FetchError if the profile cannot be fetched
+        """
+
+        name = name.lower()
+        dat_path, meta_path = self.cache_paths(name)
+        headers = {"Connection": "keep-alive", "User-Agent": "dafoam_mcp_server"}
+        meta = {}
+        if os.path.exists(dat_path) and os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        url = urllib.parse.urljoin(self.base_url, urllib.parse.quote(f"{name}.dat"))
+        error = None
+        transient = True
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                status, response_headers, body = self.request(url, headers)
+            except (OSError, http.client.HTTPException) as e:
+                error = f"{url}: {e}"
+                transient = True
+                continue
+
+            if status == 304 and meta:
+                return dat_path
+            if status == 200:
+                try:
+                    profile_library.normalize_profile(profile_library.parse_profile(body.decode("latin-1"))[1])
+                except ValueError as e:
+                    raise FetchError(f"{url} is not an airfoil profile: {e}")
+                self.store(name, body, response_headers)
+                return dat_path
+            error = f"{url}: HTTP {status}"
+            transient = status == 429 or status >= 500
+            if not transient:
+                break
+
+        # use the cached file when the server cannot be reached
+        if meta and transient:
+            return dat_path
+        raise FetchError(error)
+
+    def store(self, name: str, body: bytes, headers: dict):
+        """Write a fetched profile and its ETag and Last-Modified headers to the cache"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        dat_path, meta_path = self.cache_paths(name)
+        meta = {"etag": headers.get("etag"), "last_modified": headers.get("last-modified"), "fetched": time.time()}
+        for path, content in [(dat_path, body), (meta_path, json.dumps(meta).encode())]:
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+
+    def fetch_many(self, names: list) -> dict:
+        """
+        Fetch several profiles concurrently
+
+        Outputs:
+            A dict of name -> the path of the cached .dat file, or the FetchError of the profile
+        """
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = {name: self.executor.submit(self.fetch, name) for name in dict.fromkeys(names)}
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except FetchError as e:
+                results[name] = e
+        return results
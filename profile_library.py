@@ -0,0 +1,231 @@
+"""
+An indexed, offline library of airfoil profiles.
+
+The profiles are parsed once from UIUC-style coordinate files (.dat, Selig or Lednicer format) and stored
+normalized (unit chord, the leading edge at x=0, Selig point order) in one memory-mappable .npy file with a
+JSON index of the names, titles, and aliases. Looking up a profile reads only its rows from the .npy file and
+writes the standard .dat file that prefoil and pyGeo read, so the airfoil and wing modules need neither the
+network nor the text parsing of the UIUC files.
+
+Build or extend the library from directories of .dat files or the UIUC zip archive (coord_seligFmt.zip):
+    python profile_library.py -sources airfoils/profiles /path/to/coord_seligFmt.zip -output profiles/library
+"""
+
+import argparse
+import difflib
+import json
+import os
+import re
+import zipfile
+import numpy as np
+
+
+def profile_key(name: str) -> str:
+    """Return the lookup key of a profile name or alias: lower case letters and digits only"""
+    return re.sub(r"[^a-z0-9]", "", name.lower())
+
+
+def parse_profile(text: str) -> tuple:
+    """
+    Parse a UIUC coordinate file in the Selig format (one loop from the trailing edge over the upper surface)
+    or the Lednicer format (the point counts of the two surfaces, then both surfaces from the leading edge)
+
+    Inputs:
+        text: the content of the .dat file
+    Outputs:
+        The title (the header line, or "") and the n x 2 coordinates in the order of the Selig format
+    """
+
+    title = ""
+    rows = []
+    for line in text.splitlines():
+        try:
+            values = [float(v) for v in line.replace(",", " ").split()]
+        except ValueError:
+            values = []
+        if len(values) == 2:
+            rows.append(values)
+        elif not rows and not title and line.strip():
+            title = line.strip()
+    if len(rows) < 3:
+        raise ValueError("an airfoil profile needs at least three points")
+    coords = np.array(rows)
+
+    # Lednicer: the first row holds the point counts of the upper and lower surfaces
+    n_upper, n_lower = coords[0]
+    if n_upper > 1.5 and n_lower > 1.5 and n_upper == int(n_upper) and int(n_upper + n_lower) == len(coords) - 1:
+        upper = coords[1 : 1 + int(n_upper)]
+        lower = coords[1 + int(n_upper) :]
+        coords = np.concatenate([upper[::-1], lower])
+
+    return title, coords
+
+
+def normalize_profile(coords: np.ndarray) -> np.ndarray:
+    """
+    Normalize the coordinates of a profile: leading edge (the smallest x) at x=0, unit chord, no repeated
+    consecutive points, and the counter-clockwise order of the UIUC standard (see profiles/README.md)
+    """
+
+    coords = np.asarray(coords, dtype=np.float64)
+    keep = np.ones(len(coords), dtype=bool)
+    keep[1:] = np.any(np.abs(np.diff(coords, axis=0)) > 1e-12, axis=1)
+    coords = coords[keep]
+
+    x_min = coords[:, 0].min()
+    chord = coords[:, 0].max() - x_min
+    if chord <= 0:
+        raise ValueError("an airfoil profile needs a positive chord")
+    coords = np.column_stack([(coords[:, 0] - x_min) / chord, coords[:, 1] / chord])
+
+    # the shoelace area is negative for a clockwise loop
+    x, y = coords[:, 0], coords[:, 1]
+    if np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y) < 0:
+        coords = coords[::-1]
+    return coords
+
+
+def format_profile(coords: np.ndarray) -> str:
+    """Format coordinates as a .dat file without a header line (the format of the profiles folders)"""
+    return "".join(f"{x:.7f} {y:.7f}\n" for x, y in coords)
+
+
+class ProfileLibrary:
+    """
+    A profile library opened for lookups. The coordinates are memory-mapped, so opening the library and
+    reading a profile do not load the other profiles.
+    """
+
+    def __init__(self, path: str):
+        """
+        Inputs:
+            path: the library path without extension; the coordinates are in path.npy and the index in path.json
+        """
+        with open(path + ".json") as f:
+            index = json.load(f)
+        self.path = path
+        self.profiles = index["profiles"]
+        self.aliases = index["aliases"]
+        self.coords = np.load(path + ".npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def resolve(self, name: str) -> str:
+        """Return the library name of a profile name or alias (case, spaces, and punctuation are ignored), or None"""
+        return self.aliases.get(profile_key(name))
+
+    def suggest(self, name: str, n: int = 5) -> list:
+        """Return the names of up to n profiles whose names or aliases are similar to name"""
+        matches = difflib.get_close_matches(profile_key(name), list(self.aliases), n=3 * n, cutoff=0.6)
+        names = []
+        for key in matches:
+            if self.aliases[key] not in names:
+                names.append(self.aliases[key])
+        return names[:n]
+
+    def get(self, name: str) -> np.ndarray:
+        """Return the normalized n x 2 coordinates of a profile name or alias. Raises KeyError if not found"""
+        resolved = self.resolve(name)
+        if resolved is None:
+            raise KeyError(name)
+        entry = self.profiles[resolved]
+        return np.array(self.coords[entry["offset"] : entry["offset"] + entry["count"]])
+
+    def write_dat(self, name: str, path: str):
+        """Write the coordinates of a profile name or alias to a .dat file. Raises KeyError if not found"""
+        coords = self.get(name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(format_profile(coords))
+        os.replace(tmp_path, path)
+
+
+def read_sources(sources: list):
+    """Yield (name, text) of the .dat files in directories and zip archives"""
+    for source in sources:
+        if zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as archive:
+                for member in sorted(archive.namelist()):
+                    if member.lower().endswith(".dat"):
+                        name = os.path.splitext(os.path.basename(member))[0]
+                        yield name, archive.read(member).decode("latin-1")
+        else:
+            for file in sorted(os.listdir(source)):
+                if file.lower().endswith(".dat"):
+                    with open(os.path.join(source, file), encoding="latin-1") as f:
+                        yield os.path.splitext(file)[0], f.read()
+
+
+def build_library(sources: list, path: str) -> tuple:
+    """
+    Parse and normalize the .dat files of directories and zip archives and write the library. A profile found
+    in several sources is taken from the first one. The library at path, if any, is extended
+
+    Inputs:
+        sources: directories of .dat files or zip archives of them
+        path: the library path without extension (path.npy and path.json are written)
+    Outputs:
+        The number of profiles in the library and the (name, error) of the files that could not be parsed
+    """
+
+    profiles = {}
+    coords = []
+    offset = 0
+    if os.path.exists(path + ".json"):
+        library = ProfileLibrary(path)
+        for name, entry in library.profiles.items():
+            profiles[name] = {"title": entry["title"], "offset": offset, "count": entry["count"]}
+            coords.append(library.get(name))
+            offset += entry["count"]
+
+    failed = []
+    for name, text in read_sources(sources):
+        name = name.lower()
+        if name in profiles:
+            continue
+        try:
+            title, profile = parse_profile(text)
+            profile = normalize_profile(profile)
+        except ValueError as e:
+            failed.append((name, str(e)))
+            continue
+        profiles[name] = {"title": title, "offset": offset, "count": len(profile)}
+        coords.append(profile)
+        offset += len(profile)
+
+    # the names win over the aliases from the titles, e.g., "NACA 0012 AIRFOILS" -> naca0012airfoils
+    aliases = {}
+    for name, entry in profiles.items():
+        title_key = profile_key(entry["title"])
+        for key in [title_key, re.sub(r"airfoils?$", "", title_key)]:
+            if key:
+                aliases.setdefault(key, name)
+    for name in profiles:
+        aliases[profile_key(name)] = name
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.npy.{os.getpid()}.tmp", "wb") as f:
+        np.save(f, np.concatenate(coords) if coords else np.zeros((0, 2)))
+    with open(f"{path}.json.{os.getpid()}.tmp", "w") as f:
+        json.dump({"profiles": profiles, "aliases": aliases}, f, indent=1, sort_keys=True)
+    os.replace(f"{path}.npy.{os.getpid()}.tmp", path + ".npy")
+    os.replace(f"{path}.json.{os.getpid()}.tmp", path + ".json")
+    return len(profiles), failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-sources", help="directories of .dat files or zip archives of them", nargs="+", type=str)
+    parser.add_argument(
+        "-output",
+        help="the library path without extension",
+        type=str,
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles", "library"),
+    )
+    args = parser.parse_args()
+
+    n_profiles, failed = build_library(args.sources, args.output)
+    for name, error in failed:
+        print(f"Skipped {name}: {error}")
+    print(f"Wrote {n_profiles} profiles to {args.output}.npy and {args.output}.json")
@@ -0,0 +1,251 @@
+"""
+Estimates of the mesh size, the wall time, and the memory of a mesh generation or a DAFoam run before it starts.
+
+The cell count of an octree mesh (cfMesh and snappyHexMesh) is estimated from the background cell size, the
+refinement levels, and the wing surfaces: every refinement level adds a shell of n_buffer cells around the
+surfaces, every feature line (a sharp edge or a patch boundary of the STL files, where the curvature is
+resolved) refined above its surfaces adds a tube of cells, and every boundary layer adds one cell per wall face.
+The wall time is fitted on the finished runs of a history file (one JSON record per line) as
+wall_time = a * cells^b * cpu_cores^c, and the cell estimate is corrected by the ratio of the actual to the
+estimated cells of the past meshes, so the estimates improve with every run. An optimization is fitted per
+iteration (its wall time divided by the max_opt_iters of the record), so runs with different iteration counts
+calibrate the same fit.
+"""
+
+import json
+import os
+import numpy as np
+import gltf_export
+import stl_io
+
+# the number of the latest matching records used for the calibration
+max_records = 50
+
+
+def surface_statistics(triangles: np.ndarray, feature_angle: float = 30.0) -> dict:
+    """
+    Compute the area and the feature edges of a triangulated surface
+
+    Inputs:
+        triangles: n x 3 x 3 triangle vertices
+        feature_angle: edges whose faces turn by more than this angle (in degrees) are features, i.e.,
+            180 - includedAngle of surfaceFeatureExtract. Open and non-manifold edges are always features
+    Outputs:
+        A dict with the area, the length of the feature edges and of the open edges (a part of the feature edges),
+        and the bounding box (lower and upper corners)
+    """
+
+    if len(triangles) == 0:
+        return {"area": 0.0, "feature_length": 0.0, "open_length": 0.0, "lower": [0.0] * 3, "upper": [0.0] * 3}
+
+    points, labels = gltf_export.merge_vertices(triangles)
+    normals = stl_io.compute_normals(points[labels])
+    area = 0.5 * np.linalg.norm(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]), axis=1)
+
+    # group the three edges of all triangles by their (sorted) point labels
+    edges = np.sort(labels[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    faces = np.repeat(np.arange(len(labels)), 3)
+    keys = edges[:, 0].astype(np.int64) * len(points) + edges[:, 1]
+    order = np.argsort(keys, kind="stable")
+    keys, edges, faces = keys[order], edges[order], faces[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+
+    feature = counts != 2
+    manifold = starts[counts == 2]
+    cosine = np.einsum("ij,ij->i", normals[faces[manifold]], normals[faces[manifold + 1]])
+    # degenerate faces have zero normals; their edges are not features
+    degenerate = ~np.any(normals[faces[manifold]], axis=1) | ~np.any(normals[faces[manifold + 1]], axis=1)
+    feature[counts == 2] = (cosine < np.cos(np.radians(feature_angle))) & ~degenerate
+    lengths = np.linalg.norm(points[edges[starts, 0]] - points[edges[starts, 1]], axis=1)
+
+    return {
+        "area": float(area.sum()),
+        "feature_length": float(lengths[feature].sum()),
+        "open_length": float(lengths[counts == 1].sum()),
+        "lower": points.min(axis=0).tolist(),
+        "upper": points.max(axis=0).tolist(),
+    }
+
+
+def estimate_octree_cells(
+    background_cells: float,
+    background_size: float,
+    surfaces: list,
+    lines: list,
+    n_buffer: float,
+    n_layers: int,
+) -> dict:
+    """
+    Estimate the cell count of an octree mesh refined towards surfaces and feature lines
+
+    Inputs:
+        background_cells: the number of cells of the background mesh (the domain volume / background_size^3)
+        background_size: the edge length of the background cells
+        surfaces: a list of (area, level) of the refined surfaces; the surface cells are background_size / 2^level
+        lines: a list of (length, level, surface level) of the refined feature lines, whose tube of cells is
+            refined from the level of their surfaces to level
+        n_buffer: the number of cells of each refinement level between two levels (nCellsBetweenLevels)
+        n_layers: the number of boundary layers on the surfaces
+    Outputs:
+        A dict of the cells of the background, the surface refinement, the feature refinement, the boundary
+        layers, and their total
+    """
+
+    def size(level):
+        return background_size / 2.0**level
+
+    # each level is a shell of n_buffer cells around the (closed) surface, outside of the body
+    surface_cells = sum(area * n_buffer / size(level) ** 2 for area, level in surfaces for level in range(1, level + 1))
+    # each level above the surface level is a tube of radius n_buffer cells, half of it outside of the body
+    feature_cells = sum(
+        0.5 * np.pi * n_buffer**2 * length / size(level)
+        for length, line_level, surface_level in lines
+        for level in range(surface_level + 1, line_level + 1)
+    )
+    layer_cells = sum(n_layers * area / size(level) ** 2 for area, level in surfaces)
+
+    cells = {
+        "background": float(background_cells),
+        "surface refinement": float(surface_cells),
+        "feature refinement": float(feature_cells),
+        "boundary layers": float(layer_cells),
+    }
+    cells["total"] = sum(cells.values())
+    return cells
+
+
+def read_history(path: str) -> list:
+    """Read the records of a history file (one JSON object per line). Broken lines are skipped"""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def append_history(path: str, record: dict):
+    """Append a record to a history file"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def matching_records(history: list, **fields) -> list:
+    """Return the latest max_records successful records of the history with the given field values"""
+    records = [
+        record
+        for record in history
+        if all(record.get(key) == value for key, value in fields.items())
+        and record.get("return_code") == 0
+        and record.get("cells", 0) > 0
+    ]
+    return records[-max_records:]
+
+
+def cell_correction(history: list, module: str, mesh_tool: str) -> tuple:
+    """
+    Return the median ratio of the actual to the estimated cells of the past meshes of a module and mesh tool
+    (1 without past meshes) and the number of meshes it is based on
+    """
+    records = [
+        record
+        for record in matching_records(history, module=module, run_type="mesh", mesh_tool=mesh_tool)
+        if record.get("estimated_cells", 0) > 0
+    ]
+    if not records:
+        return 1.0, 0
+    return float(np.median([record["cells"] / record["estimated_cells"] for record in records])), len(records)
+
+
+def fit_wall_time(history: list, module: str, run_type: str, mesh_tool: str = None) -> tuple:
+    """
+    Fit log(wall_time) = a + b * log(cells) + c * log(cpu_cores) on the past runs of a module and run type.
+    The wall time of an optimization is per iteration; its records without max_opt_iters are skipped. The
+    meshes are fitted per mesh_tool if it is given, since cfMesh and snappyHexMesh scale differently
+
+    The exponents are only fitted with at least three runs and two different cell counts (b) or core counts (c),
+    and are clipped to 0.5 <= b <= 2 and -1 <= c <= 0. Otherwise b = 1 and c = -1 (ideal strong scaling)
+
+    Outputs:
+        The coefficients (a, b, c), the scatter factor of the runs around the fit (1 for fewer than three runs),
+        and the number of runs, or None if there are no runs
+    """
+
+    fields = {"mesh_tool": mesh_tool} if run_type == "mesh" and mesh_tool else {}
+    records = [
+        record
+        for record in matching_records(history, module=module, run_type=run_type, **fields)
+        if record["wall_time"] and (run_type != "optimization" or record.get("max_opt_iters", 0) > 0)
+    ]
+    if not records:
+        return None
+    x = np.log([record["cells"] for record in records])
+    y = np.log([record["cpu_cores"] for record in records])
+    t = np.log([record["wall_time"] / record.get("max_opt_iters", 1) for record in records])
+
+    b, c = 1.0, -1.0
+    columns = [np.ones(len(records))]
+    fit_b = len(records) >= 3 and len(np.unique(x)) >= 2
+    fit_c = len(records) >= 3 and len(np.unique(y)) >= 2
+    if fit_b:
+        columns.append(x)
+    if fit_c:
+        columns.append(y)
+    if len(columns) > 1:
+        coefficients = np.linalg.lstsq(np.column_stack(columns), t, rcond=None)[0]
+        if fit_b:
+            b = float(np.clip(coefficients[1], 0.5, 2.0))
+        if fit_c:
+            c = float(np.clip(coefficients[-1], -1.0, 0.0))
+    residuals = t - b * x - c * y
+    a = float(residuals.mean())
+    scatter = float(np.exp(residuals.std())) if len(records) >= 3 else 1.0
+    return (a, b, c), scatter, len(records)
+
+
+def estimate_wall_time(
+    history: list,
+    module: str,
+    run_type: str,
+    cells: float,
+    cpu_cores: int,
+    core_seconds_per_cell: float,
+    max_opt_iters: int = 1,
+    mesh_tool: str = None,
+) -> dict:
+    """
+    Estimate the wall time of a mesh generation or a run from the past runs of the module and run type (and
+    mesh_tool for a mesh generation), or from core_seconds_per_cell without past runs. For an optimization,
+    core_seconds_per_cell and the fit are per iteration and are scaled by max_opt_iters
+
+    Outputs:
+        A dict with the wall time in seconds, its range (low, high) from the scatter of the past runs, and
+        the number of past runs it is based on
+    """
+
+    iterations = max_opt_iters if run_type == "optimization" else 1
+    fit = fit_wall_time(history, module, run_type, mesh_tool)
+    if fit is None:
+        wall_time = core_seconds_per_cell * cells / cpu_cores * iterations
+        return {"wall_time": wall_time, "range": None, "n_runs": 0}
+    (a, b, c), scatter, n_runs = fit
+    wall_time = float(np.exp(a + b * np.log(cells) + c * np.log(cpu_cores))) * iterations
+    return {"wall_time": wall_time, "range": (wall_time / scatter, wall_time * scatter), "n_runs": n_runs}
+
+
+def estimate_memory(history: list, module: str, cells: float) -> float:
+    """Estimate the peak memory (MB) of a run from the median memory per cell of the past runs, or None"""
+    values = [
+        record["peak_memory_kb_per_cell"]
+        for record in matching_records(history, module=module)
+        if record.get("peak_memory_kb_per_cell")
+    ]
+    if not values:
+        return None
+    return float(np.median(values)) * cells / 1024
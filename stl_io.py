@@ -0,0 +1,150 @@
+"""
+A numpy-only reader and writer of ASCII and binary STL files.
+
+The wing geometry is tessellated by ParaView into one STL file per IGES surface. These functions read them
+once, relabel and merge the solids, and write the multi-solid (ASCII) and single-solid (ASCII or binary) STL
+files used by cfMesh, snappyHexMesh, pyGeo, and the viewers. The facets of ASCII solids can be kept as text,
+so relabeling and merging ASCII files copies bytes instead of parsing and formatting every number.
+"""
+
+import os
+import struct
+import numpy as np
+
+# the record of one triangle in a binary STL file
+binary_dtype = np.dtype([("normal", "<f4", 3), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+
+# the text of one triangle in an ASCII STL file
+ascii_facet = (
+    "  facet normal %.9g %.9g %.9g\n"
+    "    outer loop\n"
+    "      vertex %.9g %.9g %.9g\n"
+    "      vertex %.9g %.9g %.9g\n"
+    "      vertex %.9g %.9g %.9g\n"
+    "    endloop\n"
+    "  endfacet\n"
+)
+
+# the keywords around the numbers of the ASCII facets (endfacet and endloop before facet and loop)
+ascii_keywords = [b"endfacet", b"endloop", b"outer loop", b"facet normal", b"vertex"]
+
+
+def is_binary(data: bytes) -> bool:
+    """A binary file is the 80 byte header, the triangle count, and 50 bytes per triangle"""
+    return len(data) >= 84 and len(data) == 84 + binary_dtype.itemsize * struct.unpack("<I", data[80:84])[0]
+
+
+def read_stl(path: str, parse: bool = True) -> list:
+    """
+    Read an ASCII or binary STL file
+
+    Inputs:
+        path: the .stl file
+        parse: parse the ASCII facets to numbers. With parse=False, the facets of ASCII solids are returned
+            as their text (bytes), which write_stl copies to ASCII files and parses only for binary files
+    Outputs:
+        A list of (solid name, facets) for each solid of the file, where facets are the n x 3 x 3 triangle
+        vertices (or the facet text). A binary file has one solid, named after the file
+    """
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if is_binary(data):
+        records = np.frombuffer(data, dtype=binary_dtype, offset=84)
+        return [(os.path.splitext(os.path.basename(path))[0], records["vertices"].astype(np.float64))]
+
+    # find the solid and endsolid lines with bytes.find, which is much faster than a regular expression over the
+    # facets of large files. "endsolid" ends with "solid", and the facets have no "solid"
+    solids = []
+    name, start, pos = None, 0, 0
+    while True:
+        i = data.find(b"solid", pos)
+        if i < 0:
+            break
+        line_start = data.rfind(b"\n", 0, i) + 1
+        line_end = data.find(b"\n", i)
+        line_end = len(data) if line_end < 0 else line_end + 1
+        if data[i - 3 : i] == b"end" and name is not None:
+            facets = data[start:line_start]
+            solids.append((name, parse_facets(facets) if parse else facets))
+            name = None
+        elif data[line_start:i].strip() == b"":
+            name, start = data[i + 5 : line_end].decode().strip(), line_end
+        pos = line_end
+    if name is not None:
+        raise ValueError(f"{path}: missing endsolid of solid '{name}'")
+    return solids
+
+
+def parse_facets(text: bytes) -> np.ndarray:
+    """Parse the text of ASCII facets to the n x 3 x 3 triangle vertices"""
+    for keyword in ascii_keywords:
+        text = text.replace(keyword, b" ")
+    values = np.fromstring(text, dtype=np.float64, sep=" ")
+    if values.size % 12:
+        raise ValueError("ASCII STL facets must have a normal and three vertices")
+    return values.reshape(-1, 12)[:, 3:].reshape(-1, 3, 3)
+
+
+def triangles_of(facets) -> np.ndarray:
+    """Return the n x 3 x 3 triangle vertices of facets from read_stl (numbers or text)"""
+    return parse_facets(facets) if isinstance(facets, bytes) else facets
+
+
+def count_facets(facets) -> int:
+    """Return the number of triangles of facets from read_stl (numbers or text) without parsing the text"""
+    return facets.count(b"endfacet") if isinstance(facets, bytes) else len(facets)
+
+
+def compute_normals(triangles: np.ndarray) -> np.ndarray:
+    """Return the unit normals (n x 3) of triangles (n x 3 x 3) from the vertex order. Degenerate triangles get 0"""
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+
+def merge_solids(solids: list, name: str) -> tuple:
+    """Merge the facets of several solids (a list of (name, facets)) into one solid called name"""
+    facets = [facets for _, facets in solids]
+    if all(isinstance(text, bytes) for text in facets):
+        return (name, b"".join(text if text.endswith(b"\n") or not text else text + b"\n" for text in facets))
+    return (name, np.concatenate([triangles_of(f) for f in facets]))
+
+
+def write_stl(path: str, solids: list, binary: bool = False, chunk_size: int = 100000):
+    """
+    Write solids to an STL file
+
+    Inputs:
+        path: the .stl file
+        solids: a list of (solid name, facets), where facets are n x 3 x 3 triangle vertices or the text of
+            ASCII facets from read_stl(parse=False)
+        binary: write a binary file. A binary file cannot store solid names, so the solids are merged and
+            the first name goes to the header (which must not start with "solid", or readers take the file
+            for ASCII). Write an ASCII file to keep several solids
+        chunk_size: number of triangles formatted at once for ASCII files
+    """
+
+    if binary:
+        triangles = np.concatenate([triangles_of(facets) for _, facets in solids] or [np.zeros((0, 3, 3))])
+        records = np.zeros(len(triangles), dtype=binary_dtype)
+        records["normal"] = compute_normals(triangles)
+        records["vertices"] = triangles
+        with open(path, "wb") as f:
+            f.write(f"binary STL {solids[0][0] if solids else ''}".encode()[:80].ljust(80, b" "))
+            f.write(struct.pack("<I", len(records)))
+            f.write(records.tobytes())
+        return
+
+    with open(path, "wb") as f:
+        for name, facets in solids:
+            f.write(f"solid {name}\n".encode())
+            if isinstance(facets, bytes):
+                f.write(facets if facets.endswith(b"\n") or not facets else facets + b"\n")
+            else:
+                for start in range(0, len(facets), chunk_size):
+                    chunk = facets[start : start + chunk_size]
+                    values = np.column_stack([compute_normals(chunk), chunk.reshape(-1, 9)])
+                    f.write(((ascii_facet * len(chunk)) % tuple(values.ravel())).encode())
+            f.write(f"endsolid {name}\n".encode())
@@ -4,15 +4,20 @@ This test runs inside the Docker container.
 """
 
 import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 import sys
+import tempfile
+import threading
 import time
+import urllib.request
 
 # Import all MCP functions
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from dafoam_mcp_server import (
     airfoil_generate_mesh,
     airfoil_view_mesh,
+    estimate_run_cost,
     airfoil_run_cfd_simulation,
     airfoil_run_optimization,
     mcp_check_run_status,
@@ -20,12 +25,21 @@ from dafoam_mcp_server import (
     airfoil_view_pressure_profile,
     airfoil_view_flow_field,
     view_optimization_history,
+    view_run_resource_usage,
+    view_surface_loads,
     wing_generate_geometry,
     wing_generate_mesh,
     wing_run_cfd_simulation,
     wing_view_pressure_profile,
     wing_view_flow_field,
+    wing_export_web_viewer,
+    load_profile_library,
+    FILE_HTTP_PORT,
 )
+from profile_fetcher import FetchError, ProfileFetcher
+import numpy as np
+import profile_library
+import run_estimator
 
 
 async def wait_for_run_completion(module="airfoil", timeout=600, check_interval=10):
@@ -169,14 +183,38 @@ def test_airfoil_run_cfd_and_views():
         flow_result = asyncio.run(airfoil_view_flow_field())
         print(f"    Output: {flow_result}")
 
+        print("  Testing airfoil_view_flow_field with a render plan...")
+        render_plan = [{"flow_field": "p"}, {"flow_field": "U", "x_location": 0.0, "zoom_in_scale": 0.1}]
+        plan_result = asyncio.run(airfoil_view_flow_field(render_plan=render_plan))
+        print(f"    Output: {plan_result}")
+
+        print("  Testing airfoil_view_flow_field without a plan after a render plan...")
+        flow_result = asyncio.run(airfoil_view_flow_field())
+        print(f"    Output: {flow_result}")
+        with open("../airfoils/plots/airfoil_flow_field.html") as f:
+            if "airfoil_flow_plan" in f.read():
+                print("[FAIL] The render plan frames are shown without a plan\n")
+                return False
+
+        print("  Testing view_run_resource_usage...")
+        usage_result = asyncio.run(view_run_resource_usage(module="airfoil"))
+        print(f"    Output: {usage_result}")
+
+        print("  Testing view_surface_loads...")
+        loads_result = asyncio.run(view_surface_loads(module="airfoil"))
+        print(f"    Output: {loads_result}")
+
         # Check all visualization files
         visualization_files = [
+            "../airfoils/.dafoam_run_metadata.json",
+            "../airfoils/plots/airfoil_surface_cp.csv",
             "../airfoils/plots/airfoil_convergence.html",
             "../airfoils/plots/airfoil_convergence.png",
             "../airfoils/plots/airfoil_pressure_profile.html",
             "../airfoils/plots/airfoil_pressure_profile.png",
             "../airfoils/plots/airfoil_flow_field.html",
             "../airfoils/plots/airfoil_flow_field.png",
+            "../airfoils/plots/airfoil_flow_plan_render_plan.json",
         ]
 
         if check_files_exist(visualization_files):
@@ -272,6 +310,55 @@ def test_wing_generate_geometry():
         return False
 
 
+def test_estimate_run_cost():
+    """Test estimate_run_cost function before the wing mesh is generated."""
+    print("Testing estimate_run_cost...")
+
+    try:
+        checks = {}
+        for mesh_tool in ["cfMesh", "snappyHexMesh"]:
+            result = asyncio.run(estimate_run_cost(module="wing", mesh_tool=mesh_tool, cpu_cores=1))
+            print(f"Output: {result}")
+            checks[mesh_tool] = result.startswith("Estimated wing mesh") and "cfd wall time" in result
+
+        result = asyncio.run(estimate_run_cost(module="airfoil", mesh_cells=500000, run_type="optimization"))
+        print(f"Output: {result}")
+        checks["airfoil flagged"] = "WARNING" in result
+
+        # optimizations are fitted per iteration, so runs with different max_opt_iters share one fit
+        history = [
+            dict(module="wing", run_type="optimization", cells=1e5, cpu_cores=2, max_opt_iters=n, wall_time=100.0 * n)
+            for n in [5, 50, 10]
+        ]
+        for record in history:
+            record["return_code"] = 0
+        estimate = run_estimator.estimate_wall_time(history, "wing", "optimization", 1e5, 2, 0.05, 20)
+        checks["per iteration"] = abs(estimate["wall_time"] - 2000.0) < 1.0
+
+        # meshes are fitted per mesh tool, so the slower snappyHexMesh runs do not inflate a cfMesh estimate
+        history = [
+            dict(module="wing", run_type="mesh", mesh_tool=tool, cells=1e5, cpu_cores=1, wall_time=wall_time)
+            for tool, wall_time in [("cfMesh", 10.0), ("snappyHexMesh", 1000.0), ("snappyHexMesh", 1000.0)]
+        ]
+        for record in history:
+            record["return_code"] = 0
+        estimate = run_estimator.estimate_wall_time(history, "wing", "mesh", 1e5, 1, 1e-3, mesh_tool="cfMesh")
+        checks["per mesh tool"] = abs(estimate["wall_time"] - 10.0) < 0.1
+
+        failed = [name for name, passed in checks.items() if not passed]
+        if not failed:
+            print("[PASS] estimate_run_cost PASSED\n")
+            return True
+        else:
+            print(f"    [FAIL] Failed checks: {failed}")
+            print("[FAIL] estimate_run_cost FAILED\n")
+            return False
+
+    except Exception as e:
+        print(f"[FAIL] Exception: {str(e)}\n")
+        return False
+
+
 def test_wing_generate_mesh():
     """Test wing_generate_mesh function."""
     print("Testing wing_generate_mesh...")
@@ -299,6 +386,51 @@ def test_wing_generate_mesh():
         return False
 
 
+def test_wing_generate_mesh_parallel():
+    """Test the MPI-parallel snappyHexMesh of wing_generate_mesh and a cfd simulation on its decomposed mesh."""
+    print("Testing wing_generate_mesh with parallel snappyHexMesh...")
+
+    try:
+        result = asyncio.run(wing_generate_mesh(mesh_tool="snappyHexMesh", mesh_refinement_level=3, cpu_cores=2))
+        print(f"Output: {result}")
+
+        # Check for expected output files: the decomposed mesh and fields, and no serial mesh
+        expected_files = [
+            "../wings/log_mesh.txt",
+            "../wings/processor0/constant/polyMesh/faces",
+            "../wings/processor1/constant/polyMesh/faces",
+            "../wings/processor1/0/U",
+            "../wings/VTK/wings_0/boundary.vtp",
+            "../wings/plots/wing_mesh_all_views.png",
+        ]
+        if not check_files_exist(expected_files) or Path("../wings/constant/polyMesh").exists():
+            print("[FAIL] wing_generate_mesh_parallel FAILED\n")
+            return False
+
+        # Solve on the mesh decomposed by snappyHexMesh, which pyDAFoam uses as is on the same cores
+        run_finished_marker = Path("../wings/.dafoam_run_finished")
+        if run_finished_marker.exists():
+            run_finished_marker.unlink()
+        print("  Starting wing CFD simulation on the decomposed mesh...")
+        result = asyncio.run(wing_run_cfd_simulation(cpu_cores=2, primal_func_std_tol=1e-2))
+        print(f"  Output: {result}")
+        if "started" not in str(result).lower():
+            print("[FAIL] Wing CFD simulation on the decomposed mesh did not start properly\n")
+            return False
+
+        completed = asyncio.run(wait_for_run_completion(module="wing", timeout=400, check_interval=10))
+        if completed and check_files_exist(["../wings/log_cfd_simulation.txt"]):
+            print("[PASS] wing_generate_mesh_parallel PASSED\n")
+            return True
+        else:
+            print("[FAIL] Wing CFD simulation on the decomposed mesh did not complete in time\n")
+            return False
+
+    except Exception as e:
+        print(f"[FAIL] Exception: {str(e)}\n")
+        return False
+
+
 def test_wing_run_cfd_and_views():
     """Test wing CFD simulation and visualization functions that depend on it."""
     print("Testing wing_run_cfd_simulation and related views...")
@@ -340,6 +472,17 @@ def test_wing_run_cfd_and_views():
         flow_result = asyncio.run(wing_view_flow_field())
         print(f"    Output: {flow_result}")
 
+        print("  Testing wing_export_web_viewer...")
+        web_result = asyncio.run(wing_export_web_viewer(mode="surface"))
+        print(f"    Output: {web_result}")
+
+        print("  Testing view_surface_loads for wing...")
+        loads_result = asyncio.run(view_surface_loads(module="wing", mean_chord=1.0, leading_edge_root=[0.0, 0.0, 0.0]))
+        print(f"    Output: {loads_result}")
+        if "about x, y = 0.25, 0" not in str(loads_result):
+            print("[FAIL] The wing moment is not about the quarter chord of the root\n")
+            return False
+
         # Check all visualization files
         visualization_files = [
             "../wings/plots/wing_convergence.html",
@@ -348,6 +491,8 @@ def test_wing_run_cfd_and_views():
             "../wings/plots/wing_pressure_profile.png",
             "../wings/plots/wing_flow_field.html",
             "../wings/plots/wing_flow_field.png",
+            "../wings/plots/wing_surface_viewer.html",
+            "../wings/plots/wing_surface_cp.csv",
         ]
 
         if check_files_exist(visualization_files):
@@ -362,6 +507,169 @@ def test_wing_run_cfd_and_views():
         return False
 
 
+def test_metrics_endpoint():
+    """Test the Prometheus metrics endpoint on the artifact HTTP server."""
+    print("Testing /metrics endpoint...")
+
+    try:
+        with urllib.request.urlopen(f"http://localhost:{FILE_HTTP_PORT}/metrics", timeout=10) as response:
+            metrics = response.read().decode("utf-8")
+
+        expected_names = [
+            'dafoam_tool_calls_total{status="ok",tool="airfoil_generate_mesh"}',
+            'dafoam_tool_latency_seconds_count{tool="airfoil_generate_mesh"}',
+            'dafoam_stage_seconds_count{stage="pyHyp"}',
+            'dafoam_stage_seconds_count{stage="mpirun"}',
+            "dafoam_jobs_running",
+            "dafoam_http_bytes_served_total",
+        ]
+        missing = [name for name in expected_names if name not in metrics]
+
+        if not missing:
+            print("[PASS] metrics_endpoint PASSED\n")
+            return True
+        else:
+            print(f"    [FAIL] Missing metrics: {missing}")
+            print("[FAIL] metrics_endpoint FAILED\n")
+            return False
+
+    except Exception as e:
+        print(f"[FAIL] Exception: {str(e)}\n")
+        return False
+
+
+class ProfileStandInHandler(BaseHTTPRequestHandler):
+    """A local stand-in of the UIUC database: ETags, a flaky profile, a missing profile, and an HTML page"""
+
+    protocol_version = "HTTP/1.1"
+    profile = b"1.0 0.0\n0.5 0.06\n0.0 0.0\n0.5 -0.06\n1.0 0.0\n"
+    requests = []
+    client_ports = set()
+
+    def do_GET(self):
+        name = self.path.rsplit("/", 1)[-1]
+        ProfileStandInHandler.requests.append((name, self.headers.get("If-None-Match")))
+        ProfileStandInHandler.client_ports.add(self.client_address[1])
+        flaky_count = sum(1 for n, _ in ProfileStandInHandler.requests if n == "flaky.dat")
+        if name == "missing.dat":
+            self.reply(404, b"not found")
+        elif name == "page.dat":
+            self.reply(200, b"<html><body>not an airfoil</body></html>")
+        elif name == "flaky.dat" and flaky_count <= 2:
+            self.reply(503, b"busy")
+        elif self.headers.get("If-None-Match") == '"v1"':
+            self.reply(304, b"")
+        else:
+            self.reply(200, self.profile, {"ETag": '"v1"'})
+
+    def reply(self, status, body, headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_profile_fetcher():
+    """Test the UIUC profile fetcher against a local HTTP stand-in."""
+    print("Testing ProfileFetcher...")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ProfileStandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            base_url = f"http://127.0.0.1:{server.server_address[1]}/coord/"
+            fetcher = ProfileFetcher(base_url, cache_dir, timeout=5, retries=3, backoff=0.01, max_workers=2)
+            checks = {}
+
+            results = fetcher.fetch_many(["naca0001", "naca0002", "naca0003", "flaky", "missing", "page"])
+            checks["downloaded"] = all(Path(results[n]).exists() for n in ["naca0001", "naca0002", "naca0003"])
+            checks["retried"] = isinstance(results["flaky"], str) and Path(results["flaky"]).exists()
+            checks["not found"] = isinstance(results["missing"], FetchError)
+            checks["validated"] = isinstance(results["page"], FetchError)
+            checks["keep-alive"] = len(ProfileStandInHandler.client_ports) <= 2
+
+            n_requests = len(ProfileStandInHandler.requests)
+            fetcher.fetch("naca0001")
+            checks["revalidated"] = ProfileStandInHandler.requests[n_requests:] == [("naca0001.dat", '"v1"')]
+
+            try:
+                fetcher.fetch("missing")
+                checks["error raised"] = False
+            except FetchError:
+                checks["error raised"] = True
+
+        failed = [name for name, passed in checks.items() if not passed]
+        if not failed:
+            print("[PASS] profile_fetcher PASSED\n")
+            return True
+        else:
+            print(f"    [FAIL] Failed checks: {failed}")
+            print("[FAIL] profile_fetcher FAILED\n")
+            return False
+
+    except Exception as e:
+        print(f"[FAIL] Exception: {str(e)}\n")
+        return False
+
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_profile_library():
+    """Test the profile parsing and normalization, a library round trip, and the library of the docker image."""
+    print("Testing profile_library...")
+
+    try:
+        checks = {}
+
+        # Lednicer: the point counts, then both surfaces from the leading edge
+        lednicer = "LEDNICER TEST\n3. 3.\n\n0.0 0.0\n0.5 0.06\n1.0 0.0\n\n0.0 0.0\n0.5 -0.06\n1.0 0.0\n"
+        title, coords = profile_library.parse_profile(lednicer)
+        checks["lednicer title"] = title == "LEDNICER TEST"
+        checks["lednicer order"] = np.allclose(coords, [[1, 0], [0.5, 0.06], [0, 0], [0, 0], [0.5, -0.06], [1, 0]])
+        # Selig: a first row of 1.0 0.0 is a point, not the point counts
+        _, coords = profile_library.parse_profile("1.0 0.0\n0.5 0.06\n0.0 0.0\n0.5 -0.06\n1.0 0.0\n")
+        checks["selig"] = len(coords) == 5
+
+        # a clockwise loop with chord 2, offset leading edge, and a repeated point is flipped and scaled
+        clockwise = [[3.0, 0.0], [2.0, -0.12], [2.0, -0.12], [1.0, 0.0], [2.0, 0.12], [3.0, 0.0]]
+        coords = profile_library.normalize_profile(clockwise)
+        checks["normalized"] = np.allclose(coords, [[1, 0], [0.5, 0.06], [0, 0], [0.5, -0.06], [1, 0]])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            Path(f"{tmp_dir}/dat").mkdir()
+            Path(f"{tmp_dir}/dat/test1.dat").write_text(lednicer)
+            Path(f"{tmp_dir}/dat/broken.dat").write_text("not a profile\n")
+            n_profiles, failed = profile_library.build_library([f"{tmp_dir}/dat"], f"{tmp_dir}/library")
+            library = profile_library.ProfileLibrary(f"{tmp_dir}/library")
+            checks["built"] = n_profiles == 1 and [name for name, _ in failed] == ["broken"]
+            checks["alias"] = library.resolve("Lednicer-Test") == "test1"
+            checks["suggest"] = library.suggest("test2") == ["test1"]
+
+        # the docker image builds the library from the whole UIUC database
+        library = load_profile_library()
+        checks["uiuc library"] = library is not None and len(library) > 1000 and library.resolve("clarky") is not None
+
+        failed = [name for name, passed in checks.items() if not passed]
+        if not failed:
+            print("[PASS] profile_library PASSED\n")
+            return True
+        else:
+            print(f"    [FAIL] Failed checks: {failed}")
+            print("[FAIL] profile_library FAILED\n")
+            return False
+
+    except Exception as e:
+        print(f"[FAIL] Exception: {str(e)}\n")
+        return False
+
+
 def run_all_tests():
     """Run all MCP function tests."""
     print("=" * 60)
@@ -375,8 +683,13 @@ def run_all_tests():
         ("airfoil_run_cfd_and_views", test_airfoil_run_cfd_and_views),
         ("airfoil_run_optimization_and_views", test_airfoil_run_optimization_and_views),
         ("wing_generate_geometry", test_wing_generate_geometry),
+        ("estimate_run_cost", test_estimate_run_cost),
         ("wing_generate_mesh", test_wing_generate_mesh),
         ("wing_run_cfd_and_views", test_wing_run_cfd_and_views),
+        ("wing_generate_mesh_parallel", test_wing_generate_mesh_parallel),
+        ("metrics_endpoint", test_metrics_endpoint),
+        ("profile_fetcher", test_profile_fetcher),
+        ("profile_library", test_profile_library),
     ]
 
     passed = 0
@@ -51,7 +51,7 @@ args = parser.parse_args()
 
 nSections = len(args.spanwise_airfoil_profiles)
 # Prepend 'profiles/' folder to each airfoil name
-airfoil_list = [f"profiles/{airfoil}.dat" for airfoil in args.spanwise_airfoil_profiles]
+airfoil_list = [f"profiles/{airfoil.lower()}.dat" for airfoil in args.spanwise_airfoil_profiles]
 chord = args.spanwise_chords
 x = args.spanwise_x
 y = args.spanwise_y
@@ -5,14 +5,42 @@
 
 #### import the simple module from the paraview
 from paraview.simple import *
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dafoam_tracing import span
 
 #### disable automatic camera reset on 'Show'
 paraview.simple._DisableFirstRenderCameraReset()
 
+parser = argparse.ArgumentParser()
+parser.add_argument("-mean_chord", help="the average chord of the wing in m", type=float, default=1.0)
+parser.add_argument("-wing_span", help="the span of the wing in m", type=float, default=3.0)
+parser.add_argument(
+    "-linear_deflection",
+    help="the maximal distance between the surfaces and their triangles, relative to the mean chord (or the span "
+    "if it is smaller)",
+    type=float,
+    default=5e-5,
+)
+parser.add_argument(
+    "-angular_deflection",
+    help="the maximal angle (rad) between the normals of adjacent triangles",
+    type=float,
+    default=0.2,
+)
+args = parser.parse_args()
+
+# the IGES file is in mm. The tolerance scales with the wing, so the number of triangles does not depend
+# on the wing size (0.05 mm for a 1 m chord)
+linear_deflection = args.linear_deflection * min(args.mean_chord, args.wing_span) * 1000.0
+
+start_time = time.perf_counter()
+
 # create a new 'IGES Reader'
 wingiges = IGESReader(registrationName="wing_mm.iges", FileNames=["wing_mm.iges"])
-wingiges.LinearDeflection = 0.05
-wingiges.AngularDeflection = 0.2
+wingiges.LinearDeflection = linear_deflection
+wingiges.AngularDeflection = args.angular_deflection
 wingiges.RelativeDeflection = 0
 wingiges.ReadWire = 0
 
@@ -24,7 +52,11 @@ transform1.Transform = "Transform"
 scale_factor = 0.001
 transform1.Transform.Scale = [scale_factor, scale_factor, scale_factor]
 
-# save data
+with span("tessellate", linear_deflection=linear_deflection):
+    transform1.UpdatePipeline()
+n_triangles = transform1.GetDataInformation().GetNumberOfCells()
+
+# save data. Binary STL files are about half the size of ASCII files and much faster to read
 SaveData(
     "./wing.stl",
     proxy=transform1,
@@ -39,5 +71,10 @@ SaveData(
     Filenamesuffix="_%d",
     NumberOfIORanks=1,
     RankAssignmentMode="Contiguous",
-    FileType="Ascii",
+    FileType="Binary",
+)
+
+print(
+    f"Converted wing_mm.iges to STL: {n_triangles} triangles (linear deflection {linear_deflection:.4g} mm, "
+    f"angular deflection {args.angular_deflection} rad) in {time.perf_counter() - start_time:.2f} s"
 )
@@ -2,7 +2,11 @@
 
 # import the simple module from the paraview
 from paraview.simple import *
-import argparse, os
+import argparse, json, os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dafoam_tracing import span
+import foam_reader
 
 # disable automatic camera reset on 'Show'
 paraview.simple._DisableFirstRenderCameraReset()
@@ -21,6 +25,12 @@ parser.add_argument(
     default=3.0,
 )
 parser.add_argument("-flow_field", help="flow field variable to plot", type=str, default="p")
+parser.add_argument(
+    "-render_plan",
+    help="a JSON file with a list of views (flow_field, zoom_in_scale) to render in one pass",
+    type=str,
+    default="",
+)
 args = parser.parse_args()
 
 wing_span = args.wing_span
@@ -28,11 +38,24 @@ zoom_in_scale = wing_span * 0.4
 mean_chord = args.mean_chord
 mean_span = wing_span / 2.0
 
+# The views to render. Without a render plan, render the single view set by the command line arguments.
+# Missing keys in the plan entries take the command line values
+if args.render_plan:
+    with open(args.render_plan) as f:
+        render_plan = json.load(f)
+else:
+    render_plan = [{}]
+render_plan = [{"flow_field": args.flow_field, "zoom_in_scale": zoom_in_scale, **view} for view in render_plan]
+
 # create a new 'OpenFOAMReader'
 paraviewfoam = OpenFOAMReader(registrationName="paraview.foam", FileName="paraview.foam")
 
-# if it is a parallel run, choose Decomposed Case
-if os.path.exists("processor0"):
+# if it is a parallel run, choose Decomposed Case, unless reconstructPar has already written
+# all time steps and the fields of all views to the case directory. MPI-parallel pvbatch renders
+# always read the decomposed case, so the processor* directories are distributed over the ranks
+fields = [view["flow_field"] for view in render_plan]
+parallel_render = servermanager.ActiveConnection.GetNumberOfDataPartitions() > 1
+if parallel_render or foam_reader.case_dirs(".", fields=fields) != ["."]:
     paraviewfoam.CaseType = "Decomposed Case"
 
 # get active view
@@ -56,50 +79,64 @@ paraviewfoam.MeshRegions = ["patch/sym", "patch/wing"]
 # update the view to ensure updated data information
 renderView1.Update()
 
-# set scalar coloring
-ColorBy(paraviewfoamDisplay, ("POINTS", args.flow_field))
 
-# show color bar/color legend
-paraviewfoamDisplay.SetScalarBarVisibility(renderView1, True)
+def color_by(flow_field):
+    """Color the surfaces by flow_field and show its color bar. All views of a field share its color map"""
 
-# get color transfer function/color map for 'p'
-pLUT = GetColorTransferFunction(args.flow_field)
+    # hide the color bar of the previous field
+    paraviewfoamDisplay.SetScalarBarVisibility(renderView1, False)
 
-# get color legend/bar for pLUT in view renderView1
-pLUTColorBar = GetScalarBar(pLUT, renderView1)
+    # set scalar coloring
+    ColorBy(paraviewfoamDisplay, ("POINTS", flow_field))
 
-# change scalar bar placement
-pLUTColorBar.Orientation = "Vertical"
-pLUTColorBar.Position = [0.1, 0.9]
-pLUTColorBar.ScalarBarLength = 0.8
+    # show color bar/color legend
+    paraviewfoamDisplay.SetScalarBarVisibility(renderView1, True)
 
-pLUTColorBar.TitleFontSize = 8
-pLUTColorBar.LabelFontSize = 8
-pLUTColorBar.LabelFormat = "%g"
-pLUTColorBar.RangeLabelFormat = "%.3e"
-pLUTColorBar.ScalarBarThickness = 8
-pLUTColorBar.TitleColor = [0, 0, 0]
-pLUTColorBar.LabelColor = [0, 0, 0]
+    # get color transfer function/color map for 'p'
+    pLUT = GetColorTransferFunction(flow_field)
 
-text1 = Text(registrationName=f"Flow Field: {args.flow_field}")
-text1.Text = f"Flow Field: {args.flow_field}"
-text1Display = Show(text1, renderView1, "TextSourceRepresentation")
-renderView1.Update()
-text1Display.FontSize = 15
-text1Display.WindowLocation = "Upper Center"
-text1Display.Bold = 1
-text1Display.FontFamily = "Arial"
-text1Display.Color = [0.0, 0.0, 0.0]
-
-# current camera placement for renderView1
-renderView1.CameraPosition = [mean_chord - 10.0, 10.0, mean_span + 10.0]
-renderView1.CameraFocalPoint = [mean_chord, 0.0, mean_span]
-renderView1.CameraParallelScale = zoom_in_scale
-renderView1.CameraViewUp = [1.0, 1.0, -1.0]
-
-# save screenshot
-SaveScreenshot(
-    f"plots/wing_flow_field_{args.flow_field}_3d.png",
-    renderView1,
-    ImageResolution=[1923, 1158],
-)
+    # get color legend/bar for pLUT in view renderView1
+    pLUTColorBar = GetScalarBar(pLUT, renderView1)
+
+    # change scalar bar placement
+    pLUTColorBar.Orientation = "Vertical"
+    pLUTColorBar.Position = [0.1, 0.9]
+    pLUTColorBar.ScalarBarLength = 0.8
+
+    pLUTColorBar.TitleFontSize = 8
+    pLUTColorBar.LabelFontSize = 8
+    pLUTColorBar.LabelFormat = "%g"
+    pLUTColorBar.RangeLabelFormat = "%.3e"
+    pLUTColorBar.ScalarBarThickness = 8
+    pLUTColorBar.TitleColor = [0, 0, 0]
+    pLUTColorBar.LabelColor = [0, 0, 0]
+
+
+text1 = Text(registrationName="Flow Field")
+
+# the data set is loaded once and reused by all views
+for index, view in enumerate(render_plan):
+    color_by(view["flow_field"])
+
+    text1.Text = f"Flow Field: {view['flow_field']}"
+    text1Display = Show(text1, renderView1, "TextSourceRepresentation")
+    renderView1.Update()
+    text1Display.FontSize = 15
+    text1Display.WindowLocation = "Upper Center"
+    text1Display.Bold = 1
+    text1Display.FontFamily = "Arial"
+    text1Display.Color = [0.0, 0.0, 0.0]
+
+    # current camera placement for renderView1
+    renderView1.CameraPosition = [mean_chord - 10.0, 10.0, mean_span + 10.0]
+    renderView1.CameraFocalPoint = [mean_chord, 0.0, mean_span]
+    renderView1.CameraParallelScale = view["zoom_in_scale"]
+    renderView1.CameraViewUp = [1.0, 1.0, -1.0]
+
+    # save screenshot
+    if args.render_plan:
+        file_name = f"plots/wing_flow_plan_{index:02d}_{view['flow_field']}_3d.png"
+    else:
+        file_name = f"plots/wing_flow_field_{view['flow_field']}_3d.png"
+    with span("SaveScreenshot"):
+        SaveScreenshot(file_name, renderView1, ImageResolution=[1923, 1158])
@@ -3,6 +3,7 @@
 # import the simple module from the paraview
 from paraview.simple import *
 import argparse
+import os
 
 # disable automatic camera reset on 'Show'
 paraview.simple._DisableFirstRenderCameraReset()
@@ -30,6 +31,10 @@ focal_z = wing_span / 2.0
 # create a new 'OpenFOAMReader'
 paraviewfoam = OpenFOAMReader(registrationName="paraview.foam", FileName="paraview.foam")
 
+# the parallel snappyHexMesh leaves the mesh decomposed for the solver
+if not os.path.exists("constant/polyMesh") and os.path.exists("processor0/constant/polyMesh"):
+    paraviewfoam.CaseType = "Decomposed Case"
+
 # get active view
 renderView1 = GetActiveViewOrCreate("RenderView")
 
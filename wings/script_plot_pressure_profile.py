@@ -2,8 +2,13 @@
 
 #### import the simple module from the paraview
 from paraview.simple import *
-import argparse, os
+import argparse, os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dafoam_tracing import span
+import foam_reader
 import numpy as np
+from vtkmodules.util.numpy_support import vtk_to_numpy
 import matplotlib
 
 matplotlib.use("Agg")
@@ -11,35 +16,64 @@ import matplotlib.pyplot as plt
 
 parser = argparse.ArgumentParser()
 parser.add_argument("-mach_number", help="mach number", type=float, default=0.1)
+parser.add_argument("-angle_of_attack", help="angle of attack in degree", type=float, default=2.0)
 parser.add_argument("-time_step", help="which time step to visualize", type=int, default=-1)
+parser.add_argument("-worker_rank", help="index of this render worker when time_step=-1", type=int, default=0)
+parser.add_argument("-n_workers", help="number of render workers splitting the time steps", type=int, default=1)
+parser.add_argument(
+    "-time_values",
+    help="only render these time values when time_step=-1 (the others are cached)",
+    type=float,
+    nargs="*",
+)
 parser.add_argument("-wing_span", help="total span length", type=float, default=1.0)
 parser.add_argument(
-    "-spanwise_chords",
-    help="chord lengths at 10, 50, and 90 percent of the span",
+    "-span_stations",
+    help="span stations (fraction of the span) to plot the pressure profiles",
     nargs="+",
     type=float,
-    default=[1.0, 1.0, 1.0],
+    default=[0.1, 0.5, 0.9],
+)
+parser.add_argument(
+    "-n_load_stations",
+    help="number of evenly spaced span stations for the spanwise load distribution",
+    type=int,
+    default=20,
 )
 args = parser.parse_args()
 
-# Parse spanwise_chords
-chords = args.spanwise_chords
-span_locations = [0.1 * args.wing_span, 0.5 * args.wing_span, 0.9 * args.wing_span]
-span_labels = ["10_percent_span", "50_percent_span", "90_percent_span"]
+# all stations are cut in one pass: the profile stations and the evenly spaced load stations
+profile_fractions = sorted(set(args.span_stations))
+load_fractions = [(i + 0.5) / args.n_load_stations for i in range(args.n_load_stations)]
+station_fractions = np.array(sorted(set(profile_fractions + load_fractions)))
+station_z = station_fractions * args.wing_span
 
 C0 = 347.2
 U0 = args.mach_number * C0
 rho0 = 1.1768
+p0 = 101325.0
 coeff = 0.5 * rho0 * U0 * U0
 
+alpha = np.radians(args.angle_of_attack)
+drag_direction = np.array([np.cos(alpha), np.sin(alpha)])
+lift_direction = np.array([-np.sin(alpha), np.cos(alpha)])
+
 #### disable automatic camera reset on 'Show'
 paraview.simple._DisableFirstRenderCameraReset()
 
 # create a new 'OpenFOAMReader'
-paraviewfoam = OpenFOAMReader(registrationName="paraview.foam", FileName="./paraview.foam")
+with span("OpenFOAMReader"):
+    paraviewfoam = OpenFOAMReader(registrationName="paraview.foam", FileName="./paraview.foam")
 
-# if it is a parallel run, choose Decomposed Case
-if os.path.exists("processor0"):
+# if it is a parallel run, choose Decomposed Case, unless reconstructPar has already written
+# the time steps to plot (all of them for time_step=-1) to the case directory. MPI-parallel pvbatch
+# renders always read the decomposed case, so the processor* directories are distributed over the ranks
+parallel_render = servermanager.ActiveConnection.GetNumberOfDataPartitions() > 1
+if args.time_step == -1:
+    time_names = None if args.time_values is None else [str(t) for t in args.time_values]
+else:
+    time_names = [str(args.time_step * 0.0001)]
+if parallel_render or foam_reader.case_dirs(".", time_names, ["p"]) != ["."]:
     paraviewfoam.CaseType = "Decomposed Case"
 
 # get animation scene
@@ -48,18 +82,6 @@ animationScene1 = GetAnimationScene()
 # update animation scene based on data timesteps
 animationScene1.UpdateAnimationUsingDataTimeSteps()
 
-# get active view
-renderView1 = GetActiveViewOrCreate("RenderView")
-
-# show data in view
-paraviewfoamDisplay = Show(paraviewfoam, renderView1, "UnstructuredGridRepresentation")
-
-# trace defaults for the display properties.
-paraviewfoamDisplay.Representation = "Surface"
-
-# Properties modified on renderView1
-renderView1.CameraParallelProjection = 1
-
 # Properties modified on paraviewfoam
 # In ParaView 5.13, the mesh region is 'patch/wing' not 'wing'
 paraviewfoam.MeshRegions = ["patch/wing"]
@@ -67,191 +89,235 @@ paraviewfoam.MeshRegions = ["patch/wing"]
 # Enable the pressure array for ParaView 5.13
 paraviewfoam.CellArrays = ["p"]
 
+# create a new 'Slice' that cuts the wing at all stations at once
+slice1 = Slice(registrationName="Slice1", Input=paraviewfoam)
+slice1.SliceType.Origin = [0.0, 0.0, 0.0]
+slice1.SliceType.Normal = [0.0, 0.0, 1.0]
+slice1.SliceOffsetValues = station_z.tolist()
+
+# merge the blocks (and the processor pieces) into one data set with shared points
+mergeBlocks1 = MergeBlocks(registrationName="MergeBlocks1", Input=slice1)
+
+
+def order_section(segments):
+    """
+    Chain the line segments of one section into a closed contour, starting from the first point.
+
+    Inputs:
+        segments: n x 2 array of point indices
+    Outputs:
+        The point indices in contour order
+    """
+
+    neighbors = {}
+    for a, b in segments:
+        neighbors.setdefault(a, []).append(b)
+        neighbors.setdefault(b, []).append(a)
+
+    start = segments[0, 0]
+    order = [start]
+    previous, current = None, start
+    while len(order) < len(neighbors):
+        next_points = [n for n in neighbors[current] if n != previous and n != current]
+        if not next_points or next_points[0] == start:
+            break
+        previous, current = current, next_points[0]
+        order.append(current)
+    return np.array(order)
+
+
+def sectional_loads(xy, p):
+    """
+    Integrate the pressure on a closed section contour (vectorized over its segments).
+
+    Inputs:
+        xy: n x 2 contour coordinates in order
+        p: n pressure values
+    Outputs:
+        cl, cd, cm (about the quarter chord), the chord, and the leading edge point
+    """
+
+    i_le = np.argmin(xy[:, 0])
+    chord = np.max(np.linalg.norm(xy - xy[i_le], axis=1))
+    reference_point = xy[i_le] + 0.25 * chord * np.array([1.0, 0.0])
+
+    xy_next = np.roll(xy, -1, axis=0)
+    d = xy_next - xy
+    signed_area = 0.5 * np.sum(xy[:, 0] * xy_next[:, 1] - xy_next[:, 0] * xy[:, 1])
+
+    # outward normals (times the segment length) for a counterclockwise contour
+    normals = np.column_stack([d[:, 1], -d[:, 0]]) * np.sign(signed_area)
+    p_mid = 0.5 * (p + np.roll(p, -1)) - p0
+    forces = -p_mid[:, None] * normals
+    r = 0.5 * (xy + xy_next) - reference_point
+    force = forces.sum(axis=0)
+    moment = np.sum(r[:, 0] * forces[:, 1] - r[:, 1] * forces[:, 0])
+
+    cl = force @ lift_direction / (coeff * chord)
+    cd = force @ drag_direction / (coeff * chord)
+    cm = moment / (coeff * chord * chord)
+    return cl, cd, cm, chord, xy[i_le]
+
+
+def plot_pressure_profile(x, y, cp, iterI, label):
+    """Plot the Cp and the section shape at one span station"""
+
+    # Create figure with two subplots, share x-axis
+    fig, (ax1, ax2) = plt.subplots(
+        2,
+        1,
+        figsize=(10, 8),
+        gridspec_kw={"height_ratios": [2, 1], "hspace": 0.05},
+    )
+
+    # Top plot: Cp vs x/c (complete distribution)
+    ax1.set_title(
+        f"Pressure profile on the airfoil. Iteration = {iterI}. Mach = {args.mach_number}. Span = {label}",
+        fontsize=18,
+        fontweight="bold",
+    )
+    ax1.plot(x, cp, "-k", linewidth=2)
+    ax1.set_ylim([-2, 2])
+    ax1.invert_yaxis()  # Invert y-axis for Cp plot (standard in aerodynamics)
+    ax1.set_ylabel("$C_p$", fontsize=16, fontweight="bold")
+    ax1.tick_params(axis="x", labelsize=15)
+    ax1.tick_params(axis="y", labelsize=15)
+    # Completely remove x-axis for top plot
+    ax1.spines["bottom"].set_visible(False)
+    ax1.set_xticks([])
+    # Remove top and right spines
+    ax1.spines["top"].set_visible(False)
+    ax1.spines["right"].set_visible(False)
+
+    # Bottom plot: Airfoil profile
+    ax2.plot(x, y, "-k", linewidth=2)
+    ax2.set_xlabel("x/c", fontsize=16, fontweight="bold")
+    ax2.set_ylabel("y/c", fontsize=16, fontweight="bold")
+    ax2.tick_params(axis="x", labelsize=15)
+    ax2.tick_params(axis="y", labelsize=15)
+    ax2.set_aspect("equal", adjustable="datalim")
+    ax2.set_xlim([-0.05, 1.05])
+    # Remove top and right spines
+    ax2.spines["top"].set_visible(False)
+    ax2.spines["right"].set_visible(False)
+
+    # Use frame index in filename to ensure unique names
+    with span("matplotlib"):
+        plt.savefig(
+            f"plots/wing_pressure_profile_{iterI}_{label}.png",
+            dpi=200,
+            bbox_inches="tight",
+        )
+    plt.close()
+
+
+def plot_spanwise_load(loads, iterI):
+    """Plot the sectional cl, cd, cm, and the spanwise lift distribution cl * c / c_mean"""
+
+    z, cl, cd, cm, chord = loads.T
+    fig, axes = plt.subplots(4, 1, figsize=(10, 12), sharex=True, gridspec_kw={"hspace": 0.1})
+    axes[0].set_title(
+        f"Spanwise load distribution. Iteration = {iterI}. Mach = {args.mach_number}",
+        fontsize=18,
+        fontweight="bold",
+    )
+    for ax, values, ylabel in zip(
+        axes, [cl, cl * chord / np.mean(chord), cd, cm], ["$c_l$", "$c_l c / c_{mean}$", "$c_d$", "$c_m$"]
+    ):
+        ax.plot(z / args.wing_span, values, "-ok", linewidth=2, markersize=4)
+        ax.set_ylabel(ylabel, fontsize=16, fontweight="bold")
+        ax.tick_params(axis="both", labelsize=15)
+        ax.spines["top"].set_visible(False)
+        ax.spines["right"].set_visible(False)
+    axes[-1].set_xlabel("z/span", fontsize=16, fontweight="bold")
+    axes[-1].set_xlim([0.0, 1.0])
+
+    with span("matplotlib"):
+        plt.savefig(f"plots/wing_pressure_profile_{iterI}_spanwise_load.png", dpi=200, bbox_inches="tight")
+    plt.close()
+
+
+def process_time_step(time_value):
+    """Cut all stations, integrate the sectional loads, and plot the profiles and the spanwise load"""
+
+    if time_value < 1.0:
+        iterI = "%04d" % round(time_value * 10000)
+    else:
+        iterI = "Final"
+
+    # Fetch the slices of all stations to the client at once
+    with span("Fetch", time=time_value):
+        data = servermanager.Fetch(mergeBlocks1)
+
+    points = vtk_to_numpy(data.GetPoints().GetData())
+    p = vtk_to_numpy(data.GetPointData().GetArray("p"))
+    segments = vtk_to_numpy(data.GetCells().GetConnectivityArray()).reshape(-1, 2)
+
+    # the pieces of different pvbatch ranks do not share their boundary points, so merge the points by coordinates
+    if parallel_render:
+        scale = np.max(np.abs(points))
+        _, first, point_ids = np.unique(np.round(points / scale, 9), axis=0, return_index=True, return_inverse=True)
+        points, p, segments = points[first], p[first], point_ids.reshape(-1)[segments]
+
+    # assign the segments to the stations by their z coordinate
+    segment_station = np.argmin(np.abs(points[segments[:, 0], 2][:, None] - station_z[None, :]), axis=1)
+
+    loads = []
+    for i_station, fraction in enumerate(station_fractions):
+        station_segments = segments[segment_station == i_station]
+        if len(station_segments) < 3:
+            continue
+        order = order_section(station_segments)
+        xy = points[order, :2]
+        cl, cd, cm, chord, leading_edge = sectional_loads(xy, p[order])
+        loads.append([station_z[i_station], cl, cd, cm, chord])
+
+        if fraction in profile_fractions:
+            # start the profile from the trailing edge and normalize by the chord from the geometry
+            i_te = np.argmax(np.linalg.norm(xy - leading_edge, axis=1))
+            xy = np.roll(xy, -i_te, axis=0)
+            cp = (np.roll(p[order], -i_te) - p0) / coeff
+            xy = np.vstack([xy, xy[:1]])
+            cp = np.append(cp, cp[0])
+            x = (xy[:, 0] - leading_edge[0]) / chord
+            y = (xy[:, 1] - leading_edge[1]) / chord
+            plot_pressure_profile(x, y, cp, iterI, f"{fraction * 100:g}_percent_span")
+
+    # no station was cut, e.g., n_load_stations=0 and no profile station on the wing
+    if not loads:
+        return
+
+    loads = np.array(loads)
+    np.savetxt(
+        f"plots/wing_spanwise_load_{iterI}.csv",
+        loads,
+        delimiter=",",
+        header="z,cl,cd,cm,chord",
+        comments="",
+    )
+    plot_spanwise_load(loads, iterI)
+
+
 # go to the specific time step
 if args.time_step == -1:
     # Get all available time steps
     animationScene1 = GetAnimationScene()
     time_steps = animationScene1.TimeKeeper.TimestepValues
+    if args.time_values is not None:
+        time_steps = [t for t in time_steps if any(abs(t - v) < 1e-12 for v in args.time_values)]
 
-    # Loop through all time steps from last to first
-    for idx, time_value in enumerate(reversed(time_steps)):
+    # Loop through all time steps from last to first. Each render worker takes
+    # every n_workers-th time step starting from worker_rank
+    time_steps = list(reversed(time_steps))[args.worker_rank :: args.n_workers]
+    for idx, time_value in enumerate(time_steps):
         animationScene1.AnimationTime = time_value
-        UpdatePipeline(time_value)
-
-        if time_value < 1.0:
-            iterI = "%04d" % int(time_value * 10000)
-        else:
-            iterI = "Final"
-
-        # Loop through each spanwise location
-        for span_loc, chord, label in zip(span_locations, chords, span_labels):
-            # create a new 'Slice'
-            slice1 = Slice(registrationName="Slice1", Input=paraviewfoam)
-
-            # Properties modified on slice1.SliceType
-            slice1.SliceType.Origin = [0.0, 0.0, span_loc]
-            slice1.SliceType.Normal = [0.0, 0.0, 1.0]
-
-            # create a new 'Plot On Sorted Lines'
-            plotOnSortedLines1 = PlotOnSortedLines(registrationName="PlotOnSortedLines1", Input=slice1)
-
-            # Fetch the data to the client
-            multi_block_data = servermanager.Fetch(plotOnSortedLines1)
-
-            # Navigate through the nested structure (ParaView 5.13)
-            # For 2D airfoil: MultiBlock -> Block(0) -> Block(0) -> Block(0) to get to actual polydata
-            block0 = multi_block_data.GetBlock(0)
-            block1 = block0.GetBlock(0)
-            data = block1.GetBlock(0)
-
-            # Now you can get the point data
-            point_data = data.GetPointData()
-
-            # Get number of points
-            n_points = data.GetNumberOfPoints()
-
-            # Get coordinates (x, y, z)
-            points = np.array([data.GetPoint(i) for i in range(n_points)])
-            x = points[:, 0]
-            y = points[:, 1]
-            z = points[:, 2]
-
-            # Normalize by chord
-            x = x / chord
-            y = y / chord
-
-            # Get pressure (p)
-            p_array = point_data.GetArray("p")
-            p = np.array([p_array.GetValue(i) for i in range(p_array.GetNumberOfTuples())])
-            cp = (p - 101325.0) / coeff
-
-            # Create figure with two subplots, share x-axis
-            fig, (ax1, ax2) = plt.subplots(
-                2,
-                1,
-                figsize=(10, 8),
-                gridspec_kw={"height_ratios": [2, 1], "hspace": 0.05},
-            )
-
-            # Top plot: Cp vs x/c (complete distribution)
-            ax1.set_title(
-                f"Pressure profile on the airfoil. Iteration = {iterI}. Mach = {args.mach_number}. Span = {label}",
-                fontsize=18,
-                fontweight="bold",
-            )
-            ax1.plot(x, cp, "-k", linewidth=2)
-            ax1.set_ylim([-2, 2])
-            ax1.invert_yaxis()  # Invert y-axis for Cp plot (standard in aerodynamics)
-            ax1.set_ylabel("$C_p$", fontsize=16, fontweight="bold")
-            ax1.tick_params(axis="x", labelsize=15)
-            ax1.tick_params(axis="y", labelsize=15)
-            # Completely remove x-axis for top plot
-            ax1.spines["bottom"].set_visible(False)
-            ax1.set_xticks([])
-            # Remove top and right spines
-            ax1.spines["top"].set_visible(False)
-            ax1.spines["right"].set_visible(False)
-
-            # Bottom plot: Airfoil profile
-            ax2.plot(x, y, "-k", linewidth=2)
-            ax2.set_xlabel("x/c", fontsize=16, fontweight="bold")
-            ax2.set_ylabel("y/c", fontsize=16, fontweight="bold")
-            ax2.tick_params(axis="x", labelsize=15)
-            ax2.tick_params(axis="y", labelsize=15)
-            ax2.set_aspect("equal", adjustable="datalim")
-            ax2.set_xlim([-0.05, 1.05])
-            # Remove top and right spines
-            ax2.spines["top"].set_visible(False)
-            ax2.spines["right"].set_visible(False)
-
-            # Use frame index in filename to ensure unique names
-            plt.savefig(
-                f"plots/wing_pressure_profile_{iterI}_{label}.png",
-                dpi=200,
-                bbox_inches="tight",
-            )
-            plt.close()
-
-            # Clean up
-            Delete(plotOnSortedLines1)
-            Delete(slice1)
+        with span("UpdatePipeline", time=time_value):
+            UpdatePipeline(time_value, mergeBlocks1)
+        process_time_step(time_value)
 
 else:
     time_value = args.time_step * 0.0001
-    if time_value < 1.0:
-        iterI = "%04d" % int(time_value * 10000)
-    else:
-        iterI = "Final"
     animationScene1.AnimationTime = time_value
-    UpdatePipeline()
-
-    # Loop through each spanwise location
-    for span_loc, chord, label in zip(span_locations, chords, span_labels):
-        # create a new 'Slice'
-        slice1 = Slice(registrationName="Slice1", Input=paraviewfoam)
-
-        # Properties modified on slice1.SliceType
-        slice1.SliceType.Origin = [0.0, 0.0, span_loc]
-        slice1.SliceType.Normal = [0.0, 0.0, 1.0]
-
-        # create a new 'Plot On Sorted Lines'
-        plotOnSortedLines1 = PlotOnSortedLines(registrationName="PlotOnSortedLines1", Input=slice1)
-
-        # Fetch and plot for specific frame (same code as in loop)
-        multi_block_data = servermanager.Fetch(plotOnSortedLines1)
-
-        # Navigate through the nested structure (ParaView 5.13)
-        # For 2D airfoil: MultiBlock -> Block(0) -> Block(0) -> Block(0) to get to actual polydata
-        block0 = multi_block_data.GetBlock(0)
-        block1 = block0.GetBlock(0)
-        data = block1.GetBlock(0)
-
-        point_data = data.GetPointData()
-        n_points = data.GetNumberOfPoints()
-        points = np.array([data.GetPoint(i) for i in range(n_points)])
-        x = points[:, 0]
-        y = points[:, 1]
-
-        # Normalize by chord
-        x = x / chord
-        y = y / chord
-
-        p_array = point_data.GetArray("p")
-        p = np.array([p_array.GetValue(i) for i in range(p_array.GetNumberOfTuples())])
-        cp = (p - 101325.0) / coeff
-
-        fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(10, 8), gridspec_kw={"height_ratios": [2, 1], "hspace": 0.05})
-        ax1.set_title(
-            f"Pressure profile on the airfoil. Iteration = {iterI}. Mach = {args.mach_number}. Span = {label}",
-            fontsize=18,
-            fontweight="bold",
-        )
-        ax1.plot(x, cp, "-k", linewidth=2)
-        ax1.set_ylim([-2, 2])
-        ax1.invert_yaxis()
-        ax1.set_ylabel("$C_p$", fontsize=16, fontweight="bold")
-        ax1.tick_params(axis="x", labelsize=15)
-        ax1.tick_params(axis="y", labelsize=15)
-        ax1.spines["bottom"].set_visible(False)
-        ax1.set_xticks([])
-        ax1.spines["top"].set_visible(False)
-        ax1.spines["right"].set_visible(False)
-        ax2.plot(x, y, "-k", linewidth=2)
-        ax2.set_xlabel("x/c", fontsize=16, fontweight="bold")
-        ax2.set_ylabel("y/c", fontsize=16, fontweight="bold")
-        ax2.tick_params(axis="x", labelsize=15)
-        ax2.tick_params(axis="y", labelsize=15)
-        ax2.set_aspect("equal", adjustable="datalim")
-        ax2.set_xlim([-0.05, 1.05])
-        ax2.spines["top"].set_visible(False)
-        ax2.spines["right"].set_visible(False)
-        plt.savefig(
-            f"plots/wing_pressure_profile_{iterI}_{label}.png",
-            dpi=200,
-            bbox_inches="tight",
-        )
-        plt.close()
-
-        # Clean up
-        Delete(plotOnSortedLines1)
-        Delete(slice1)
+    with span("UpdatePipeline", time=time_value):
+        UpdatePipeline(time_value, mergeBlocks1)
+    process_time_step(time_value)
@@ -1,7 +1,11 @@
 from trame.app import get_server
 from trame.ui.vuetify3 import SinglePageLayout
-from trame.widgets import vtk, vuetify3
-from vtkmodules.vtkIOXML import vtkXMLPolyDataReader
+from trame.widgets import html, vtk, vuetify3
+from vtkmodules.util.numpy_support import numpy_to_vtk, numpy_to_vtkIdTypeArray
+from vtkmodules.vtkCommonCore import vtkPoints
+from vtkmodules.vtkCommonDataModel import vtkCellArray, vtkPolyData
+from vtkmodules.vtkFiltersCore import vtkFeatureEdges, vtkQuadricDecimation, vtkTriangleFilter
+from vtkmodules.vtkIOXML import vtkXMLPolyDataReader, vtkXMLPolyDataWriter
 from vtkmodules.vtkIOGeometry import vtkSTLReader
 from vtkmodules.vtkRenderingCore import (
     vtkRenderer,
@@ -13,43 +17,74 @@ from vtkmodules.vtkRenderingCore import (
 from vtkmodules.vtkInteractionStyle import vtkInteractorStyleTrackballCamera
 import vtkmodules.vtkRenderingOpenGL2  # noqa
 import argparse
+import asyncio
+import hashlib
+import json
 import os
+import sys
+import traceback
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import foam_reader
 
 parser = argparse.ArgumentParser()
-parser.add_argument("-mesh_file", help="mesh file to load (.stl or .vtp)", type=str, default="VTK/wings_0/boundary.vtp")
+parser.add_argument(
+    "-mesh_file",
+    help="mesh file to load (.stl or .vtp), or paraview.foam for the surface flow fields of the wing",
+    type=str,
+    default="VTK/wings_0/boundary.vtp",
+)
 parser.add_argument("-focal_x", help="x for focal point", type=float, default=0.5)
 parser.add_argument("-focal_z", help="z for focal point", type=float, default=1.5)
+parser.add_argument(
+    "-mach_number", help="mach number to compute Cp of the surface flow fields", type=float, default=0.1
+)
+parser.add_argument("-port", help="port of the viewer", type=int, default=8002)
+parser.add_argument(
+    "-control_file",
+    help="a JSON file with mesh_file, focal_x, focal_z, mach_number, and version. The viewer loads the dataset of the file "
+    "and swaps to a new dataset whenever the version changes, without restarting. Overrides the arguments above",
+    type=str,
+    default="",
+)
+parser.add_argument(
+    "-lod_reductions",
+    help="target reductions (fraction of the triangles removed) of the decimated levels of detail",
+    nargs="+",
+    type=float,
+    default=[0.95, 0.75],
+)
+parser.add_argument("-lod_min_cells", help="meshes with fewer cells are not decimated", type=int, default=50000)
+parser.add_argument(
+    "-remote_render_cells",
+    help="meshes with more cells are rendered on the server and streamed as images instead of sent to the browser",
+    type=int,
+    default=2000000,
+)
 args = parser.parse_args()
 
-mesh_file = args.mesh_file
-focal_x = args.focal_x
 focal_y = 0.0
-focal_z = args.focal_z
-port = 8002
-
-# VTK Pipeline - detect file type and use appropriate reader
-file_ext = os.path.splitext(mesh_file)[1].lower()
-if file_ext == ".stl":
-    reader = vtkSTLReader()
-    reader.SetFileName(mesh_file)
-elif file_ext == ".vtp":
-    reader = vtkXMLPolyDataReader()
-    reader.SetFileName(mesh_file)
-else:
-    raise ValueError(f"Unsupported file format: {file_ext}. Supported formats: .stl, .vtp")
+port = args.port
+
+# the levels of detail are computed once per mesh file and cached in the render cache
+lod_cache_dir = "plots/render_cache"
+
+# one reader per file type, the source of the current dataset is deep copied from it
+readers = {".stl": vtkSTLReader(), ".vtp": vtkXMLPolyDataReader()}
+
+# the current dataset: its file, fingerprint, and the levels of detail loaded so far (name -> vtkPolyData).
+# Surface flow fields also keep their float32 arrays (field -> one array per time step) and color ranges
+dataset = {"file": "", "fingerprint": "", "levels": {}, "arrays": {}, "ranges": {}}
+
+C0 = 347.2
+rho0 = 1.1768
+p0 = 101325.0
 
-reader.Update()
 mapper = vtkDataSetMapper()
-mapper.SetInputConnection(reader.GetOutputPort())
 actor = vtkActor()
 actor.SetMapper(mapper)
 
-# For STL, show surface only; for VTP mesh, show edges
-if file_ext == ".stl":
-    actor.GetProperty().EdgeVisibilityOff()
-else:
-    actor.GetProperty().EdgeVisibilityOn()
-
 renderer = vtkRenderer()
 renderer.AddActor(actor)
 renderer.GetActiveCamera().ParallelProjectionOn()
@@ -64,35 +99,389 @@ renderWindowInteractor.SetRenderWindow(renderWindow)
 interactorStyle = vtkInteractorStyleTrackballCamera()
 renderWindowInteractor.SetInteractorStyle(interactorStyle)
 
-# Set up camera for isometric view
-renderer.ResetCamera()
-camera = renderer.GetActiveCamera()
+# Trame server
+server = get_server()
+state, ctrl = server.state, server.controller
 
-# Set focal point based on mean_chord and span
-camera.SetFocalPoint(focal_x, focal_y, focal_z)
 
-# Set up isometric view (45 degrees from x and y, 35.264 degrees elevation for true isometric)
-camera.Azimuth(-45)
-camera.Elevation(35.264)
+def file_fingerprint(mesh_file):
+    """Hash the path, size, and modification time of a mesh file and the decimation settings"""
+    stat = os.stat(mesh_file)
+    key = f"{os.path.abspath(mesh_file)}:{stat.st_size}:{stat.st_mtime_ns}:{args.lod_reductions}"
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
 
-renderWindow.Render()
-camera.SetClippingRange(0.1, 1000.0)
 
-# Trame GUI
-server = get_server()
-ctrl = server.controller
+def compute_level(name):
+    """Compute a level of detail from the full resolution surface: a decimated surface or the feature edges"""
+    full = dataset["levels"]["full"]
+    if name == "edges":
+        # the wireframe level only keeps the boundary, feature, and non-manifold edges
+        edges = vtkFeatureEdges()
+        edges.SetInputData(full)
+        edges.BoundaryEdgesOn()
+        edges.FeatureEdgesOn()
+        edges.SetFeatureAngle(30.0)
+        edges.NonManifoldEdgesOn()
+        edges.ManifoldEdgesOff()
+        edges.ColoringOff()
+        edges.Update()
+        return edges.GetOutput()
+
+    triangles = vtkTriangleFilter()
+    triangles.SetInputData(full)
+    decimation = vtkQuadricDecimation()
+    decimation.SetInputConnection(triangles.GetOutputPort())
+    decimation.SetTargetReduction(1.0 - float(name.rstrip("%")) / 100.0)
+    decimation.VolumePreservationOn()
+    decimation.Update()
+    return decimation.GetOutput()
+
+
+def get_level(name):
+    """Return a level of detail of the current dataset, reading it from the cache or computing and caching it"""
+    if name in dataset["levels"]:
+        return dataset["levels"][name]
+
+    cache_file = f"{lod_cache_dir}/lod_{dataset['fingerprint']}_{name.rstrip('%')}.vtp"
+    level = vtkPolyData()
+    if os.path.exists(cache_file):
+        reader = vtkXMLPolyDataReader()
+        reader.SetFileName(cache_file)
+        reader.Update()
+        level.ShallowCopy(reader.GetOutput())
+    else:
+        level.ShallowCopy(compute_level(name))
+        os.makedirs(lod_cache_dir, exist_ok=True)
+        writer = vtkXMLPolyDataWriter()
+        writer.SetInputData(level)
+        writer.SetFileName(f"{cache_file}.{os.getpid()}.tmp")
+        writer.SetDataModeToAppended()
+        writer.Write()
+        os.replace(f"{cache_file}.{os.getpid()}.tmp", cache_file)
+    dataset["levels"][name] = level
+    return level
+
+
+def load_surface_solution(case_path, mach_number):
+    """
+    Build the wing patch surface of the OpenFOAM case with foam_reader and read its flow fields at all
+    time steps as float32 arrays: p, Cp, the magnitude of U, and nut (if the case has it). An optimization
+    moves the mesh, so the surface points are also read at the time steps that have polyMesh/points
+
+    Outputs:
+        The surface polydata, the iteration labels, the arrays (field -> list of arrays, one per time step),
+        and the surface points of each time step (the same array for the time steps that do not move the mesh)
+    """
+
+    time_names = [t for t in foam_reader.list_times(case_path) if float(t) > 0.0]
+    if not time_names:
+        raise ValueError("No flow field found. Run a cfd simulation or optimization first")
+    topology = foam_reader.read_patch_topology(case_path, ["wing"], time_names, ["p", "U", "nut"])
+
+    # the points used by the patch faces, concatenated over the processors, and the faces in the vtk format
+    used_points = []
+    connectivity = []
+    offsets = [np.zeros(1, dtype=np.int64)]
+    n_points = 0
+    for entry in topology:
+        for name in entry["patches"]:
+            face_offsets, labels = entry["faces"][name]
+            used, local = np.unique(labels, return_inverse=True)
+            used_points.append(used)
+            connectivity.append(local.reshape(-1) + n_points)
+            offsets.append(face_offsets[1:] + offsets[-1][-1])
+            n_points += len(used)
+
+    def surface_points(time_name):
+        """Return the points used by the patch faces at one time (constant for the baseline mesh)"""
+        used = iter(used_points)
+        points = [
+            entry_points[next(used)]
+            for entry, entry_points in zip(topology, foam_reader.read_patch_points(topology, time_name))
+            for name in entry["patches"]
+        ]
+        return np.concatenate(points).astype(np.float32)
+
+    def moves_mesh(time_name):
+        return any(
+            os.path.exists(os.path.join(entry["case_dir"], time_name, "polyMesh", "points" + ext))
+            for entry in topology
+            for ext in ["", ".gz"]
+        )
+
+    baseline_points = surface_points("constant")
+    time_points = [surface_points(t) if moves_mesh(t) else baseline_points for t in time_names]
+
+    vtk_points = vtkPoints()
+    vtk_points.SetData(numpy_to_vtk(time_points[-1], deep=True))
+    cells = vtkCellArray()
+    cells.SetData(
+        numpy_to_vtkIdTypeArray(np.concatenate(offsets).astype(np.int64), deep=True),
+        numpy_to_vtkIdTypeArray(np.concatenate(connectivity).astype(np.int64), deep=True),
+    )
+    surface = vtkPolyData()
+    surface.SetPoints(vtk_points)
+    surface.SetPolys(cells)
+
+    U0 = mach_number * C0
+    coeff = 0.5 * rho0 * U0 * U0
+    arrays = {"p": [], "Cp": [], "U": [], "nut": []}
+    for time_name in time_names:
+        p = foam_reader.read_patch_values(topology, time_name, "p")
+        arrays["p"].append(p.astype(np.float32))
+        arrays["Cp"].append(((p - p0) / coeff).astype(np.float32))
+        U = foam_reader.read_patch_values(topology, time_name, "U", "vector")
+        arrays["U"].append(np.linalg.norm(U, axis=1).astype(np.float32))
+        try:
+            arrays["nut"].append(foam_reader.read_patch_values(topology, time_name, "nut").astype(np.float32))
+        except FileNotFoundError:
+            pass
+    arrays = {field: values for field, values in arrays.items() if len(values) == len(time_names)}
+
+    iterations = ["%04d" % round(float(t) * 10000) if float(t) < 1.0 else "Final" for t in time_names]
+    return surface, iterations, arrays, time_points
+
+
+def show_surface_field(field, time_index):
+    """
+    Color the surface by a field at one time step. Only the scalar array is swapped, and the points if the
+    optimization moved the surface at this time step; the faces are kept
+    """
+    values = dataset["arrays"][field][time_index]
+    full = dataset["levels"]["full"]
+    # numpy_to_vtk does not copy the values (the array keeps a reference to them)
+    points = dataset["points"][time_index]
+    if points is not dataset["shown_points"]:
+        full.GetPoints().SetData(numpy_to_vtk(points, deep=False))
+        full.GetPoints().Modified()
+        dataset["shown_points"] = points
+    array = numpy_to_vtk(values, deep=False)
+    array.SetName(field)
+    full.GetCellData().SetScalars(array)
+    mapper.SetScalarModeToUseCellData()
+    mapper.SetScalarRange(*dataset["ranges"][field])
+    mapper.ScalarVisibilityOn()
+
 
+def show_level(name):
+    """Connect a level of detail to the actor"""
+    mapper.SetInputData(get_level(name))
+
+    # show the mesh edges of the full resolution .vtp mesh only, the decimated triangles are not mesh cells
+    if name == "full" and dataset["file"].lower().endswith(".vtp"):
+        actor.GetProperty().EdgeVisibilityOn()
+    else:
+        actor.GetProperty().EdgeVisibilityOff()
+
+
+def load_dataset(mesh_file, focal_x, focal_z, mach_number=0.1):
+    """
+    Load a .stl or .vtp file, or the surface flow fields of all time steps for paraview.foam, and set up
+    the isometric camera around the focal point. Large meshes start with the coarsest level of detail
+    (the finer ones are computed when selected), and meshes with more than remote_render_cells cells are
+    rendered on the server
+    """
+
+    # VTK Pipeline - detect file type and use appropriate reader
+    file_ext = os.path.splitext(mesh_file)[1].lower()
+    iterations = []
+    arrays = {}
+    points = []
+    if file_ext == ".foam":
+        full, iterations, arrays, points = load_surface_solution(
+            os.path.dirname(os.path.abspath(mesh_file)), mach_number
+        )
+    elif file_ext in readers:
+        reader = readers[file_ext]
+        reader.SetFileName(mesh_file)
+        reader.Modified()
+        reader.Update()
+        full = vtkPolyData()
+        full.DeepCopy(reader.GetOutput())
+    else:
+        raise ValueError(f"Unsupported file format: {file_ext}. Supported formats: .stl, .vtp, .foam")
+
+    # the same color range for all time steps, so the colors can be compared when scrubbing the time steps
+    ranges = {field: (min(v.min() for v in values), max(v.max() for v in values)) for field, values in arrays.items()}
+    dataset.update(
+        {
+            "file": mesh_file,
+            "fingerprint": file_fingerprint(mesh_file),
+            "levels": {"full": full},
+            "arrays": arrays,
+            "ranges": ranges,
+            "points": points,
+            "shown_points": points[-1] if points else None,
+        }
+    )
+
+    n_cells = full.GetNumberOfCells()
+    levels = ["full", "edges"]
+    if arrays:
+        # the decimated levels do not keep the face arrays
+        levels = ["full"]
+    elif n_cells >= args.lod_min_cells:
+        levels = [f"{(1.0 - r) * 100:g}%" for r in sorted(args.lod_reductions, reverse=True)] + levels
+    remote = n_cells > args.remote_render_cells
+
+    # server-side rendering does not send the geometry to the browser, so it can show the full resolution
+    level = "full" if remote else levels[0]
+    show_level(level)
+    if arrays:
+        field = "Cp" if "Cp" in arrays else next(iter(arrays))
+        show_surface_field(field, len(iterations) - 1)
+    else:
+        field = ""
+        mapper.SetScalarModeToDefault()
+    with state:
+        state.lod_levels = levels
+        state.lod_level = level
+        state.remote = remote
+        state.n_cells = n_cells
+        state.surface = bool(arrays)
+        state.fields = list(arrays)
+        state.field = field
+        state.iterations = iterations
+        state.time_index = max(len(iterations) - 1, 0)
+
+    # Set up camera for isometric view, starting from the default orientation so swaps do not accumulate
+    camera = renderer.GetActiveCamera()
+    camera.SetPosition(0.0, 0.0, 1.0)
+    camera.SetFocalPoint(0.0, 0.0, 0.0)
+    camera.SetViewUp(0.0, 1.0, 0.0)
+    renderer.ResetCamera()
+
+    # Set focal point based on mean_chord and span
+    camera.SetFocalPoint(focal_x, focal_y, focal_z)
+
+    # Set up isometric view (45 degrees from x and y, 35.264 degrees elevation for true isometric)
+    camera.Azimuth(-45)
+    camera.Elevation(35.264)
+
+    renderWindow.Render()
+    camera.SetClippingRange(0.1, 1000.0)
+
+
+def read_control_file():
+    """Return the content of the control file, or None if it is missing or being written"""
+    try:
+        with open(args.control_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_ready_file(version):
+    """Tell the MCP server that the dataset of this version is loaded and served"""
+    with open(args.control_file + ".ready", "w") as f:
+        f.write(str(version))
+
+
+control = read_control_file() if args.control_file else None
+if control is not None:
+    load_dataset(control["mesh_file"], control["focal_x"], control["focal_z"], control.get("mach_number", 0.1))
+else:
+    load_dataset(args.mesh_file, args.focal_x, args.focal_z, args.mach_number)
+
+
+@state.change("lod_level")
+def on_lod_level(lod_level, **kwargs):
+    """Refine (or coarsen) on demand: show the selected level of detail"""
+    show_level(lod_level)
+    ctrl.view_update()
+
+
+@state.change("field", "time_index")
+def on_surface_field(field, time_index, **kwargs):
+    """Scrub the time steps or change the field: swap the scalar array on the already uploaded surface"""
+    if state.surface and field in dataset["arrays"]:
+        show_surface_field(field, int(time_index))
+        ctrl.view_update()
+
+
+# Trame GUI
 with SinglePageLayout(server) as layout:
     layout.title.set_text("DAFoam Mesh Viewer")
 
     with layout.toolbar:
+        vuetify3.VSelect(
+            v_model=("lod_level",),
+            items=("lod_levels",),
+            label="Level of detail",
+            density="compact",
+            hide_details=True,
+            style="max-width: 200px",
+        )
+        with html.Div(v_if="surface", classes="d-flex align-center", style="min-width: 500px"):
+            vuetify3.VSelect(
+                v_model=("field",),
+                items=("fields",),
+                label="Field",
+                density="compact",
+                hide_details=True,
+                style="max-width: 120px",
+            )
+            vuetify3.VSlider(
+                v_model=("time_index",),
+                min=0,
+                max=("iterations.length - 1",),
+                step=1,
+                density="compact",
+                hide_details=True,
+                classes="mx-4",
+            )
+            html.Span("Iteration {{ iterations[time_index] }}", classes="text-no-wrap")
         vuetify3.VBtn("Reset View", click=ctrl.view_reset_camera)
 
     with layout.content:
         with vuetify3.VContainer(fluid=True, classes="pa-0 fill-height"):
-            view = vtk.VtkLocalView(renderWindow)
-            ctrl.view_update = view.update
-            ctrl.view_reset_camera = view.reset_camera
+            # large meshes are rendered on the server, the others are sent to the browser and rendered there
+            remote_view = vtk.VtkRemoteView(renderWindow, v_if="remote")
+            local_view = vtk.VtkLocalView(renderWindow, v_else=True)
+
+
+@ctrl.set("view_update")
+def view_update():
+    local_view.update()
+    remote_view.update()
+
+
+@ctrl.set("view_reset_camera")
+def view_reset_camera():
+    local_view.reset_camera()
+    remote_view.reset_camera()
+
+
+async def watch_control_file(version):
+    """
+    Swap the dataset shown to all connected sessions whenever the control file gets a new version. A dataset
+    that fails to load (e.g., a time directory that is still being written) is retried, so the viewer keeps
+    polling; the error is logged once per version
+    """
+    failed_version = None
+    while True:
+        await asyncio.sleep(0.5)
+        control = read_control_file()
+        if control is None or control["version"] == version:
+            continue
+        try:
+            load_dataset(control["mesh_file"], control["focal_x"], control["focal_z"], control.get("mach_number", 0.1))
+        except Exception:
+            if control["version"] != failed_version:
+                print(f"Failed to load {control['mesh_file']} (version {control['version']}):", flush=True)
+                traceback.print_exc()
+                failed_version = control["version"]
+            continue
+        ctrl.view_update()
+        version = control["version"]
+        write_ready_file(version)
+
+
+@ctrl.add("on_server_ready")
+def on_server_ready(**kwargs):
+    if control is not None:
+        write_ready_file(control["version"])
+        asyncio.create_task(watch_control_file(control["version"]))
 
 
-server.start(host="0.0.0.0", port=port)
+server.start(host="0.0.0.0", port=port, open_browser=False)